@@ -0,0 +1,178 @@
+import os
+import socket
+import stat as stat_module
+import struct
+import time
+
+ADB_HOST = "127.0.0.1"
+ADB_PORT = int(os.environ.get("ANDROID_ADB_SERVER_PORT", 5037))
+SYNC_CHUNK_SIZE = 64 * 1024
+RECV_BUFFER_SIZE = 256 * 1024
+
+
+class AdbError(Exception):
+    pass
+
+
+def _read_exact(sock, n):
+    buf = bytearray()
+    while len(buf) < n:
+        data = sock.recv(n - len(buf))
+        if not data:
+            raise AdbError(f"Connection closed by adb server ({len(buf)}/{n} bytes read)")
+        buf += data
+    return bytes(buf)
+
+
+def _send_request(sock, payload):
+    data = payload.encode("utf-8")
+    sock.sendall(b"%04x" % len(data) + data)
+
+
+def _read_status(sock, request):
+    status = _read_exact(sock, 4)
+    if status == b"OKAY":
+        return
+    if status == b"FAIL":
+        length = int(_read_exact(sock, 4), 16)
+        raise AdbError(f"{request}: {_read_exact(sock, length).decode('utf-8', errors='replace')}")
+    raise AdbError(f"{request}: unexpected response {status!r}")
+
+
+def _sync_request(sock, command, data=b""):
+    sock.sendall(command + struct.pack("<I", len(data)) + data)
+
+
+def _sync_read_header(sock):
+    header = _read_exact(sock, 8)
+    return header[:4], struct.unpack("<I", header[4:])[0]
+
+
+class AdbClient:
+    """Talks the adb host protocol to a running adb server instead of spawning the adb binary."""
+
+    def __init__(self, serial=None, host=ADB_HOST, port=ADB_PORT, timeout=None):
+        self.serial = serial
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+
+    def _connect(self):
+        try:
+            sock = socket.create_connection((self.host, self.port), timeout=self.timeout)
+        except OSError as e:
+            raise AdbError(f"Could not connect to adb server at {self.host}:{self.port}: {e}")
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        return sock
+
+    def _host_query(self, request):
+        with self._connect() as sock:
+            _send_request(sock, request)
+            _read_status(sock, request)
+            length = int(_read_exact(sock, 4), 16)
+            return _read_exact(sock, length).decode("utf-8", errors="replace")
+
+    def _open_service(self, service):
+        sock = self._connect()
+        try:
+            transport = f"host:transport:{self.serial}" if self.serial else "host:transport-any"
+            _send_request(sock, transport)
+            _read_status(sock, transport)
+            _send_request(sock, service)
+            _read_status(sock, service)
+        except Exception:
+            sock.close()
+            raise
+        return sock
+
+    def version(self):
+        return int(self._host_query("host:version"), 16)
+
+    def devices(self):
+        devices = []
+        for line in self._host_query("host:devices").splitlines():
+            parts = line.split()
+            if len(parts) >= 2:
+                devices.append((parts[0], parts[1]))
+        return devices
+
+    def shell_stream(self, command):
+        with self._open_service(f"shell:{command}") as sock:
+            while True:
+                data = sock.recv(RECV_BUFFER_SIZE)
+                if not data:
+                    return
+                yield data
+
+    def shell(self, command):
+        return b"".join(self.shell_stream(command)).decode("utf-8", errors="replace")
+
+    def stat(self, remote_path):
+        with self._open_service("sync:") as sock:
+            _sync_request(sock, b"STAT", remote_path.encode("utf-8"))
+            reply = _read_exact(sock, 16)
+            if reply[:4] != b"STAT":
+                raise AdbError(f"STAT {remote_path}: unexpected response {reply[:4]!r}")
+            mode, size, mtime = struct.unpack("<III", reply[4:])
+            _sync_request(sock, b"QUIT")
+        return mode, size, mtime
+
+    def pull_stream(self, remote_path):
+        with self._open_service("sync:") as sock:
+            _sync_request(sock, b"RECV", remote_path.encode("utf-8"))
+            while True:
+                command, length = _sync_read_header(sock)
+                if command == b"DATA":
+                    remaining = length
+                    while remaining:
+                        data = sock.recv(min(remaining, RECV_BUFFER_SIZE))
+                        if not data:
+                            raise AdbError(f"RECV {remote_path}: connection closed mid-chunk")
+                        remaining -= len(data)
+                        yield data
+                elif command == b"DONE":
+                    break
+                elif command == b"FAIL":
+                    raise AdbError(f"RECV {remote_path}: {_read_exact(sock, length).decode('utf-8', errors='replace')}")
+                else:
+                    raise AdbError(f"RECV {remote_path}: unexpected response {command!r}")
+            _sync_request(sock, b"QUIT")
+
+    def pull(self, remote_path, local_path, digest=None):
+        size = 0
+        with open(local_path, "wb") as f:
+            for data in self.pull_stream(remote_path):
+                f.write(data)
+                if digest:
+                    digest.update(data)
+                size += len(data)
+        return size
+
+    def push_stream(self, chunks, remote_path, mode=0o644, mtime=None):
+        size = 0
+        with self._open_service("sync:") as sock:
+            _sync_request(sock, b"SEND", f"{remote_path},{stat_module.S_IFREG | mode}".encode("utf-8"))
+            for chunk in chunks:
+                for offset in range(0, len(chunk), SYNC_CHUNK_SIZE):
+                    part = chunk[offset:offset + SYNC_CHUNK_SIZE]
+                    _sync_request(sock, b"DATA", part)
+                    size += len(part)
+            sock.sendall(b"DONE" + struct.pack("<I", int(mtime if mtime is not None else time.time())))
+            command, length = _sync_read_header(sock)
+            if command == b"FAIL":
+                raise AdbError(f"SEND {remote_path}: {_read_exact(sock, length).decode('utf-8', errors='replace')}")
+            if command != b"OKAY":
+                raise AdbError(f"SEND {remote_path}: unexpected response {command!r}")
+            _sync_request(sock, b"QUIT")
+        return size
+
+    def push(self, local_path, remote_path, mode=0o644):
+        def chunks(f):
+            while True:
+                data = f.read(SYNC_CHUNK_SIZE)
+                if not data:
+                    return
+                yield data
+
+        with open(local_path, "rb") as f:
+            return self.push_stream(chunks(f), remote_path, mode=mode, mtime=os.path.getmtime(local_path))
@@ -0,0 +1,363 @@
+#!/usr/bin/env python3
+import argparse
+import hashlib
+import json
+import os
+import random
+import socketserver
+import statistics
+import struct
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+import adb_client
+import device_commands
+
+SERVER_VERSION = 41
+PATTERN = random.Random(0).randbytes(adb_client.SYNC_CHUNK_SIZE)
+
+APK_PATH = "/data/app/com.whatsapp-1.apk"
+APK_SIZE = 32 * 1024 * 1024
+VERSION_OUTPUT = "    versionName=2.24.1.6\n"
+# Outputs of device_commands.METADATA_QUERIES on a typical device
+METADATA_OUTPUTS = ["19\n", f"package:{APK_PATH}\n", VERSION_OUTPUT, "/storage/emulated/legacy\n"]
+
+# Replayed when no recording is given: what whatsapp.py asks a typical device, keyed by the exact commands it sends
+DEFAULT_RECORDING = {
+    "devices": ["emulator-5554"],
+    "latency_ms": 0,
+    "shell": {
+        **dict(zip(device_commands.METADATA_QUERIES, METADATA_OUTPUTS)),
+        device_commands.METADATA_SCRIPT: f"{device_commands.METADATA_MARKER}\n".join(METADATA_OUTPUTS),
+        # SDK 19 has no sha256sum, the APK is matched by the size from ls -l
+        device_commands.file_info_query(APK_PATH):
+            f"-rw-r--r-- system   system   {APK_SIZE} 2024-01-01 00:00 com.whatsapp-1.apk\n",
+    },
+    "files": {
+        APK_PATH: {"size": APK_SIZE},
+    },
+}
+
+# Run by replay_pipeline in a whatsapp.py process pointed at the fake server: the steps that only need shell and
+# pull, which is all ADB_CLIENT="native" covers (install and backup always spawn the adb binary)
+REPLAY_STEPS = ("metadata", "backup_apk")
+REPLAY_SCRIPT = """
+import json
+import whatsapp
+steps = dict(whatsapp.PIPELINE)
+for name in {steps!r}:
+    whatsapp.set_stage(name)
+    whatsapp.complete_step(name, steps[name]())
+whatsapp.close_log()
+print(json.dumps({{"metadata": whatsapp.metadata, "steps": whatsapp.checkpoint["steps"]}}))
+"""
+
+
+def load_recording(path):
+    with open(path, encoding="utf-8") as f:
+        recording = json.load(f)
+    base = os.path.dirname(os.path.abspath(path))
+    for entry in recording.get("files", {}).values():
+        if "path" in entry:
+            entry["path"] = os.path.join(base, entry["path"])
+    return recording
+
+
+def record(out_path, commands=None, serial=None, files=None):
+    """Capture shell outputs (by default of the commands whatsapp.py sends) and optionally pull files from a real
+    device into a replayable recording."""
+    if commands is None:
+        commands = [*device_commands.METADATA_QUERIES, device_commands.METADATA_SCRIPT]
+    client = adb_client.AdbClient(serial)
+    recording = {"devices": [serial or client.devices()[0][0]], "latency_ms": 0, "shell": {}, "files": {}}
+    for command in commands:
+        recording["shell"][command] = client.shell(command)
+    base = os.path.dirname(os.path.abspath(out_path))
+    for i, remote_path in enumerate(files or []):
+        local_name = f"{os.path.splitext(os.path.basename(out_path))[0]}-file{i}.bin"
+        client.pull(remote_path, os.path.join(base, local_name))
+        recording["files"][remote_path] = {"path": local_name}
+    with open(out_path, "w", encoding="utf-8") as f:
+        json.dump(recording, f, indent=2)
+    return recording
+
+
+def _file_chunks(entry):
+    if "path" in entry:
+        with open(entry["path"], "rb") as f:
+            while True:
+                data = f.read(adb_client.SYNC_CHUNK_SIZE)
+                if not data:
+                    return
+                yield data
+    elif "text" in entry:
+        yield entry["text"].encode("utf-8")
+    else:
+        remaining = entry["size"]
+        while remaining:
+            data = PATTERN[:min(remaining, len(PATTERN))]
+            remaining -= len(data)
+            yield data
+
+
+class FakeAdbHandler(socketserver.BaseRequestHandler):
+    def _delay(self):
+        latency = self.server.recording.get("latency_ms", 0)
+        if latency:
+            time.sleep(latency / 1000)
+
+    def _read_request(self):
+        length = int(adb_client._read_exact(self.request, 4), 16)
+        return adb_client._read_exact(self.request, length).decode("utf-8")
+
+    def _okay(self, payload=None):
+        if payload is None:
+            self.request.sendall(b"OKAY")
+        else:
+            data = payload.encode("utf-8")
+            self.request.sendall(b"OKAY" + b"%04x" % len(data) + data)
+
+    def _fail(self, message):
+        data = message.encode("utf-8")
+        self.request.sendall(b"FAIL" + b"%04x" % len(data) + data)
+
+    def handle(self):
+        try:
+            self._handle()
+        except (adb_client.AdbError, ConnectionError):
+            pass
+
+    def _handle(self):
+        recording = self.server.recording
+        devices = recording.get("devices", [])
+        while True:
+            request = self._read_request()
+            self._delay()
+            if request == "host:version":
+                return self._okay(f"{SERVER_VERSION:04x}")
+            if request in ("host:devices", "host:devices-l"):
+                return self._okay("".join(f"{serial}\tdevice\n" for serial in devices))
+            if request == "host:features" or request.endswith(":features"):
+                return self._okay("")
+            if request.startswith(("host:transport", "host:tport")):
+                serial = None
+                for prefix in ("host:tport:serial:", "host:transport:"):
+                    if request.startswith(prefix):
+                        serial = request[len(prefix):]
+                if serial and serial not in devices:
+                    return self._fail(f"device '{serial}' not found")
+                if not devices:
+                    return self._fail("no devices/emulators found")
+                self._okay()
+                if request.startswith("host:tport"):
+                    self.request.sendall(struct.pack("<Q", 1))
+                continue
+            if request.startswith("shell:"):
+                return self._shell(request[len("shell:"):])
+            if request == "sync:":
+                self._okay()
+                return self._sync()
+            return self._fail(f"unknown service {request}")
+
+    def _shell(self, command):
+        output = self.server.recording.get("shell", {}).get(command)
+        if output is None:
+            output = f"/system/bin/sh: {command.split()[0] if command else ''}: not found\n"
+        self._okay()
+        self.request.sendall(output.encode("utf-8"))
+
+    def _sync(self):
+        files = self.server.recording.setdefault("files", {})
+        while True:
+            command, length = adb_client._sync_read_header(self.request)
+            data = adb_client._read_exact(self.request, length) if command in (b"STAT", b"RECV", b"SEND") else b""
+            self._delay()
+            if command == b"QUIT":
+                return
+            path = data.decode("utf-8")
+            if command == b"STAT":
+                entry = files.get(path)
+                size = entry.get("size", 0) if entry else 0
+                if entry and "path" in entry:
+                    size = os.path.getsize(entry["path"])
+                mode = 0o100644 if entry else 0
+                self.request.sendall(b"STAT" + struct.pack("<III", mode, size, int(time.time()) if entry else 0))
+            elif command == b"RECV":
+                entry = files.get(path)
+                if entry is None:
+                    msg = b"No such file or directory"
+                    self.request.sendall(b"FAIL" + struct.pack("<I", len(msg)) + msg)
+                    continue
+                for chunk in _file_chunks(entry):
+                    self.request.sendall(b"DATA" + struct.pack("<I", len(chunk)) + chunk)
+                self.request.sendall(b"DONE" + struct.pack("<I", 0))
+            elif command == b"SEND":
+                remote_path = path.rsplit(",", 1)[0]
+                size = 0
+                while True:
+                    part, part_length = adb_client._sync_read_header(self.request)
+                    if part == b"DONE":
+                        break
+                    remaining = part_length
+                    while remaining:
+                        chunk = self.request.recv(min(remaining, adb_client.RECV_BUFFER_SIZE))
+                        if not chunk:
+                            return
+                        remaining -= len(chunk)
+                    size += part_length
+                # Pushed content is discarded, only its size is kept so STAT/RECV see it afterwards
+                files[remote_path] = {"size": size}
+                self.request.sendall(b"OKAY" + struct.pack("<I", 0))
+            else:
+                msg = f"unknown sync command {command!r}".encode("utf-8")
+                self.request.sendall(b"FAIL" + struct.pack("<I", len(msg)) + msg)
+                return
+
+
+class FakeAdbServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, recording=None, host="127.0.0.1", port=0):
+        self.recording = recording if recording is not None else json.loads(json.dumps(DEFAULT_RECORDING))
+        super().__init__((host, port), FakeAdbHandler)
+
+    @property
+    def port(self):
+        return self.server_address[1]
+
+    def start(self):
+        thread = threading.Thread(target=self.serve_forever, daemon=True)
+        thread.start()
+        return self
+
+
+def _percentile(values, pct):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+
+def _latency_stats(samples):
+    return {
+        "calls": len(samples),
+        "p50_ms": round(_percentile(samples, 50) * 1000, 3),
+        "p99_ms": round(_percentile(samples, 99) * 1000, 3),
+        "mean_ms": round(statistics.mean(samples) * 1000, 3),
+    }
+
+
+def _time_calls(fn, count):
+    samples = []
+    for _ in range(count):
+        start = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - start)
+    return _latency_stats(samples)
+
+
+def benchmark(server, size_mb=64, shell_calls=200, adb_path=None):
+    client = adb_client.AdbClient(port=server.port)
+    remote_apk = "/data/local/tmp/bench.bin"
+    server.recording["files"][remote_apk] = {"size": size_mb * 1024 * 1024}
+    results = {"server": f"127.0.0.1:{server.port}", "latency_ms": server.recording.get("latency_ms", 0)}
+
+    results["native_shell"] = _time_calls(lambda: client.shell("getprop ro.build.version.sdk"), shell_calls)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        local = os.path.join(tmp, "bench.bin")
+        start = time.perf_counter()
+        size = client.pull(remote_apk, local)
+        elapsed = time.perf_counter() - start
+        results["native_pull"] = {"bytes": size, "seconds": round(elapsed, 3), "mb_per_s": round(size / 1048576 / elapsed, 1)}
+
+        start = time.perf_counter()
+        size = client.push(local, "/data/local/tmp/bench-push.bin")
+        elapsed = time.perf_counter() - start
+        results["native_push"] = {"bytes": size, "seconds": round(elapsed, 3), "mb_per_s": round(size / 1048576 / elapsed, 1)}
+
+        if adb_path:
+            base = [adb_path, "-P", str(server.port)]
+            results["binary_shell"] = _time_calls(
+                lambda: subprocess.run(base + ["shell", "getprop ro.build.version.sdk"], capture_output=True, check=True),
+                max(1, shell_calls // 10))
+            start = time.perf_counter()
+            subprocess.run(base + ["pull", remote_apk, local], capture_output=True, check=True)
+            elapsed = time.perf_counter() - start
+            size = os.path.getsize(local)
+            results["binary_pull"] = {"bytes": size, "seconds": round(elapsed, 3), "mb_per_s": round(size / 1048576 / elapsed, 1)}
+
+    return results
+
+
+def replay_pipeline(server, work_dir):
+    """Run REPLAY_STEPS of whatsapp.py with ADB_CLIENT="native" against server, DATA_DIR under work_dir. Returns
+    the metadata it collected, its checkpointed steps and whether the pulled APK matches the served one."""
+    root = os.path.dirname(os.path.abspath(__file__))
+    config_dir = os.path.join(work_dir, "config")
+    os.makedirs(config_dir, exist_ok=True)
+    data_dir = os.path.join(work_dir, "data")
+    with open(os.path.join(config_dir, "whatsapp_config.py"), "w", encoding="utf-8") as f:
+        f.write(f"ADB_PATH = 'adb'\nABE_JAR_PATH = 'abe.jar'\nLEGACY_WHATSAPP_APK = 'legacy.apk'\n"
+                f"DATA_DIR = {data_dir!r}\nLOGS_DIR = {os.path.join(work_dir, 'logs')!r}\nADB_CLIENT = 'native'\n")
+    env = {**os.environ, "ANDROID_ADB_SERVER_PORT": str(server.port),
+           "PYTHONPATH": os.pathsep.join([config_dir, root])}
+    start = time.perf_counter()
+    result = subprocess.run([sys.executable, "-c", REPLAY_SCRIPT.format(steps=REPLAY_STEPS)], env=env, cwd=work_dir,
+                            capture_output=True, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(f"whatsapp.py replay failed:\n{result.stdout}{result.stderr}")
+    replay = json.loads(result.stdout.splitlines()[-1])
+    replay["seconds"] = round(time.perf_counter() - start, 3)
+
+    served = server.recording["files"].get(replay["metadata"].get("apk_path"))
+    expected = hashlib.sha256()
+    for chunk in _file_chunks(served or {"size": 0}):
+        expected.update(chunk)
+    pulled = replay["steps"].get("backup_apk", {}).get("artifacts", [])
+    replay["apk_matches"] = bool(served) and [a["sha256"] for a in pulled] == [expected.hexdigest()]
+    return replay
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Local stand-in adb server replaying recorded device responses")
+    parser.add_argument("recording", nargs="?", help="recording JSON (default: built-in WhatsApp device)")
+    parser.add_argument("--port", type=int, default=0, help="port to listen on (default: random free port)")
+    parser.add_argument("--latency-ms", type=float, help="simulated per-request device latency")
+    parser.add_argument("--bench", action="store_true", help="run the client benchmark against the server and exit")
+    parser.add_argument("--size-mb", type=int, default=64, help="file size for pull/push benchmarks")
+    parser.add_argument("--shell-calls", type=int, default=200, help="number of shell round trips to time")
+    parser.add_argument("--adb", help="also time this adb binary against the fake server")
+    parser.add_argument("--replay", action="store_true",
+                        help="run whatsapp.py's metadata and APK backup steps against the server and exit")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    recording = load_recording(args.recording) if args.recording else None
+    server = FakeAdbServer(recording, port=args.port)
+    if args.latency_ms is not None:
+        server.recording["latency_ms"] = args.latency_ms
+
+    if args.bench:
+        server.start()
+        print(json.dumps(benchmark(server, args.size_mb, args.shell_calls, args.adb), indent=2))
+        server.shutdown()
+        sys.exit(0)
+
+    if args.replay:
+        server.start()
+        with tempfile.TemporaryDirectory() as work_dir:
+            replay = replay_pipeline(server, work_dir)
+        server.shutdown()
+        print(json.dumps(replay, indent=2))
+        sys.exit(0 if replay["apk_matches"] else 1)
+
+    print(f"[*] Fake adb server listening on 127.0.0.1:{server.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
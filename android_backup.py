@@ -0,0 +1,405 @@
+import fnmatch
+import hashlib
+import os
+import tarfile
+import time
+import zlib
+
+AB_MAGIC = b"ANDROID BACKUP"
+CHUNK_SIZE = 1024 * 1024
+MAX_HEADER_LINE = 4096
+FOLLOW_POLL_INTERVAL = 0.2
+
+
+class BackupFormatError(Exception):
+    pass
+
+
+class BackupPasswordError(BackupFormatError):
+    pass
+
+
+def _read_line(f):
+    line = bytearray()
+    while len(line) < MAX_HEADER_LINE:
+        c = f.read(1)
+        if not c:
+            raise BackupFormatError("Unexpected end of file while reading .ab header")
+        if c == b"\n":
+            return bytes(line).decode("ascii", errors="replace")
+        line += c
+    raise BackupFormatError("Header line too long, not an Android backup?")
+
+
+def read_header(f):
+    magic = _read_line(f).encode("ascii")
+    if magic != AB_MAGIC:
+        raise BackupFormatError(f"Bad magic {magic!r}, not an Android backup")
+
+    try:
+        version = int(_read_line(f))
+        compressed = int(_read_line(f)) == 1
+    except ValueError:
+        raise BackupFormatError("Malformed version/compression fields in .ab header")
+    encryption = _read_line(f)
+
+    header = {"version": version, "compressed": compressed, "encryption": encryption}
+
+    if encryption == "AES-256":
+        try:
+            header.update({
+                "user_salt": bytes.fromhex(_read_line(f)),
+                "checksum_salt": bytes.fromhex(_read_line(f)),
+                "rounds": int(_read_line(f)),
+                "user_iv": bytes.fromhex(_read_line(f)),
+                "master_key_blob": bytes.fromhex(_read_line(f)),
+            })
+        except ValueError:
+            raise BackupFormatError("Malformed encryption fields in .ab header")
+    elif encryption != "none":
+        raise BackupFormatError(f"Unsupported encryption type: {encryption}")
+
+    return header
+
+
+def _aes_cbc(key, iv):
+    try:
+        # pip install cryptography
+        from cryptography.hazmat.primitives import padding
+        from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
+    except ImportError:
+        raise BackupFormatError("Encrypted backups need the 'cryptography' package (pip install cryptography)")
+    return Cipher(algorithms.AES(key), modes.CBC(iv)), padding.PKCS7(128)
+
+
+def _aes_cbc_decryptor(key, iv):
+    cipher, pkcs7 = _aes_cbc(key, iv)
+    return cipher.decryptor(), pkcs7.unpadder()
+
+
+def _aes_cbc_encryptor(key, iv):
+    cipher, pkcs7 = _aes_cbc(key, iv)
+    return cipher.encryptor(), pkcs7.padder()
+
+
+def _aes_cbc_encrypt(key, iv, data):
+    encryptor, padder = _aes_cbc_encryptor(key, iv)
+    return encryptor.update(padder.update(data) + padder.finalize()) + encryptor.finalize()
+
+
+def _aes_cbc_decrypt(key, iv, data):
+    decryptor, unpadder = _aes_cbc_decryptor(key, iv)
+    try:
+        plain = decryptor.update(data) + decryptor.finalize()
+        return unpadder.update(plain) + unpadder.finalize()
+    except ValueError:
+        raise BackupPasswordError("Wrong backup password")
+
+
+def _checksum_input(master_key, utf8):
+    # BackupManagerService turns the key bytes into Java chars (sign-extended) before PBKDF2.
+    # With PBKDF2WithHmacSHA1 those chars are then UTF-8 encoded, the "And8bit" variant keeps the low byte.
+    if not utf8:
+        return master_key
+    return "".join(chr(b if b < 0x80 else 0xFF00 | b) for b in master_key).encode("utf-8")
+
+
+def _unpack_master_key_blob(blob):
+    parts = []
+    offset = 0
+    for _ in range(3):
+        if offset >= len(blob):
+            raise BackupPasswordError("Wrong backup password")
+        length = blob[offset]
+        parts.append(blob[offset + 1:offset + 1 + length])
+        offset += 1 + length
+    return parts
+
+
+def unwrap_master_key(header, password):
+    if not password:
+        raise BackupPasswordError("Backup is encrypted, a password is required")
+
+    rounds = header["rounds"]
+    # Version 1 backups used the 8-bit PBKDF2 variant, later ones UTF-8; try the native one first.
+    attempts = [True, False] if header["version"] >= 2 else [False]
+    for utf8 in attempts:
+        pw_bytes = password.encode("utf-8" if utf8 else "latin-1", errors="replace")
+        user_key = hashlib.pbkdf2_hmac("sha1", pw_bytes, header["user_salt"], rounds, 32)
+        try:
+            blob = _aes_cbc_decrypt(user_key, header["user_iv"], header["master_key_blob"])
+            iv, master_key, checksum = _unpack_master_key_blob(blob)
+        except BackupPasswordError:
+            continue
+        expected = hashlib.pbkdf2_hmac("sha1", _checksum_input(master_key, utf8), header["checksum_salt"], rounds, 32)
+        if expected == checksum:
+            return master_key, iv
+
+    raise BackupPasswordError("Wrong backup password")
+
+
+class FollowFile:
+    """Reads a file another process is still appending to; EOF only once that process has exited."""
+
+    def __init__(self, path, process, poll_interval=FOLLOW_POLL_INTERVAL):
+        self.path = path
+        self.process = process
+        self.poll_interval = poll_interval
+        self.f = None
+        self._exited = False
+
+    def read(self, n=-1):
+        while True:
+            if self.f is None:
+                if os.path.exists(self.path):
+                    self.f = open(self.path, "rb")
+                    continue
+                if self.process.poll() is not None:
+                    return b""
+                time.sleep(self.poll_interval)
+                continue
+
+            data = self.f.read(n)
+            if data:
+                return data
+            if self._exited:
+                return b""
+            if self.process.poll() is not None:
+                # One more read to pick up whatever was flushed right before the process exited
+                self._exited = True
+                continue
+            time.sleep(self.poll_interval)
+
+    def close(self):
+        if self.f:
+            self.f.close()
+
+
+class HashingReader:
+    """Passes reads through while hashing them, so the raw file gets its SHA-256 without a second pass."""
+
+    def __init__(self, f):
+        self.f = f
+        self.sha256 = hashlib.sha256()
+        self.size = 0
+
+    def read(self, n=-1):
+        data = self.f.read(n)
+        self.sha256.update(data)
+        self.size += len(data)
+        return data
+
+    def drain(self, chunk_size=CHUNK_SIZE):
+        # Readers may stop early (see extract_members), the rest still belongs in the hash
+        while self.read(chunk_size):
+            pass
+        return self.size, self.sha256.hexdigest()
+
+    def close(self):
+        self.f.close()
+
+
+class AndroidBackupReader:
+    """File-like reader over the inflated tar payload of an .ab stream."""
+
+    def __init__(self, f, password=None, chunk_size=CHUNK_SIZE):
+        self.f = f
+        self.chunk_size = chunk_size
+        self.header = read_header(f)
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self._buffer = bytearray()
+        self._raw_eof = False
+        self._eof = False
+
+        self._decryptor = None
+        self._unpadder = None
+        if self.header["encryption"] == "AES-256":
+            master_key, iv = unwrap_master_key(self.header, password)
+            self._decryptor, self._unpadder = _aes_cbc_decryptor(master_key, iv)
+
+        self._inflater = zlib.decompressobj() if self.header["compressed"] else None
+
+    def _inflate(self, data, final=False):
+        try:
+            # At most chunk_size out per call, the rest of the input waits in unconsumed_tail: a highly
+            # compressible chunk must not inflate to gigabytes in one go
+            out = self._inflater.decompress(data, self.chunk_size)
+            if final and not self._inflater.unconsumed_tail:
+                out += self._inflater.flush()
+        except zlib.error as e:
+            raise BackupFormatError(f"Corrupt compressed stream: {e}")
+        if final and not self._inflater.unconsumed_tail and not self._inflater.eof:
+            raise BackupFormatError("Truncated stream: deflate data ended before its end marker")
+        return out
+
+    def _decode(self, data, final=False):
+        if self._decryptor:
+            try:
+                data = self._unpadder.update(self._decryptor.update(data))
+                if final:
+                    data += self._unpadder.update(self._decryptor.finalize()) + self._unpadder.finalize()
+            except ValueError:
+                raise BackupFormatError("Truncated or corrupt encrypted stream")
+
+        if self._inflater:
+            return self._inflate(data, final)
+        return data
+
+    def _fill(self):
+        if self._inflater and self._inflater.unconsumed_tail:
+            # Drain what the previous chunk still holds before reading more
+            self._buffer += self._inflate(self._inflater.unconsumed_tail, final=self._raw_eof)
+        else:
+            raw = self.f.read(self.chunk_size)
+            if raw:
+                self.bytes_in += len(raw)
+                self._buffer += self._decode(raw)
+            else:
+                self._raw_eof = True
+                self._buffer += self._decode(b"", final=True)
+        if self._raw_eof and not (self._inflater and self._inflater.unconsumed_tail):
+            self._eof = True
+
+    def read(self, n=-1):
+        while not self._eof and (n < 0 or len(self._buffer) < n):
+            self._fill()
+        if n < 0:
+            n = len(self._buffer)
+        data = bytes(self._buffer[:n])
+        del self._buffer[:n]
+        self.bytes_out += len(data)
+        return data
+
+    def chunks(self):
+        while True:
+            data = self.read(self.chunk_size)
+            if not data:
+                return
+            yield data
+
+    def close(self):
+        self.f.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class AndroidBackupWriter:
+    """File-like writer producing an .ab stream, the inverse of AndroidBackupReader (used to build test backups)."""
+
+    def __init__(self, f, compressed=True, password=None, version=5, rounds=10000):
+        self.f = f
+        self._deflater = zlib.compressobj() if compressed else None
+        self._encryptor = None
+        self._padder = None
+
+        header = [AB_MAGIC.decode("ascii"), str(version), "1" if compressed else "0"]
+        if password:
+            user_salt, checksum_salt = os.urandom(64), os.urandom(64)
+            user_iv, master_iv, master_key = os.urandom(16), os.urandom(16), os.urandom(32)
+            utf8 = version >= 2
+            pw_bytes = password.encode("utf-8" if utf8 else "latin-1", errors="replace")
+            user_key = hashlib.pbkdf2_hmac("sha1", pw_bytes, user_salt, rounds, 32)
+            checksum = hashlib.pbkdf2_hmac("sha1", _checksum_input(master_key, utf8), checksum_salt, rounds, 32)
+            blob = b"".join(bytes([len(part)]) + part for part in (master_iv, master_key, checksum))
+            header += ["AES-256", user_salt.hex().upper(), checksum_salt.hex().upper(), str(rounds),
+                       user_iv.hex().upper(), _aes_cbc_encrypt(user_key, user_iv, blob).hex().upper()]
+            self._encryptor, self._padder = _aes_cbc_encryptor(master_key, master_iv)
+        else:
+            header.append("none")
+        f.write(("\n".join(header) + "\n").encode("ascii"))
+
+    def _encode(self, data, final=False):
+        if self._deflater:
+            data = self._deflater.compress(data)
+            if final:
+                data += self._deflater.flush()
+        if self._encryptor:
+            data = self._encryptor.update(self._padder.update(data))
+            if final:
+                data += self._encryptor.update(self._padder.finalize()) + self._encryptor.finalize()
+        return data
+
+    def write(self, data):
+        self.f.write(self._encode(data))
+        return len(data)
+
+    def close(self):
+        self.f.write(self._encode(b"", final=True))
+        self.f.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def open_backup(path, password=None, chunk_size=CHUNK_SIZE, follow_process=None):
+    f = FollowFile(path, follow_process) if follow_process else open(path, "rb")
+    try:
+        return AndroidBackupReader(f, password=password, chunk_size=chunk_size)
+    except Exception:
+        f.close()
+        raise
+
+
+def _has_wildcard(pattern):
+    return any(c in pattern for c in "*?[")
+
+
+def _pattern_dir(pattern):
+    wildcard = min((i for i, c in enumerate(pattern) if c in "*?["), default=len(pattern))
+    return pattern[:pattern.rfind("/", 0, wildcard) + 1]
+
+
+def extract_members(fileobj, dest_dir, patterns, prefix=""):
+    """Single forward pass over a tar stream, writing members that match `patterns` (relative to `prefix`)
+    under `dest_dir`. Stops reading once every pattern is satisfied. Returns (rel, dst, size, sha256) tuples."""
+    # Backups write each directory in one go, so a pattern is done once its member was seen
+    # or the stream has moved past the directory it lives in.
+    pending = {pattern: _pattern_dir(pattern) for pattern in patterns}
+    entered = set()
+    extracted = []
+    dest_root = os.path.abspath(dest_dir)
+
+    with tarfile.open(fileobj=fileobj, mode="r|") as tar:
+        for member in tar:
+            rel = member.name[len(prefix):] if member.name.startswith(prefix) else None
+
+            for pattern, pattern_dir in list(pending.items()):
+                if rel is not None and rel.startswith(pattern_dir):
+                    entered.add(pattern)
+                elif pattern in entered and pattern_dir:
+                    del pending[pattern]
+            if not pending:
+                break
+
+            if rel is None or not member.isfile():
+                continue
+            matched = [pattern for pattern in patterns if fnmatch.fnmatchcase(rel, pattern)]
+            if not matched:
+                continue
+
+            dst = os.path.abspath(os.path.join(dest_root, *rel.split("/")))
+            if not dst.startswith(dest_root + os.sep):
+                raise BackupFormatError(f"Refusing to extract {member.name!r} outside {dest_dir}")
+            os.makedirs(os.path.dirname(dst), exist_ok=True)
+            digest = hashlib.sha256()
+            with tar.extractfile(member) as src, open(dst, "wb") as out:
+                for chunk in iter(lambda: src.read(CHUNK_SIZE), b""):
+                    digest.update(chunk)
+                    out.write(chunk)
+            extracted.append((rel, dst, member.size, digest.hexdigest()))
+
+            for pattern in matched:
+                if not _has_wildcard(pattern):
+                    pending.pop(pattern, None)
+            if not pending:
+                break
+
+    return extracted
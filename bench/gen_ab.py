@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+import argparse
+import io
+import os
+import random
+import sys
+import tarfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import android_backup
+
+APP_PREFIX = "apps/com.whatsapp/"
+BLOCK_SIZE = 1024 * 1024
+
+
+class FillerStream:
+    """Deterministic, roughly 50% compressible bytes, so compressed backups behave like real ones."""
+
+    def __init__(self, size, seed=0):
+        rng = random.Random(seed)
+        self.block = rng.randbytes(BLOCK_SIZE // 2) + bytes(BLOCK_SIZE // 2)
+        self.remaining = size
+        self.offset = 0
+
+    def read(self, n=-1):
+        if n < 0:
+            n = self.remaining
+        n = min(n, self.remaining)
+        out = bytearray()
+        while len(out) < n:
+            take = min(n - len(out), BLOCK_SIZE - self.offset)
+            out += self.block[self.offset:self.offset + take]
+            self.offset = (self.offset + take) % BLOCK_SIZE
+        self.remaining -= n
+        return bytes(out)
+
+
+def _add(tar, name, size, fileobj):
+    info = tarfile.TarInfo(APP_PREFIX + name)
+    info.size = size
+    info.mode = 0o600
+    tar.addfile(info, fileobj)
+
+
+def generate_backup(path, size_mb=64, compressed=True, password=None, msgstore=None, seed=0):
+    """Write a valid .ab with the WhatsApp layout, padded with filler files to about size_mb of tar payload."""
+    target = size_mb * 1024 * 1024
+    rng = random.Random(seed)
+    small = {
+        "_manifest": b"1\ncom.whatsapp\n452\n19\nsynthetic\n0\n",
+        "f/key": rng.randbytes(158),
+        "db/msgstore.db-shm": bytes(32768),
+        "db/wa.db": rng.randbytes(64 * 1024),
+        "db/axolotl.db": rng.randbytes(128 * 1024),
+        "db/chatsettings.db": rng.randbytes(16 * 1024),
+        "sp/com.whatsapp_preferences.xml": b"<?xml version='1.0' encoding='utf-8'?>\n<map />\n",
+    }
+    msgstore_size = os.path.getsize(msgstore) if msgstore else min(target // 4, 256 * 1024 * 1024)
+    filler = max(0, target - msgstore_size - sum(len(v) for v in small.values()))
+
+    with open(path, "wb") as f, \
+            android_backup.AndroidBackupWriter(f, compressed=compressed, password=password) as writer, \
+            tarfile.open(fileobj=writer, mode="w|", format=tarfile.USTAR_FORMAT) as tar:
+        # Same domain order as Android's FullBackupAgent: root, files, databases, shared prefs, external
+        _add(tar, "_manifest", len(small["_manifest"]), io.BytesIO(small["_manifest"]))
+        _add(tar, "r/app_minidumps/filler.bin", filler // 2, FillerStream(filler // 2, seed))
+        _add(tar, "f/key", len(small["f/key"]), io.BytesIO(small["f/key"]))
+        if msgstore:
+            with open(msgstore, "rb") as src:
+                _add(tar, "db/msgstore.db", msgstore_size, src)
+        else:
+            _add(tar, "db/msgstore.db", msgstore_size, FillerStream(msgstore_size, seed + 1))
+        for name in ("db/msgstore.db-shm", "db/wa.db", "db/axolotl.db", "db/chatsettings.db",
+                     "sp/com.whatsapp_preferences.xml"):
+            _add(tar, name, len(small[name]), io.BytesIO(small[name]))
+        _add(tar, "ef/Media/filler.bin", filler - filler // 2, FillerStream(filler - filler // 2, seed + 2))
+
+    return os.path.getsize(path)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Generate a synthetic WhatsApp .ab backup")
+    parser.add_argument("out", help="output .ab path")
+    parser.add_argument("--size-mb", type=int, default=64, help="approximate size of the tar payload")
+    parser.add_argument("--no-compress", action="store_true", help="write an uncompressed backup")
+    parser.add_argument("--password", help="encrypt the backup with this password")
+    parser.add_argument("--msgstore", help="embed this msgstore.db instead of filler bytes")
+    parser.add_argument("--seed", type=int, default=0)
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    size = generate_backup(args.out, args.size_mb, not args.no_compress, args.password, args.msgstore, args.seed)
+    print(f"[✔] Wrote {args.out} ({size / 1048576:.1f} MB)")
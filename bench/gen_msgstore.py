@@ -0,0 +1,265 @@
+#!/usr/bin/env python3
+import argparse
+import itertools
+import os
+import random
+import sqlite3
+import time
+
+# Subset of the modern msgstore.db schema, covering every column ui/app.py reads
+SCHEMA = """
+CREATE TABLE jid (
+    _id INTEGER PRIMARY KEY AUTOINCREMENT,
+    user TEXT NOT NULL,
+    server TEXT NOT NULL,
+    agent INTEGER,
+    device INTEGER,
+    type INTEGER,
+    raw_string TEXT
+);
+CREATE UNIQUE INDEX jid_key_index ON jid (raw_string, user, server, agent, device);
+CREATE TABLE chat (
+    _id INTEGER PRIMARY KEY AUTOINCREMENT,
+    jid_row_id INTEGER UNIQUE,
+    hidden INTEGER,
+    subject TEXT,
+    created_timestamp INTEGER,
+    display_message_row_id INTEGER,
+    last_message_row_id INTEGER,
+    sort_timestamp INTEGER,
+    archived INTEGER,
+    unseen_message_count INTEGER
+);
+CREATE TABLE message (
+    _id INTEGER PRIMARY KEY AUTOINCREMENT,
+    chat_row_id INTEGER NOT NULL,
+    from_me INTEGER NOT NULL,
+    key_id TEXT NOT NULL,
+    sender_jid_row_id INTEGER,
+    status INTEGER,
+    timestamp INTEGER,
+    received_timestamp INTEGER,
+    message_type INTEGER,
+    text_data TEXT,
+    starred INTEGER,
+    sort_id INTEGER NOT NULL DEFAULT 0
+);
+CREATE TABLE message_media (
+    message_row_id INTEGER PRIMARY KEY,
+    chat_row_id INTEGER,
+    file_path TEXT,
+    file_size INTEGER,
+    direct_path TEXT,
+    mime_type TEXT,
+    media_name TEXT,
+    media_caption TEXT
+);
+CREATE TABLE message_quoted (
+    message_row_id INTEGER PRIMARY KEY,
+    chat_row_id INTEGER NOT NULL,
+    parent_message_chat_row_id INTEGER NOT NULL,
+    from_me INTEGER NOT NULL,
+    sender_jid_row_id INTEGER,
+    key_id TEXT NOT NULL,
+    timestamp INTEGER,
+    message_type INTEGER,
+    text_data TEXT
+);
+"""
+
+# What WhatsApp 2.11 (the version the extractor installs) writes: everything in messages and chat_list
+LEGACY_SCHEMA = """
+CREATE TABLE messages (
+    _id INTEGER PRIMARY KEY AUTOINCREMENT,
+    key_remote_jid TEXT NOT NULL,
+    key_from_me INTEGER,
+    key_id TEXT NOT NULL,
+    status INTEGER,
+    needs_push INTEGER,
+    data TEXT,
+    timestamp INTEGER,
+    media_url TEXT,
+    media_mime_type TEXT,
+    media_wa_type TEXT,
+    media_size INTEGER,
+    media_name TEXT,
+    media_hash TEXT,
+    media_duration INTEGER,
+    origin INTEGER,
+    latitude REAL,
+    longitude REAL,
+    thumb_image TEXT,
+    remote_resource TEXT,
+    received_timestamp INTEGER,
+    send_timestamp INTEGER,
+    receipt_server_timestamp INTEGER,
+    receipt_device_timestamp INTEGER,
+    raw_data BLOB,
+    recipient_count INTEGER
+);
+CREATE TABLE chat_list (
+    _id INTEGER PRIMARY KEY AUTOINCREMENT,
+    key_remote_jid TEXT UNIQUE,
+    message_table_id INTEGER,
+    subject TEXT,
+    creation INTEGER,
+    last_read_message_table_id INTEGER,
+    last_read_receipt_sent_message_table_id INTEGER,
+    archived INTEGER,
+    sort_timestamp INTEGER
+);
+"""
+
+WORDS = ("ok yes no maybe tomorrow today tonight call me later home work love you thanks see meeting lunch dinner "
+         "coffee photo video where when why how great cool lol haha sorry sure done wait coming late early train bus "
+         "car flight hotel birthday party weekend monday friday money price order delivery doctor school exam").split()
+MEDIA_TYPES = [(1, "image/jpeg", "Media/WhatsApp Images/IMG-{d}-WA{n:04d}.jpg"),
+               (3, "video/mp4", "Media/WhatsApp Video/VID-{d}-WA{n:04d}.mp4"),
+               (2, "audio/ogg", "Media/WhatsApp Voice Notes/PTT-{d}-WA{n:04d}.opus"),
+               (9, "application/pdf", "Media/WhatsApp Documents/DOC-{d}-WA{n:04d}.pdf")]
+START_MS = 1451606400000  # 2016-01-01
+BATCH = 50000
+
+
+def _sentence(rng):
+    return " ".join(rng.choices(WORDS, k=rng.randint(1, 24)))
+
+
+def _to_legacy(conn):
+    # Same messages in the legacy layout. It has no quoted messages, and media only keep their file name
+    conn.executescript(LEGACY_SCHEMA + """
+    INSERT INTO messages (_id, key_remote_jid, key_from_me, key_id, status, data, timestamp, media_url,
+                          media_mime_type, media_wa_type, media_size, media_name, remote_resource, received_timestamp)
+    SELECT m._id, cj.raw_string, m.from_me, m.key_id, m.status, m.text_data, m.timestamp, mm.direct_path,
+           mm.mime_type, CAST(m.message_type AS TEXT), mm.file_size, mm.media_name, COALESCE(s.raw_string, ''),
+           m.received_timestamp
+    FROM message m
+    JOIN chat c ON c._id = m.chat_row_id
+    JOIN jid cj ON cj._id = c.jid_row_id
+    LEFT JOIN jid s ON s._id = m.sender_jid_row_id
+    LEFT JOIN message_media mm ON mm.message_row_id = m._id
+    ORDER BY m._id;
+    -- The placeholder row legacy databases start with
+    INSERT INTO messages (_id, key_remote_jid, key_from_me, key_id, status, timestamp, media_wa_type)
+    VALUES (0, '-1', 0, '-1', -1, 0, '0');
+    INSERT INTO chat_list (_id, key_remote_jid, message_table_id, subject, creation, sort_timestamp)
+    SELECT c._id, j.raw_string, c.last_message_row_id, c.subject, c.created_timestamp, c.sort_timestamp
+    FROM chat c
+    JOIN jid j ON j._id = c.jid_row_id;
+    CREATE UNIQUE INDEX messages_key_index ON messages (key_remote_jid, key_from_me, key_id);
+    DROP TABLE message_quoted;
+    DROP TABLE message_media;
+    DROP TABLE message;
+    DROP TABLE chat;
+    DROP TABLE jid;
+    """)
+    conn.execute("VACUUM")
+
+
+def generate_msgstore(path, messages=1_000_000, chats=2000, skew=1.1, group_ratio=0.2, media_ratio=0.15,
+                      quoted_ratio=0.05, same_ms_ratio=0.02, span_days=3000, seed=0, legacy=False):
+    """Create a msgstore.db with `messages` rows spread over `chats` chats following a Zipf(skew) distribution,
+    in the 2.11 layout (messages/chat_list) with legacy=True."""
+    if os.path.exists(path):
+        os.remove(path)
+    rng = random.Random(seed)
+    conn = sqlite3.connect(path)
+    conn.executescript("PRAGMA journal_mode=OFF; PRAGMA synchronous=OFF;" + SCHEMA)
+
+    contacts = max(chats, 50)
+    conn.executemany(
+        "INSERT INTO jid (_id, user, server, agent, device, type, raw_string) VALUES (?, ?, ?, 0, 0, ?, ?)",
+        ((i, f"{15550000000 + i}", "s.whatsapp.net", 0, f"{15550000000 + i}@s.whatsapp.net")
+         for i in range(1, contacts + 1)))
+    is_group = [rng.random() < group_ratio for _ in range(chats)]
+    group_jids = []
+    for c in range(chats):
+        if is_group[c]:
+            jid_id = contacts + len(group_jids) + 1
+            user = f"{15550000000 + c}-{1500000000 + c}"
+            conn.execute("INSERT INTO jid (_id, user, server, agent, device, type, raw_string) VALUES (?, ?, ?, 0, 0, 1, ?)",
+                         (jid_id, user, "g.us", f"{user}@g.us"))
+            group_jids.append(jid_id)
+    group_iter = iter(group_jids)
+    chat_jids = [next(group_iter) if is_group[c] else c + 1 for c in range(chats)]
+    conn.executemany(
+        "INSERT INTO chat (_id, jid_row_id, hidden, subject, created_timestamp, archived, unseen_message_count) "
+        "VALUES (?, ?, 0, ?, ?, 0, 0)",
+        ((c + 1, chat_jids[c], f"Group {c + 1}" if is_group[c] else None, START_MS) for c in range(chats)))
+
+    cum_weights = list(itertools.accumulate(1 / (rank ** skew) for rank in range(1, chats + 1)))
+    mean_step = span_days * 86400000 / max(messages, 1)
+    timestamp = START_MS
+    last_in_chat = {}
+    recent = []
+
+    for batch_start in range(1, messages + 1, BATCH):
+        batch_end = min(batch_start + BATCH, messages + 1)
+        chat_ids = rng.choices(range(1, chats + 1), cum_weights=cum_weights, k=batch_end - batch_start)
+        rows, media, quoted = [], [], []
+        for message_id, chat_id in zip(range(batch_start, batch_end), chat_ids):
+            if rng.random() >= same_ms_ratio:
+                timestamp += max(1, int(rng.expovariate(1 / mean_step)))
+            from_me = rng.random() < 0.45
+            sender = None
+            if not from_me and is_group[chat_id - 1]:
+                sender = rng.randint(1, contacts)
+            text = _sentence(rng)
+            message_type = 0
+            if rng.random() < media_ratio:
+                message_type, mime, pattern = rng.choice(MEDIA_TYPES)
+                day = time.strftime("%Y%m%d", time.gmtime(timestamp / 1000))
+                file_path = pattern.format(d=day, n=message_id % 10000)
+                media.append((message_id, chat_id, file_path, rng.randint(10_000, 5_000_000),
+                              f"/v/t62/{message_id:x}", mime, os.path.basename(file_path)))
+                text = text if rng.random() < 0.3 else None
+            key_id = f"{message_id:016X}"
+            rows.append((message_id, chat_id, int(from_me), key_id, sender, 13, timestamp, timestamp + 500,
+                         message_type, text, 0, message_id))
+            if recent and rng.random() < quoted_ratio:
+                q_id, q_chat, q_text, q_ts = rng.choice(recent)
+                quoted.append((message_id, chat_id, q_chat, 0, None, f"Q{q_id:015X}", q_ts, 0, q_text))
+            if text and rng.random() < 0.01:
+                recent = recent[-200:] + [(message_id, chat_id, text, timestamp)]
+            last_in_chat[chat_id] = (message_id, timestamp)
+
+        conn.executemany("INSERT INTO message (_id, chat_row_id, from_me, key_id, sender_jid_row_id, status, timestamp, "
+                         "received_timestamp, message_type, text_data, starred, sort_id) "
+                         "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", rows)
+        conn.executemany("INSERT INTO message_media (message_row_id, chat_row_id, file_path, file_size, direct_path, "
+                         "mime_type, media_name) VALUES (?, ?, ?, ?, ?, ?, ?)", media)
+        conn.executemany("INSERT INTO message_quoted (message_row_id, chat_row_id, parent_message_chat_row_id, from_me, "
+                         "sender_jid_row_id, key_id, timestamp, message_type, text_data) "
+                         "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", quoted)
+
+    conn.executemany("UPDATE chat SET last_message_row_id = ?, display_message_row_id = ?, sort_timestamp = ? "
+                     "WHERE _id = ?",
+                     ((mid, mid, ts, chat_id) for chat_id, (mid, ts) in last_in_chat.items()))
+    conn.commit()
+    if legacy:
+        _to_legacy(conn)
+    conn.close()
+    return os.path.getsize(path)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Generate a synthetic msgstore.db for the viewer")
+    parser.add_argument("out", help="output msgstore.db path")
+    parser.add_argument("--messages", type=int, default=1_000_000)
+    parser.add_argument("--chats", type=int, default=2000)
+    parser.add_argument("--skew", type=float, default=1.1, help="Zipf exponent of messages per chat (0 = uniform)")
+    parser.add_argument("--group-ratio", type=float, default=0.2)
+    parser.add_argument("--media-ratio", type=float, default=0.15)
+    parser.add_argument("--quoted-ratio", type=float, default=0.05)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--legacy", action="store_true", help="write the WhatsApp 2.11 layout (messages table)")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    start = time.monotonic()
+    size = generate_msgstore(args.out, args.messages, args.chats, args.skew, args.group_ratio, args.media_ratio,
+                             args.quoted_ratio, seed=args.seed, legacy=args.legacy)
+    print(f"[✔] Wrote {args.out} ({size / 1048576:.1f} MB, {args.messages} messages) "
+          f"in {time.monotonic() - start:.1f}s")
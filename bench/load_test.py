@@ -0,0 +1,247 @@
+#!/usr/bin/env python3
+import argparse
+import collections
+import http.client
+import json
+import multiprocessing
+import os
+import random
+import socket
+import subprocess
+import sys
+import threading
+import time
+import urllib.parse
+from datetime import datetime
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT_DIR = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, ROOT_DIR)
+sys.path.insert(0, BENCH_DIR)
+import viewer_db
+from gen_msgstore import WORDS, generate_msgstore
+from run_bench import latency_stats
+
+# Share of chat opens that also refresh the chat list / run a search
+CHATS_RATIO = 0.1
+SEARCH_RATIO = 0.05
+
+
+def prepare_db(args):
+    os.makedirs(args.workdir, exist_ok=True)
+    db_path = os.path.join(args.workdir, f"msgstore-{args.messages}msg-{args.chats}chats-skew{args.skew}.db")
+    if not os.path.exists(db_path):
+        print(f"[*] Generating {db_path}...")
+        generate_msgstore(db_path, args.messages, args.chats, args.skew)
+    viewer_path = viewer_db.viewer_db_path(db_path)
+    if not os.path.exists(viewer_path) or os.path.getmtime(viewer_path) < os.path.getmtime(db_path):
+        print(f"[*] Building {viewer_path}...")
+        viewer_db.build_viewer_db(db_path)
+    return viewer_path
+
+
+def chat_ids(db_path):
+    import sqlite3
+    conn = sqlite3.connect(db_path)
+    rows = conn.execute("SELECT chat_row_id, COUNT(*) FROM message GROUP BY chat_row_id").fetchall()
+    conn.close()
+    return rows
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_server(args, db_path):
+    port = free_port()
+    cmd = [sys.executable, os.path.join(ROOT_DIR, "ui", "serve.py"), "--db", db_path, "--port", str(port),
+           "--threads", str(args.threads), "--workers", str(args.workers), "--max-queries", str(args.max_queries),
+           "--cache-mb", str(args.cache_mb)]
+    server = subprocess.Popen(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    url = f"http://127.0.0.1:{port}"
+    deadline = time.monotonic() + 60
+    while time.monotonic() < deadline:
+        if server.poll() is not None:
+            raise RuntimeError(f"server exited with {server.returncode}: {' '.join(cmd)}")
+        try:
+            conn = http.client.HTTPConnection("127.0.0.1", port, timeout=5)
+            conn.request("GET", "/search/status")
+            status = json.loads(conn.getresponse().read())
+            conn.close()
+            # Let the search index finish first, so it does not compete with the measured requests
+            if status.get("state") != "indexing":
+                return server, url
+        except OSError:
+            pass
+        time.sleep(0.2)
+    server.kill()
+    raise RuntimeError("server did not come up within 60 seconds")
+
+
+class Client:
+    """One simulated reviewer: opens a chat (large chats more often), scrolls up through it page by page with
+    pauses, now and then reloads the chat list or searches."""
+
+    def __init__(self, url, chats, args, seed):
+        parsed = urllib.parse.urlparse(url)
+        self.host, self.port = parsed.hostname, parsed.port
+        self.chats = [chat for chat, _ in chats]
+        self.weights = [count for _, count in chats]
+        self.args = args
+        self.rng = random.Random(seed)
+        self.conn = None
+        self.samples = collections.defaultdict(list)
+        self.errors = collections.Counter()
+
+    def get(self, kind, path):
+        if self.conn is None:
+            self.conn = http.client.HTTPConnection(self.host, self.port, timeout=120)
+        start = time.perf_counter()
+        try:
+            self.conn.request("GET", path)
+            response = self.conn.getresponse()
+            body = response.read()
+        except (OSError, http.client.HTTPException) as e:
+            self.errors[type(e).__name__] += 1
+            self.conn.close()
+            self.conn = None
+            return None
+        elapsed = time.perf_counter() - start
+        if response.status != 200:
+            self.errors[str(response.status)] += 1
+            return None
+        self.samples[kind].append(elapsed)
+        return body
+
+    def think(self):
+        if self.args.think_ms:
+            time.sleep(self.rng.expovariate(1000 / self.args.think_ms))
+
+    def run(self, deadline):
+        batch, fmt = self.args.batch, self.args.format
+        while time.monotonic() < deadline:
+            if self.rng.random() < CHATS_RATIO:
+                self.get("chats", "/chats?limit=100")
+            if self.rng.random() < SEARCH_RATIO:
+                self.get("search", "/search?q=" + self.rng.choice(WORDS))
+            chat = self.rng.choices(self.chats, self.weights)[0]
+            body = self.get("first_page", f"/messages?chat_id={chat}&limit={batch}&order=desc&format={fmt}")
+            for _ in range(self.rng.randint(0, self.args.pages)):
+                cursor = body and _older_cursor(body, fmt)
+                if not cursor or time.monotonic() >= deadline:
+                    break
+                self.think()
+                body = self.get("scroll", f"/messages?chat_id={chat}&limit={batch}&cursor={cursor}&format={fmt}")
+            self.think()
+        if self.conn:
+            self.conn.close()
+
+
+def _older_cursor(body, fmt):
+    if fmt == "ndjson":
+        return json.loads(body.rsplit(b"\n", 2)[-2])["older_cursor"]
+    return json.loads(body)["older_cursor"]
+
+
+def run_clients(url, chats, args, count, seed, deadline):
+    clients = [Client(url, chats, args, seed + i) for i in range(count)]
+    threads = [threading.Thread(target=client.run, args=(deadline,)) for client in clients]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    samples, errors = collections.defaultdict(list), collections.Counter()
+    for client in clients:
+        for kind, values in client.samples.items():
+            samples[kind] += values
+        errors.update(client.errors)
+    return dict(samples), dict(errors)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Drive many scrolling clients against ui/serve.py and report "
+                                                 "latency percentiles")
+    parser.add_argument("--url", help="test a server already running on the synthetic database (ui/serve.py --db "
+                                      "<workdir>/msgstore-...viewer.db) instead of starting one")
+    parser.add_argument("--workdir", default=os.path.join(BENCH_DIR, "work"), help="where generated inputs are cached")
+    parser.add_argument("--results-dir", default=os.path.join(BENCH_DIR, "results"))
+    parser.add_argument("--messages", type=int, default=1_000_000)
+    parser.add_argument("--chats", type=int, default=2000)
+    parser.add_argument("--skew", type=float, default=1.1)
+    parser.add_argument("--clients", type=int, default=50, help="simulated clients")
+    parser.add_argument("--procs", type=int, default=min(4, os.cpu_count() or 1),
+                        help="client processes the clients are spread over")
+    parser.add_argument("--duration", type=float, default=30, help="seconds of load")
+    parser.add_argument("--batch", type=int, default=400, help="/messages page size")
+    parser.add_argument("--pages", type=int, default=10, help="most pages scrolled per chat")
+    parser.add_argument("--format", choices=("json", "ndjson"), default="ndjson")
+    parser.add_argument("--think-ms", type=float, default=200, help="mean pause between scrolls")
+    parser.add_argument("--threads", type=int, default=16, help="server threads per worker")
+    parser.add_argument("--workers", type=int, default=1, help="server worker processes")
+    parser.add_argument("--max-queries", type=int, default=4, help="server queries at once per worker")
+    parser.add_argument("--cache-mb", type=int, default=64, help="server response cache per worker")
+    parser.add_argument("--max-p99-ms", type=float, help="exit with an error when a p99 is above this")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    db_path = prepare_db(args)
+    chats = chat_ids(db_path)
+    server = None
+    url = args.url
+    if not url:
+        server, url = start_server(args, db_path)
+
+    print(f"[*] {args.clients} clients for {args.duration:g}s against {url}...")
+    deadline = time.monotonic() + args.duration
+    procs = max(1, min(args.procs, args.clients))
+    shares = [args.clients // procs + (i < args.clients % procs) for i in range(procs)]
+    start = time.monotonic()
+    try:
+        with multiprocessing.get_context("spawn").Pool(procs) as pool:
+            parts = pool.starmap(run_clients, [(url, chats, args, count, i * 1000, deadline)
+                                               for i, count in enumerate(shares)])
+    finally:
+        if server:
+            server.terminate()
+            server.wait()
+    elapsed = time.monotonic() - start
+
+    samples, errors = collections.defaultdict(list), collections.Counter()
+    for part_samples, part_errors in parts:
+        for kind, values in part_samples.items():
+            samples[kind] += values
+        errors.update(part_errors)
+    total = sum(len(values) for values in samples.values())
+    results = {"requests_per_s": round(total / elapsed, 1), "errors": dict(errors),
+               "all": latency_stats([v for values in samples.values() for v in values]) if total else {}}
+    for kind, values in sorted(samples.items()):
+        results[kind] = latency_stats(values)
+    print(json.dumps(results, indent=2))
+
+    report = {
+        "time": datetime.now().isoformat(timespec="seconds"),
+        "params": {k: v for k, v in vars(args).items() if k != "url"},
+        "inputs": {"msgstore": os.path.basename(db_path)},
+        "results": results,
+    }
+    os.makedirs(args.results_dir, exist_ok=True)
+    out = os.path.join(args.results_dir, f"load-{datetime.now().strftime('%Y-%m-%d-%H-%M-%S')}.json")
+    with open(out, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(f"[✔] Results saved -> {out}")
+
+    if errors:
+        print(f"[!] {sum(errors.values())} failed requests: {dict(errors)}")
+    if args.max_p99_ms is not None:
+        slow = [kind for kind, values in samples.items() if latency_stats(values)["p99_ms"] > args.max_p99_ms]
+        if slow:
+            print(f"[✖] p99 above {args.max_p99_ms:g} ms: {', '.join(sorted(slow))}")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
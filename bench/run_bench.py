@@ -0,0 +1,342 @@
+#!/usr/bin/env python3
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import time
+import urllib.parse
+from datetime import datetime
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT_DIR = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, ROOT_DIR)
+sys.path.insert(0, BENCH_DIR)
+import android_backup
+import viewer_db
+from gen_ab import generate_backup
+from gen_msgstore import generate_msgstore
+
+DEFAULT_PATTERNS = ["f/key", "db/msgstore.db*", "db/wa.db*", "db/axolotl.db*", "db/chatsettings.db*"]
+# Metrics where a higher value is better; everything else (seconds, latencies, RSS) is lower-is-better
+HIGHER_IS_BETTER = ("mb_per_s", "rows_per_s", "hit_rate")
+# Workload sizes, not measurements
+NOT_COMPARED = ("requests", "rows", "chats", "members", "input_mb", "output_mb", "written_mb", "scanned_mb")
+
+
+def peak_rss_mb():
+    try:
+        import resource
+    except ImportError:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in KB on Linux and bytes on macOS
+    return round(rss / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+
+def latency_stats(samples):
+    return {
+        "requests": len(samples),
+        "p50_ms": round(percentile(samples, 50) * 1000, 3),
+        "p99_ms": round(percentile(samples, 99) * 1000, 3),
+        "max_ms": round(max(samples) * 1000, 3),
+    }
+
+
+def bench_decode(ab_path, password):
+    start = time.perf_counter()
+    with android_backup.open_backup(ab_path, password) as reader:
+        for _ in reader.chunks():
+            pass
+    elapsed = time.perf_counter() - start
+    return {
+        "seconds": round(elapsed, 3),
+        "input_mb": round(reader.bytes_in / 1048576, 1),
+        "output_mb": round(reader.bytes_out / 1048576, 1),
+        "input_mb_per_s": round(reader.bytes_in / 1048576 / elapsed, 1),
+        "output_mb_per_s": round(reader.bytes_out / 1048576 / elapsed, 1),
+    }
+
+
+def bench_extract(ab_path, password):
+    dest = tempfile.mkdtemp(prefix="bench-extract-")
+    try:
+        start = time.perf_counter()
+        with android_backup.open_backup(ab_path, password) as reader:
+            extracted = android_backup.extract_members(reader, dest, DEFAULT_PATTERNS, prefix="apps/com.whatsapp/")
+        elapsed = time.perf_counter() - start
+    finally:
+        shutil.rmtree(dest, ignore_errors=True)
+    written = sum(size for _, _, size, _ in extracted)
+    return {
+        "seconds": round(elapsed, 3),
+        "members": len(extracted),
+        "written_mb": round(written / 1048576, 1),
+        "scanned_mb": round(reader.bytes_out / 1048576, 1),
+        "scanned_mb_per_s": round(reader.bytes_out / 1048576 / elapsed, 1),
+    }
+
+
+def _load_viewer(db_path):
+    sys.path.insert(0, os.path.join(ROOT_DIR, "ui"))
+    import app as viewer
+    viewer.DB_PATH = db_path
+    return viewer
+
+
+def _timed_get(client, url):
+    start = time.perf_counter()
+    response = client.get(url)
+    elapsed = time.perf_counter() - start
+    if response.status_code != 200:
+        raise RuntimeError(f"GET {url} -> {response.status_code}: {response.get_data(as_text=True)[:200]}")
+    return elapsed, response
+
+
+def bench_index(db_path, requests):
+    viewer = _load_viewer(db_path)
+    client = viewer.app.test_client()
+    cold, _ = _timed_get(client, "/")
+    samples = [_timed_get(client, "/")[0] for _ in range(requests)]
+    # First sidebar page; the cold request includes building the chat summary cache
+    shutil.rmtree(os.path.join(os.path.dirname(db_path), "viewer-cache"), ignore_errors=True)
+    chats_cold, _ = _timed_get(client, "/chats")
+    chat_samples = [_timed_get(client, "/chats")[0] for _ in range(requests)]
+    return {"cold_ms": round(cold * 1000, 3), **latency_stats(samples),
+            "chats": {"cold_ms": round(chats_cold * 1000, 3), **latency_stats(chat_samples)}}
+
+
+def bench_viewer_db(msgstore_path):
+    """Build the viewer copy of msgstore_path (a conversion too, for a legacy one) into a temp folder."""
+    import sqlite3
+    out_dir = tempfile.mkdtemp(prefix="viewer-db-")
+    try:
+        out_path, stats = viewer_db.build_viewer_db(msgstore_path, os.path.join(out_dir, "msgstore.viewer.db"))
+        conn = sqlite3.connect(out_path)
+        rows = conn.execute("SELECT COUNT(*) FROM message").fetchone()[0]
+        conn.close()
+        return {"seconds": round(stats["seconds"], 3), "rows": rows, "rows_per_s": round(rows / stats["seconds"]),
+                "input_mb": round(os.path.getsize(msgstore_path) / 1048576, 1),
+                "output_mb": round(stats["size"] / 1048576, 1), "legacy": stats["legacy_messages"] is not None}
+    finally:
+        viewer_db._remove(os.path.join(out_dir, "msgstore.viewer.db"))
+        shutil.rmtree(out_dir, ignore_errors=True)
+
+
+def _top_chats(db_path, count):
+    import sqlite3
+    conn = sqlite3.connect(db_path)
+    rows = conn.execute("SELECT chat_row_id FROM message GROUP BY chat_row_id ORDER BY COUNT(*) DESC LIMIT ?",
+                        (count,)).fetchall()
+    conn.close()
+    return [r[0] for r in rows]
+
+
+def bench_messages(db_path, requests, batch, pages):
+    viewer = _load_viewer(db_path)
+    client = viewer.app.test_client()
+    chats = _top_chats(db_path, max(1, requests // pages))
+    first_page, deep_pages, rows, urls = [], [], 0, []
+    start = time.perf_counter()
+    for chat_id in chats:
+        cursor = None
+        for page in range(pages):
+            url = f"/messages?chat_id={chat_id}&limit={batch}&order=desc"
+            if cursor:
+                url += f"&cursor={cursor}"
+            urls.append(url)
+            elapsed, response = _timed_get(client, url)
+            data = response.get_json()
+            rows += len(data["messages"])
+            (first_page if page == 0 else deep_pages).append(elapsed)
+            cursor = data["older_cursor"]
+            if not cursor:
+                break
+    total = time.perf_counter() - start
+    result = {"chats": len(chats), "rows": rows, "rows_per_s": round(rows / total, 1),
+              "first_page": latency_stats(first_page)}
+    if deep_pages:
+        result["deep_pages"] = latency_stats(deep_pages)
+    # Going back to chats already scrolled: served from the response cache
+    result["revisit"] = latency_stats([_timed_get(client, url)[0] for url in urls])
+    result["cache_hit_rate"] = viewer.databases().get().responses.stats()["hit_rate"]
+
+    # Jumps to the oldest messages of the largest chat, the worst case for offset-style paging
+    import sqlite3
+    conn = sqlite3.connect(db_path)
+    anchors = [r[0] for r in conn.execute("SELECT _id FROM message WHERE chat_row_id = ? ORDER BY timestamp LIMIT ?",
+                                          (chats[0], requests))]
+    conn.close()
+    result["jump"] = latency_stats([_timed_get(client, f"/messages?anchor_id={a}&limit={batch}")[0] for a in anchors])
+    return result
+
+
+def bench_search(db_path, requests):
+    viewer = _load_viewer(db_path)
+    client = viewer.app.test_client()
+    # Full index build in the background thread, from an empty cache
+    shutil.rmtree(os.path.join(os.path.dirname(db_path), "viewer-cache"), ignore_errors=True)
+    start = time.perf_counter()
+    _timed_get(client, "/search/status")
+    while _timed_get(client, "/search/status")[1].get_json()["state"] == "indexing":
+        time.sleep(0.01)
+    build = time.perf_counter() - start
+    status = _timed_get(client, "/search/status")[1].get_json()
+    if status["state"] != "ready":
+        raise RuntimeError(f"search index failed: {status['error']}")
+
+    # Common single words, a two-word AND and a phrase; then paging deeper into the most common one
+    queries = ["lunch", "tomorrow", "meeting tomorrow", '"see you"']
+    samples = [_timed_get(client, f"/search?q={urllib.parse.quote(queries[i % len(queries)])}")[0]
+               for i in range(requests)]
+    deep, cursor = [], None
+    for _ in range(requests):
+        url = "/search?q=lunch" + (f"&cursor={cursor}" if cursor else "")
+        elapsed, response = _timed_get(client, url)
+        deep.append(elapsed)
+        cursor = response.get_json()["next_cursor"]
+        if not cursor:
+            break
+    return {"build_seconds": round(build, 3), "rows": status["rows"], **latency_stats(samples),
+            "pages": latency_stats(deep)}
+
+
+def _run_stage(fn, args):
+    result = fn(*args)
+    result["peak_rss_mb"] = peak_rss_mb()
+    return result
+
+
+def run_stage(fn, *args):
+    # Each stage runs in a fresh process so peak RSS belongs to that stage alone
+    ctx = multiprocessing.get_context("spawn")
+    with ctx.Pool(1) as pool:
+        return pool.apply(_run_stage, (fn, args))
+
+
+def prepare_inputs(args):
+    os.makedirs(args.workdir, exist_ok=True)
+    db_name = f"msgstore-{args.messages}msg-{args.chats}chats-skew{args.skew}{'-legacy' if args.legacy else ''}.db"
+    db_path = source_path = os.path.join(args.workdir, db_name)
+    if not os.path.exists(db_path):
+        print(f"[*] Generating {db_path}...")
+        generate_msgstore(db_path, args.messages, args.chats, args.skew, legacy=args.legacy)
+    if not args.raw_db:
+        # What the viewer opens after a real extraction
+        viewer_path = viewer_db.viewer_db_path(db_path)
+        if not os.path.exists(viewer_path) or os.path.getmtime(viewer_path) < os.path.getmtime(db_path):
+            print(f"[*] Building {viewer_path}...")
+            viewer_db.build_viewer_db(db_path)
+        db_path = viewer_path
+
+    ab_name = f"backup-{args.ab_size_mb}mb-{'z' if not args.no_compress else 'raw'}-{'enc' if args.password else 'plain'}.ab"
+    ab_path = os.path.join(args.workdir, ab_name)
+    if not os.path.exists(ab_path):
+        print(f"[*] Generating {ab_path}...")
+        generate_backup(ab_path, args.ab_size_mb, not args.no_compress, args.password)
+    return ab_path, db_path, source_path
+
+
+def flatten(d, prefix=""):
+    out = {}
+    for key, value in d.items():
+        name = f"{prefix}{key}"
+        if isinstance(value, dict):
+            out.update(flatten(value, name + "."))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            out[name] = value
+    return out
+
+
+def compare(previous, current, threshold):
+    old, new = flatten(previous["results"]), flatten(current["results"])
+    regressions = []
+    for name in sorted(old.keys() & new.keys()):
+        if not old[name] or name.endswith(NOT_COMPARED):
+            continue
+        change = (new[name] - old[name]) / old[name]
+        worse = -change if name.endswith(HIGHER_IS_BETTER) else change
+        flag = "  REGRESSION" if worse > threshold else ""
+        print(f"  {name:45} {old[name]:>12} -> {new[name]:>12} ({change:+.1%}){flag}")
+        if flag:
+            regressions.append(name)
+    return regressions
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Benchmark decode, extraction and the viewer's /, /messages "
+                                                 "and /search")
+    parser.add_argument("--workdir", default=os.path.join(BENCH_DIR, "work"), help="where generated inputs are cached")
+    parser.add_argument("--results-dir", default=os.path.join(BENCH_DIR, "results"))
+    parser.add_argument("--ab-size-mb", type=int, default=256)
+    parser.add_argument("--no-compress", action="store_true")
+    parser.add_argument("--password", help="benchmark an encrypted backup")
+    parser.add_argument("--messages", type=int, default=1_000_000)
+    parser.add_argument("--chats", type=int, default=2000)
+    parser.add_argument("--skew", type=float, default=1.1)
+    parser.add_argument("--requests", type=int, default=100, help="requests per viewer endpoint")
+    parser.add_argument("--batch", type=int, default=400, help="/messages page size")
+    parser.add_argument("--pages", type=int, default=10, help="pages scrolled per chat")
+    parser.add_argument("--raw-db", action="store_true", help="benchmark the viewer on msgstore.db instead of the "
+                                                                  "viewer copy whatsapp.py builds")
+    parser.add_argument("--legacy", action="store_true", help="generate the msgstore.db in the WhatsApp 2.11 layout, "
+                                                                  "which the viewer copy converts")
+    parser.add_argument("--stages", default="decode,extract,viewer_db,index,messages,search")
+    parser.add_argument("--compare", help="previous results JSON to compare against")
+    parser.add_argument("--threshold", type=float, default=0.1, help="relative slowdown reported as a regression")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    ab_path, db_path, source_path = prepare_inputs(args)
+    stages = args.stages.split(",")
+    stage_fns = {
+        "decode": (bench_decode, (ab_path, args.password)),
+        "extract": (bench_extract, (ab_path, args.password)),
+        "viewer_db": (bench_viewer_db, (source_path,)),
+        "index": (bench_index, (db_path, args.requests)),
+        "messages": (bench_messages, (db_path, args.requests, args.batch, args.pages)),
+        "search": (bench_search, (db_path, args.requests)),
+    }
+
+    results = {}
+    for stage in stages:
+        fn, fn_args = stage_fns[stage]
+        print(f"[*] Running {stage}...")
+        results[stage] = run_stage(fn, *fn_args)
+        print(json.dumps(results[stage], indent=2))
+
+    report = {
+        "time": datetime.now().isoformat(timespec="seconds"),
+        "host": {"platform": platform.platform(), "python": platform.python_version(), "cpus": os.cpu_count()},
+        "params": {k: v for k, v in vars(args).items() if k not in ("compare", "password")},
+        "inputs": {"ab": os.path.basename(ab_path), "msgstore": os.path.basename(db_path)},
+        "results": results,
+    }
+    os.makedirs(args.results_dir, exist_ok=True)
+    out = os.path.join(args.results_dir, f"bench-{datetime.now().strftime('%Y-%m-%d-%H-%M-%S')}.json")
+    with open(out, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(f"[✔] Results saved -> {out}")
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            previous = json.load(f)
+        print(f"[*] Compared with {args.compare}:")
+        regressions = compare(previous, report, args.threshold)
+        if regressions:
+            print(f"[✖] {len(regressions)} regressions above {args.threshold:.0%}")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,19 @@
+# Shell commands whatsapp.py sends to the device, shared with adb_fake_server.py so its recordings answer them
+
+# Separates the outputs of the batched metadata script
+METADATA_MARKER = "---whatsapp-extractor---"
+VERSION_QUERY = "(dumpsys package com.whatsapp | grep versionName) 2>/dev/null || dumpsys package com.whatsapp"
+# SDK level, APK path, versionName (filtered on the device when it has grep) and shared storage path
+METADATA_QUERIES = [
+    "getprop ro.build.version.sdk",
+    "pm path com.whatsapp",
+    VERSION_QUERY,
+    "echo $EXTERNAL_STORAGE",
+]
+# All of METADATA_QUERIES in one shell round trip
+METADATA_SCRIPT = f"; echo {METADATA_MARKER}; ".join(METADATA_QUERIES)
+
+
+def file_info_query(remote_path):
+    # sha256sum only exists from Android 6 (toybox) on; older devices can only be matched by the size from ls -l
+    return f"sha256sum {remote_path} 2>/dev/null || ls -l {remote_path}"
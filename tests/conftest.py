@@ -0,0 +1,53 @@
+import os
+import subprocess
+import sys
+
+import pytest
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# The scripts import each other as top-level modules, the viewer's from ui/, the generators' from bench/
+sys.path.insert(0, ROOT_DIR)
+sys.path.insert(0, os.path.join(ROOT_DIR, "ui"))
+sys.path.insert(0, os.path.join(ROOT_DIR, "bench"))
+
+
+@pytest.fixture
+def whatsapp_config(tmp_path):
+    """A config file with DATA_DIR and LOGS_DIR under tmp_path, for WHATSAPP_CONFIG."""
+    path = tmp_path / "whatsapp_config.py"
+    path.write_text(
+        f"ADB_PATH = 'adb'\nABE_JAR_PATH = 'abe.jar'\nLEGACY_WHATSAPP_APK = 'legacy.apk'\n"
+        f"DATA_DIR = {str(tmp_path / 'data')!r}\nLOGS_DIR = {str(tmp_path / 'logs')!r}\nBACKUP_PASSWORD = ''\n")
+    return path
+
+
+@pytest.fixture
+def whatsapp(monkeypatch, whatsapp_config):
+    """whatsapp.py imported fresh with the whatsapp_config fixture."""
+    monkeypatch.setenv("WHATSAPP_CONFIG", str(whatsapp_config))
+    monkeypatch.delitem(sys.modules, "whatsapp", raising=False)
+    # Importing it installs a crash logger as sys.excepthook
+    monkeypatch.setattr(sys, "excepthook", sys.excepthook)
+    import whatsapp
+    yield whatsapp
+    whatsapp.close_log()
+
+
+@pytest.fixture
+def run_whatsapp(tmp_path, whatsapp_config):
+    """Runs whatsapp.py with its arguments in a subprocess using the whatsapp_config fixture, and checks that it
+    wrote nothing to its working directory or the repository."""
+    cwd = tmp_path / "cwd"
+    cwd.mkdir()
+    env = {**os.environ, "WHATSAPP_CONFIG": str(whatsapp_config)}
+
+    def run(*args):
+        before = sorted(os.listdir(ROOT_DIR))
+        result = subprocess.run([sys.executable, os.path.join(ROOT_DIR, "whatsapp.py"), *args], env=env, cwd=cwd,
+                                capture_output=True, text=True)
+        assert not os.listdir(cwd)
+        assert sorted(os.listdir(ROOT_DIR)) == before
+        assert (tmp_path / "logs").is_dir()
+        return result
+
+    return run
@@ -0,0 +1,28 @@
+import adb_client
+import adb_fake_server
+import device_commands
+
+
+def test_metadata_script_is_recorded():
+    server = adb_fake_server.FakeAdbServer().start()
+    try:
+        output = adb_client.AdbClient(port=server.port).shell(device_commands.METADATA_SCRIPT)
+    finally:
+        server.shutdown()
+    assert output.count(device_commands.METADATA_MARKER) == 3
+    assert "not found" not in output
+
+
+def test_replay_pipeline(tmp_path):
+    server = adb_fake_server.FakeAdbServer().start()
+    try:
+        replay = adb_fake_server.replay_pipeline(server, str(tmp_path))
+    finally:
+        server.shutdown()
+    assert replay["metadata"]["sdk"] == "19"
+    assert replay["metadata"]["apk_path"] == adb_fake_server.APK_PATH
+    assert replay["metadata"]["version"] == "2.24.1.6"
+    assert replay["metadata"]["sd_path"] == "/storage/emulated/legacy"
+    assert set(replay["steps"]) == set(adb_fake_server.REPLAY_STEPS)
+    assert replay["apk_matches"]
+    assert (tmp_path / "data" / "WhatsApp-backup-2.24.1.6.apk").stat().st_size == adb_fake_server.APK_SIZE
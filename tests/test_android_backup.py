@@ -0,0 +1,68 @@
+import hashlib
+import io
+import os
+import tarfile
+
+import pytest
+
+import android_backup
+
+PAYLOAD = os.urandom(300_000) + b"whatsapp " * 200_000
+
+
+class KeepOpen(io.BytesIO):
+    # AndroidBackupWriter closes its file, the test still reads it afterwards
+    def close(self):
+        pass
+
+
+def _write(data, compressed=True, password=None):
+    out = KeepOpen()
+    with android_backup.AndroidBackupWriter(out, compressed=compressed, password=password, rounds=1000) as writer:
+        # Uneven writes, so blocks and deflate output do not line up with them
+        for i in range(0, len(data), 77_777):
+            writer.write(data[i:i + 77_777])
+    return out.getvalue()
+
+
+@pytest.mark.parametrize("compressed", [True, False])
+@pytest.mark.parametrize("password", [None, "pässword"])
+def test_round_trip(compressed, password):
+    ab = _write(PAYLOAD, compressed, password)
+    reader = android_backup.AndroidBackupReader(io.BytesIO(ab), password, chunk_size=4096)
+    assert reader.header["compressed"] == compressed
+    assert reader.header["encryption"] == ("AES-256" if password else "none")
+    assert b"".join(reader.chunks()) == PAYLOAD
+    assert reader.bytes_out == len(PAYLOAD)
+
+
+def test_wrong_password():
+    ab = _write(b"data", password="right")
+    with pytest.raises(android_backup.BackupPasswordError):
+        android_backup.AndroidBackupReader(io.BytesIO(ab), "wrong")
+
+
+def test_truncated_stream():
+    ab = _write(PAYLOAD)
+    reader = android_backup.AndroidBackupReader(io.BytesIO(ab[:len(ab) // 2]))
+    with pytest.raises(android_backup.BackupFormatError):
+        b"".join(reader.chunks())
+
+
+def test_extract_members(tmp_path):
+    files = {"apps/com.whatsapp/f/key": os.urandom(158), "apps/com.whatsapp/db/msgstore.db": os.urandom(200_000),
+             "apps/com.whatsapp/db/wa.db": os.urandom(1000), "apps/com.whatsapp/sp/prefs.xml": b"<map />"}
+    tar = io.BytesIO()
+    with tarfile.open(fileobj=tar, mode="w", format=tarfile.USTAR_FORMAT) as t:
+        for name, data in files.items():
+            info = tarfile.TarInfo(name)
+            info.size = len(data)
+            t.addfile(info, io.BytesIO(data))
+    ab = _write(tar.getvalue(), password="pw")
+    reader = android_backup.AndroidBackupReader(io.BytesIO(ab), "pw")
+    extracted = android_backup.extract_members(reader, str(tmp_path), ["f/key", "db/*"], prefix="apps/com.whatsapp/")
+    assert sorted(rel for rel, _, _, _ in extracted) == ["db/msgstore.db", "db/wa.db", "f/key"]
+    for rel, dst, size, sha256 in extracted:
+        data = files["apps/com.whatsapp/" + rel]
+        assert open(dst, "rb").read() == data
+        assert (size, sha256) == (len(data), hashlib.sha256(data).hexdigest())
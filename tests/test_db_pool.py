@@ -0,0 +1,22 @@
+import os
+import sqlite3
+import stat
+
+import db_pool
+import viewer_db
+
+
+def test_viewer_copy_is_immutable(tmp_path):
+    msgstore = tmp_path / "msgstore.db"
+    conn = sqlite3.connect(msgstore)
+    conn.execute("CREATE TABLE message (_id INTEGER PRIMARY KEY, text_data TEXT)")
+    conn.commit()
+    conn.close()
+    out, _ = viewer_db.build_viewer_db(str(msgstore))
+    # Read-only by its mode bits even when the viewer runs as root, who may write it anyway
+    assert db_pool._is_immutable(out)
+    assert not db_pool._is_immutable(str(msgstore))
+    os.chmod(msgstore, stat.S_IREAD)
+    open(str(msgstore) + "-wal", "wb").close()
+    # A WAL next to it means someone may still write to it
+    assert not db_pool._is_immutable(str(msgstore))
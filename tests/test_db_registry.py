@@ -0,0 +1,40 @@
+import threading
+import time
+
+import db_registry
+
+
+def test_slow_open_blocks_only_its_database(tmp_path):
+    for name in ("slow", "fast"):
+        (tmp_path / name).mkdir()
+        (tmp_path / name / "msgstore.db").write_bytes(b"")
+    opened = []
+    release = threading.Event()
+
+    class Database:
+        def __init__(self, entry):
+            opened.append(entry["label"])
+            if entry["label"] == "slow":
+                # A big legacy database being converted
+                release.wait(5)
+            self.source = entry["path"]
+
+        def close(self):
+            pass
+
+    registry = db_registry.Registry(str(tmp_path), None, Database)
+    ids = {entry["label"]: entry["id"] for entry in registry.entries()}
+    slow = [threading.Thread(target=registry.get, args=(ids["slow"],)) for _ in range(3)]
+    for thread in slow:
+        thread.start()
+    while "slow" not in opened:
+        time.sleep(0.01)
+    start = time.monotonic()
+    registry.get(ids["fast"])
+    assert time.monotonic() - start < 1
+    release.set()
+    for thread in slow:
+        thread.join()
+    # Opened once, by the first of the requests waiting for it
+    assert sorted(opened) == ["fast", "slow"]
+    assert set(registry.stats()["open"]) == set(ids.values())
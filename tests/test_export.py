@@ -0,0 +1,105 @@
+import csv
+import gzip
+import json
+import os
+import sqlite3
+
+import pytest
+
+import export
+import gen_msgstore
+
+HOSTILE_TEXT = '<script>alert("x")</script> & more\nsecond line, with "quotes"'
+
+
+@pytest.fixture
+def msgstore(tmp_path):
+    path = str(tmp_path / "msgstore.db")
+    gen_msgstore.generate_msgstore(path, messages=600, chats=6, seed=3)
+    conn = sqlite3.connect(path)
+    conn.execute("UPDATE message SET text_data = ? WHERE _id = 1", (HOSTILE_TEXT,))
+    expected = {}
+    for message_id, chat_id, text in conn.execute(
+            "SELECT _id, chat_row_id, text_data FROM message ORDER BY chat_row_id, timestamp, _id"):
+        expected.setdefault(chat_id, []).append((message_id, text or ""))
+    conn.commit()
+    conn.close()
+    return path, expected
+
+
+def _check_index(out_dir, expected, fmt, compress=False):
+    with open(os.path.join(out_dir, "chats.json"), encoding="utf-8") as f:
+        chats = json.load(f)
+    assert {chat["chat_id"]: chat["messages"] for chat in chats} == {k: len(v) for k, v in expected.items()}
+    files = sorted(chat["file"] for chat in chats)
+    assert all(name.endswith(f".{fmt}" + (".gz" if compress else "")) for name in files)
+    # Nothing left under a temporary name
+    assert sorted(os.listdir(out_dir)) == sorted(files + ["chats.json"] + (["index.html"] if fmt == "html" else []))
+    return chats
+
+
+def test_jsonl_export(msgstore, tmp_path):
+    db_path, expected = msgstore
+    out_dir = str(tmp_path / "out")
+    exported, failed = export.export(db_path, out_dir, "jsonl", workers=2)
+    assert not failed and len(exported) == len(expected)
+    for chat in _check_index(out_dir, expected, "jsonl"):
+        with open(os.path.join(out_dir, chat["file"]), encoding="utf-8") as f:
+            rows = [json.loads(line) for line in f]
+        assert all(tuple(row) == export.EXPORT_FIELDS for row in rows)
+        assert [(row["id"], row["text"]) for row in rows] == expected[chat["chat_id"]]
+        assert {row["chat_id"] for row in rows} == {chat["chat_id"]}
+        assert [row["timestamp_ms"] for row in rows] == sorted(row["timestamp_ms"] for row in rows)
+
+
+def test_csv_export_gzip(msgstore, tmp_path):
+    db_path, expected = msgstore
+    out_dir = str(tmp_path / "out")
+    _, failed = export.export(db_path, out_dir, "csv", compress=True, workers=2)
+    assert not failed
+    for chat in _check_index(out_dir, expected, "csv", compress=True):
+        with gzip.open(os.path.join(out_dir, chat["file"]), "rt", encoding="utf-8", newline="") as f:
+            header, *rows = list(csv.reader(f))
+        assert tuple(header) == export.EXPORT_FIELDS
+        assert [(int(row[0]), row[header.index("text")]) for row in rows] == expected[chat["chat_id"]]
+
+
+def test_html_export(msgstore, tmp_path):
+    db_path, expected = msgstore
+    out_dir = str(tmp_path / "out")
+    _, failed = export.export(db_path, out_dir, "html", workers=2)
+    assert not failed
+    chats = _check_index(out_dir, expected, "html")
+    with open(os.path.join(out_dir, "index.html"), encoding="utf-8") as f:
+        index = f.read()
+    for chat in chats:
+        assert f'<a href="{chat["file"]}">' in index
+        with open(os.path.join(out_dir, chat["file"]), encoding="utf-8") as f:
+            page = f.read()
+        assert page.startswith("<!DOCTYPE html>") and page.endswith(export.HTML_TAIL)
+        positions = [page.index(f'id="m{message_id}"') for message_id, _ in expected[chat["chat_id"]]]
+        assert positions == sorted(positions)
+        assert "<script>" not in page
+    chat_1 = next(chat for chat in chats if 1 in [m for m, _ in expected[chat["chat_id"]]])
+    with open(os.path.join(out_dir, chat_1["file"]), encoding="utf-8") as f:
+        assert "&lt;script&gt;alert(&quot;x&quot;)&lt;/script&gt; &amp; more" in f.read()
+
+
+def test_failed_chat_leaves_the_previous_file(msgstore, tmp_path, monkeypatch):
+    db_path, expected = msgstore
+    out_dir = tmp_path / "out"
+    out_dir.mkdir()
+    chat_id = next(iter(expected))
+    chat = {"chat_id": chat_id, "chat_name": "Chat", "messages": len(expected[chat_id])}
+    first = export.export_chat(db_path, chat, str(out_dir), "jsonl", False)
+    before = (out_dir / first["file"]).read_bytes()
+
+    def fail_midway(out, rows):
+        out.write(json.dumps(next(rows)) + "\n")
+        raise OSError("disk full")
+
+    monkeypatch.setattr(export, "_write_jsonl", fail_midway)
+    result = export.export_chat(db_path, chat, str(out_dir), "jsonl", False)
+    assert result["error"] == "OSError: disk full"
+    # The complete earlier export is still there, and no partial file
+    assert os.listdir(out_dir) == [first["file"]] and (out_dir / first["file"]).read_bytes() == before
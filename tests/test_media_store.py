@@ -0,0 +1,88 @@
+import os
+import random
+import threading
+import time
+
+import pytest
+
+import app
+import media_store
+
+DEVICE = "/storage/emulated/0/WhatsApp/"
+
+
+def _touch(root, *paths):
+    for path in paths:
+        (root / path).parent.mkdir(parents=True, exist_ok=True)
+        (root / path).write_bytes(b"")
+
+
+def test_lookup_needs_a_whole_path_match(tmp_path):
+    _touch(tmp_path, "WhatsApp/Media/WhatsApp Images/Sent/IMG-1.jpg", "Other/IMG-2.jpg", "Other/Sent/IMG-4.jpg",
+           "WhatsApp/Media/WhatsApp Images/Sent/IMG-3.jpg", "old/WhatsApp/Media/WhatsApp Images/Sent/IMG-3.jpg")
+    index = media_store.MediaIndex(str(tmp_path))
+    sent = tmp_path / "WhatsApp" / "Media" / "WhatsApp Images" / "Sent"
+    assert index.lookup("Media/WhatsApp Images/Sent/IMG-1.jpg") == str(sent / "IMG-1.jpg")
+    assert index.lookup(DEVICE + "Media/WhatsApp Images/Sent/IMG-1.jpg") == str(sent / "IMG-1.jpg")
+    assert index.lookup("WhatsApp/Media/WhatsApp Images/Sent/IMG-1.jpg") == str(sent / "IMG-1.jpg")
+    # Same file name elsewhere
+    assert index.lookup("Media/WhatsApp Images/Sent/IMG-2.jpg") is None
+    assert index.lookup("IMG-1.jpg") is None
+    # Same parent and name, different folders above them
+    assert index.lookup("Media/WhatsApp Images/Sent/IMG-4.jpg") is None
+    # Two copies of the same path
+    assert index.lookup("Media/WhatsApp Images/Sent/IMG-3.jpg") is None
+
+
+def test_lookup_in_a_media_subfolder(tmp_path):
+    sent = tmp_path / "Sent"
+    _touch(sent, "IMG-1.jpg")
+    index = media_store.MediaIndex(str(sent))
+    assert index.lookup(DEVICE + "Media/WhatsApp Images/Sent/IMG-1.jpg") == str(sent / "IMG-1.jpg")
+    assert index.lookup("IMG-1.jpg") == str(sent / "IMG-1.jpg")
+    assert index.lookup(DEVICE + "Media/WhatsApp Images/Private/IMG-1.jpg") is None
+
+
+def _image(path, seed):
+    Image, _ = media_store._pillow()
+    path.parent.mkdir(parents=True, exist_ok=True)
+    # Noise, so every thumbnail is about the same (large) size
+    Image.frombytes("RGB", (640, 480), random.Random(seed).randbytes(640 * 480 * 3)).save(path, "JPEG")
+    return str(path)
+
+
+def test_thumbnails_beyond_the_limit_are_evicted_least_recently_used_first(tmp_path):
+    images = [_image(tmp_path / "media" / f"IMG-{i}.jpg", i) for i in range(6)]
+    cache = media_store.ThumbnailCache(str(tmp_path / "thumbnails"), max_bytes=1 << 30)
+    first = cache.get(images[0])
+    # Room for about four thumbnails
+    cache.max_bytes = os.path.getsize(first) * 4.5
+    thumbnails = [first] + [cache.get(path) for path in images[1:4]]
+    time.sleep(0.01)
+    # Used again, so the next eviction spares it
+    assert cache.get(images[0]) == first
+    thumbnails += [cache.get(path) for path in images[4:]]
+    on_disk = sum(size for _, size, _ in cache._cached_files())
+    assert cache.total == on_disk <= cache.max_bytes
+    assert [os.path.exists(path) for path in thumbnails] == [True, False, False, True, True, True]
+    assert cache.hits == 1 and cache.made == 6
+
+
+def test_thumbnail_not_ready_in_time_is_pending(tmp_path, monkeypatch):
+    image = _image(tmp_path / "media" / "WhatsApp Images" / "IMG-1.jpg", 1)
+    cache = media_store.ThumbnailCache(str(tmp_path / "thumbnails"), max_bytes=1 << 20)
+    release = threading.Event()
+    make = cache._make
+    monkeypatch.setattr(cache, "_make", lambda path, target: release.wait(5) and make(path, target))
+    with pytest.raises(media_store.ThumbnailPending):
+        cache.get(image, wait=0.05)
+    monkeypatch.setattr(app, "MEDIA_ROOT", str(tmp_path / "media"))
+    monkeypatch.setattr(app, "thumbnail_cache", cache)
+    response = app.app.test_client().get("/media?path=WhatsApp Images/IMG-1.jpg&thumb=1")
+    assert response.status_code == 202 and response.headers["Retry-After"] == "1"
+    release.set()
+    # The job carried on, and the thumbnail is served once made
+    assert cache.get(image) is not None
+    response = app.app.test_client().get("/media?path=WhatsApp Images/IMG-1.jpg&thumb=1")
+    assert response.status_code == 200 and response.mimetype == "image/jpeg"
+    response.close()
@@ -0,0 +1,72 @@
+import concurrent.futures
+import glob
+import hashlib
+import os
+import subprocess
+import sys
+import threading
+
+import pytest
+
+import gen_ab
+
+
+def _fake_backup(whatsapp, monkeypatch, tmp_path):
+    """start_backup writes a generated .ab where adb would, with a process that has already exited."""
+    def start_backup():
+        ab_file = str(tmp_path / "data" / "whatsapp.ab")
+        gen_ab.generate_backup(ab_file, size_mb=2)
+        return ab_file, subprocess.Popen([sys.executable, "-c", "pass"])
+
+    monkeypatch.setattr(whatsapp, "start_backup", start_backup)
+    hashed = []
+    file_sha256 = whatsapp.file_sha256
+    monkeypatch.setattr(whatsapp, "file_sha256", lambda path: hashed.append(path) or file_sha256(path))
+    return hashed
+
+
+def test_backup_is_hashed_by_the_decode(whatsapp, monkeypatch, tmp_path):
+    monkeypatch.setattr(whatsapp, "AB_FOLLOW", False)
+    hashed = _fake_backup(whatsapp, monkeypatch, tmp_path)
+    whatsapp.set_stage("backup")
+    whatsapp.complete_step("backup", whatsapp.step_backup())
+    steps = whatsapp.checkpoint["steps"]
+    assert "extract" in steps
+    ab_file = tmp_path / "data" / "whatsapp.ab"
+    assert steps["backup"]["artifacts"] == [{"path": "whatsapp.ab", "size": ab_file.stat().st_size,
+                                             "sha256": hashlib.sha256(ab_file.read_bytes()).hexdigest()}]
+    # No separate pass over the .ab: its SHA-256 came from the decode
+    assert str(ab_file) not in hashed
+
+
+def test_failed_decode_keeps_the_backup_checkpoint(whatsapp, monkeypatch, tmp_path):
+    monkeypatch.setattr(whatsapp, "AB_FOLLOW", False)
+    _fake_backup(whatsapp, monkeypatch, tmp_path)
+    # Encrypted, but the config says the backup has no password
+    generate_backup = gen_ab.generate_backup
+    monkeypatch.setattr(gen_ab, "generate_backup", lambda path, size_mb: generate_backup(path, size_mb, password="pw"))
+    whatsapp.set_stage("backup")
+    with pytest.raises(SystemExit):
+        whatsapp.step_backup()
+    # --resume only has to redo the decode
+    assert "backup" in whatsapp.checkpoint["steps"] and "extract" not in whatsapp.checkpoint["steps"]
+
+
+def test_fleet_apk_pulls_run_in_parallel(whatsapp, monkeypatch, tmp_path):
+    monkeypatch.setattr(whatsapp, "APK_STORE_LOCK", threading.Lock())
+    monkeypatch.setattr(whatsapp, "device_file_info", lambda apk_path: (None, 4096))
+    both_pulling = threading.Barrier(2)
+
+    def adb_pull(remote_path, local_path):
+        # Passed only if neither worker holds the store lock while it pulls
+        both_pulling.wait(timeout=5)
+        with open(local_path, "wb") as f:
+            f.write(remote_path.encode().ljust(4096, b"\0"))
+
+    monkeypatch.setattr(whatsapp, "adb_pull", adb_pull)
+    with concurrent.futures.ThreadPoolExecutor(2) as pool:
+        outs = list(pool.map(lambda version: whatsapp.backup_apk(f"/data/app/{version}.apk", version), ["2.24", "2.25"]))
+    for out, version in zip(outs, ["2.24", "2.25"]):
+        stored = glob.glob(str(tmp_path / "data" / "apk-store" / version / "*.apk"))
+        assert len(stored) == 1 and os.path.samefile(stored[0], out)
+    assert not glob.glob(str(tmp_path / "data" / "*.tmp"))
@@ -0,0 +1,56 @@
+import json
+import time
+
+
+def _lines(path):
+    return path.read_text(encoding="utf-8").splitlines() if path.exists() else []
+
+
+def test_records_are_written_and_flushed_on_close(whatsapp, tmp_path):
+    path = tmp_path / "run.jsonl"
+    logger = whatsapp.RunLogger(str(path))
+    records = [{"msg": f"line {i}", "n": i, "path": tmp_path} for i in range(5000)]
+    for record in records:
+        logger.write(record)
+    logger.close()
+    assert logger.thread is None
+    lines = path.read_text(encoding="utf-8").splitlines()
+    assert [json.loads(line) for line in lines] == [{**record, "path": str(tmp_path)} for record in records]
+    # Writing after close starts a new writer that appends
+    logger.write({"msg": "again"})
+    logger.close()
+    assert json.loads(path.read_text(encoding="utf-8").splitlines()[-1]) == {"msg": "again"}
+
+
+def test_writer_flushes_once_the_queue_is_empty(whatsapp, tmp_path):
+    path = tmp_path / "run.jsonl"
+    logger = whatsapp.RunLogger(str(path))
+    for i in range(100):
+        logger.write({"msg": f"line {i}"})
+    # Readable before close, once the writer has caught up
+    deadline = time.monotonic() + 5
+    while time.monotonic() < deadline and len(_lines(path)) < 100:
+        time.sleep(0.01)
+    assert logger.thread.is_alive()
+    assert len(_lines(path)) == 100
+    logger.close()
+
+
+def test_text_format(whatsapp, tmp_path):
+    path = tmp_path / "run.log"
+    logger = whatsapp.RunLogger(str(path), "text")
+    logger.write({"msg": "[*] Running", "stdout": "out", "stderr": "", "metadata": {"model": "X"}})
+    logger.write({"msg": "[✖] Crashed", "traceback": "Traceback ..."})
+    logger.close()
+    assert path.read_text(encoding="utf-8") == \
+        '[*] Running\nout\n{\n  "model": "X"\n}\n[✖] Crashed\nTraceback ...\n'
+
+
+def test_log_record_goes_to_the_run_log(whatsapp, tmp_path):
+    whatsapp.set_stage("metadata")
+    whatsapp.log_record("[i] Collected", model="X")
+    whatsapp.close_log()
+    assert whatsapp.LOG_FILE.startswith(str(tmp_path / "logs"))
+    with open(whatsapp.LOG_FILE, encoding="utf-8") as f:
+        record = json.loads(f.readline())
+    assert (record["stage"], record["msg"], record["model"]) == ("metadata", "[i] Collected", "X")
@@ -0,0 +1,21 @@
+import os
+
+import db_pool
+import search_index
+
+
+def test_read_only_fallback_is_per_database(tmp_path):
+    # A file where the cache folder should be: the index cannot be created there
+    (tmp_path / "viewer-cache").write_text("")
+    paths = []
+    for folder in ("a", "b"):
+        db_path = str(tmp_path / folder / "msgstore.viewer.db")
+        index = search_index.SearchIndex(db_path, str(tmp_path / "viewer-cache" / "msgstore.viewer.db.fts.db"),
+                                         db_pool.ConnectionPool(db_path))
+        index._open_index().close()
+        paths.append(index.index_path)
+    for path in paths:
+        for suffix in ("", "-wal", "-shm"):
+            if os.path.exists(path + suffix):
+                os.remove(path + suffix)
+    assert paths[0] != paths[1]
@@ -0,0 +1,184 @@
+import json
+import os
+import sqlite3
+import zlib
+
+import pytest
+
+import app
+import db_pool
+import response_cache
+import search_index
+import viewer_db
+
+WORDS = ["alpha", "Bravo", "charlie", "delta", "echo", "foxtrot"]
+
+
+@pytest.fixture
+def msgstore(tmp_path, monkeypatch):
+    """A modern msgstore.db with two chats whose messages come in groups sharing the same timestamp."""
+    path = tmp_path / "msgstore.db"
+    conn = sqlite3.connect(path)
+    conn.executescript(viewer_db.MODERN_SCHEMA)
+    conn.executemany("INSERT INTO jid (_id, user, server, raw_string) VALUES (?, ?, 's.whatsapp.net', ?)",
+                     [(1, "111", "111@s.whatsapp.net"), (2, "222", "222@s.whatsapp.net")])
+    conn.executemany("INSERT INTO chat (_id, jid_row_id, sort_timestamp) VALUES (?, ?, 0)", [(1, 1), (2, 2)])
+    rows = []
+    for i in range(1, 201):
+        text = " ".join(WORDS[(i * k) % len(WORDS)] for k in (1, 2, 5)) if i % 7 else None
+        # Groups of 10 messages sent in the same millisecond, ids not in timestamp order
+        rows.append((i, 1 + i % 2, 0, f"key{i}", (i * 37 % 200) // 10 * 1000, text))
+    conn.executemany("INSERT INTO message (_id, chat_row_id, from_me, key_id, timestamp, text_data) "
+                     "VALUES (?, ?, ?, ?, ?, ?)", rows)
+    conn.executemany("INSERT INTO message_quoted (message_row_id, chat_row_id, text_data) VALUES (?, ?, ?)",
+                     [(i, 1 + i % 2, "quoting delta") for i in range(7, 201, 7)])
+    conn.commit()
+    conn.close()
+    monkeypatch.setattr(app, "DB_PATH", str(path))
+    monkeypatch.setattr(app, "DATA_ROOT", None)
+    monkeypatch.setattr(app, "CACHE_DIR", str(tmp_path / "cache"))
+    return path
+
+
+def _page_through(client, chat_id, order):
+    ids, cursor_key = [], "older_cursor" if order == "desc" else "newer_cursor"
+    page = client.get(f"/messages?chat_id={chat_id}&limit=7&order={order}").get_json()
+    while True:
+        ids += [message["id"] for message in page["messages"]]
+        if not page[cursor_key]:
+            return ids
+        page = client.get(f"/messages?chat_id={chat_id}&limit=7&cursor={page[cursor_key]}").get_json()
+
+
+def test_cursor_paging_with_equal_timestamps(msgstore):
+    conn = sqlite3.connect(msgstore)
+    expected = [row[0] for row in conn.execute(
+        "SELECT _id FROM message WHERE chat_row_id = 1 ORDER BY timestamp DESC, _id DESC")]
+    conn.close()
+    client = app.app.test_client()
+    assert _page_through(client, 1, "desc") == expected
+    assert _page_through(client, 1, "asc") == expected[::-1]
+
+
+def test_search_matches_like(msgstore, tmp_path):
+    pool = db_pool.ConnectionPool(str(msgstore))
+    index = search_index.SearchIndex(str(msgstore), str(tmp_path / "fts.db"), pool, batch_rows=16)
+    index.ensure_current()
+    index.thread.join()
+    assert index.status["state"] == "ready"
+    conn = sqlite3.connect(msgstore)
+    for word in ("bravo", "DELTA", "foxtrot"):
+        for chat_id in (None, 2):
+            expected = [row[0] for row in conn.execute(
+                "SELECT m._id FROM message m LEFT JOIN message_quoted q ON q.message_row_id = m._id "
+                "WHERE (m.text_data LIKE ? OR q.text_data LIKE ?) AND (? IS NULL OR m.chat_row_id = ?) "
+                "ORDER BY m._id DESC", (f"%{word}%", f"%{word}%", chat_id, chat_id))]
+            assert expected
+            assert [row[0] for row in index.search(word, 1000, chat_id)] == expected
+    conn.close()
+    pool.close()
+
+
+def test_malformed_cursor_is_rejected(msgstore, monkeypatch):
+    client = app.app.test_client()
+    for path, values in (("/messages?chat_id=1&", ["older", {}, 1]), ("/messages?chat_id=1&", ["newer", 5, "x"]),
+                         ("/chats?", [{}, 1]), ("/chats?", [True, 1]), ("/search?q=alpha&", [[1]])):
+        assert client.get(f"{path}cursor={app.encode_cursor(*values)}").status_code == 400
+    # A query that fails still hands its connection back
+    monkeypatch.setattr(app, "chat_summaries", lambda conn: conn.execute("SELECT * FROM no_such_table"))
+    assert client.get("/chats").status_code == 500
+    pool = app.databases().get(None).pool
+    assert pool.opened and len(pool.idle) == pool.opened
+
+
+def test_conditional_requests_and_cached_pages(msgstore):
+    client = app.app.test_client()
+    first = client.get("/chats")
+    assert first.status_code == 200 and first.headers["X-Cache"] == "MISS"
+    etag, last_modified = first.headers["ETag"], first.headers["Last-Modified"]
+    again = client.get("/chats")
+    assert again.headers["X-Cache"] == "HIT" and again.get_data() == first.get_data() and again.headers["ETag"] == etag
+    for headers in ({"If-None-Match": etag}, {"If-Modified-Since": last_modified}):
+        revalidated = client.get("/chats", headers=headers)
+        assert revalidated.status_code == 304 and not revalidated.get_data()
+
+    # A changed database file is a new generation: new validators, nothing served from the old pages
+    conn = sqlite3.connect(msgstore)
+    conn.execute("INSERT INTO jid (_id, user, server, raw_string) VALUES (3, '333', 's.whatsapp.net', "
+                 "'333@s.whatsapp.net')")
+    conn.execute("INSERT INTO chat (_id, jid_row_id, sort_timestamp) VALUES (3, 3, 0)")
+    conn.commit()
+    conn.close()
+    # The file's mtime has a coarse clock; make sure it moved
+    st = os.stat(msgstore)
+    os.utime(msgstore, ns=(st.st_atime_ns, st.st_mtime_ns + 1_000_000_000))
+    changed = client.get("/chats", headers={"If-None-Match": etag})
+    assert changed.status_code == 200 and changed.headers["X-Cache"] == "MISS" and changed.headers["ETag"] != etag
+    assert len(changed.get_json()["chats"]) == 3
+
+
+def test_response_cache_evicts_least_recently_used_by_size():
+    cache = response_cache.ResponseCache(3 * (100 + response_cache.ENTRY_OVERHEAD))
+    for key in "abc":
+        cache.put(1, key, bytes(100))
+    assert cache.get(1, "a") is not None
+    cache.put(1, "d", bytes(100))
+    assert cache.get(1, "b") is None
+    assert [cache.get(1, key) is not None for key in "acd"] == [True, True, True]
+    # Bigger than the whole cache: not kept, nothing evicted for it
+    cache.put(1, "e", bytes(cache.max_bytes))
+    assert cache.get(1, "e") is None and cache.get(1, "a") is not None
+    stats = cache.stats()
+    assert (stats["entries"], stats["bytes"], stats["evictions"]) == (3, cache.max_bytes, 1)
+    # A new generation drops the old entries
+    assert cache.get(2, "a") is None and cache.stats()["entries"] == 0
+
+
+def _ndjson(data):
+    return [json.loads(line) for line in data.decode("utf-8").splitlines()]
+
+
+def test_streamed_page_framing(msgstore):
+    client = app.app.test_client()
+    page = client.get("/messages?chat_id=1&limit=7").get_json()
+    # Buffered, so the test client also closes the stream as a server would
+    response = client.get("/messages?chat_id=1&limit=7&format=ndjson", buffered=True)
+    assert response.mimetype == "application/x-ndjson" and "Content-Encoding" not in response.headers
+    header, *rows, trailer = _ndjson(response.get_data())
+    assert header == {"chat_id": 1, "fields": list(app.STREAM_FIELDS)}
+    assert [dict(zip(header["fields"], row)) for row in rows] == page["messages"]
+    assert trailer == {"count": 7, "older_cursor": page["older_cursor"], "newer_cursor": page["newer_cursor"]}
+
+
+@pytest.mark.parametrize("encoding, wbits", [("gzip", 31), ("deflate", 15)])
+def test_streamed_page_compression(msgstore, encoding, wbits):
+    client = app.app.test_client()
+    plain = client.get("/messages?chat_id=1&limit=50&format=ndjson", buffered=True).get_data()
+    response = client.get("/messages?chat_id=1&limit=50&format=ndjson", headers={"Accept-Encoding": encoding},
+                          buffered=False)
+    assert response.headers["Content-Encoding"] == encoding and response.headers["Vary"] == "Accept-Encoding"
+    decompressor = zlib.decompressobj(wbits)
+    decoded = b""
+    for chunk in response.response:
+        # Every chunk is flushed, so it decodes on its own
+        decoded += decompressor.decompress(chunk)
+        assert decoded.endswith(b"\n")
+    response.close()
+    assert decompressor.eof and decoded == plain
+
+
+def test_disconnected_stream_releases_its_connection(msgstore, monkeypatch):
+    monkeypatch.setattr(app, "STREAM_CHUNK_SIZE", 1)
+    client = app.app.test_client()
+    response = client.get("/messages?chat_id=1&limit=50&format=ndjson", buffered=False)
+    pool = app.databases().get(None).pool
+    chunks = iter(response.response)
+    next(chunks)
+    next(chunks)
+    # Still reading rows from its connection
+    assert len(pool.idle) == pool.opened - 1
+    # The client goes away mid-page
+    response.close()
+    assert len(pool.idle) == pool.opened
+    # And its query slot
+    assert app.query_slots._value == app.MAX_CONCURRENT_QUERIES
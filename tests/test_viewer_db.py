@@ -0,0 +1,132 @@
+import concurrent.futures
+import hashlib
+import os
+import shutil
+import sqlite3
+
+import gen_ab
+import gen_msgstore
+import viewer_db
+
+
+def _wal_msgstore(folder, checkpointed=False):
+    """A msgstore.db in WAL mode as a backup holds it: copied (with -wal and -shm) while WhatsApp had it open."""
+    live = folder / "live"
+    live.mkdir(parents=True)
+    conn = sqlite3.connect(live / "msgstore.db")
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA wal_autocheckpoint=0")
+    conn.execute("CREATE TABLE chat (_id INTEGER PRIMARY KEY, jid_row_id INTEGER, subject TEXT, sort_timestamp INTEGER)")
+    conn.execute("CREATE TABLE message (_id INTEGER PRIMARY KEY, chat_row_id INTEGER, timestamp INTEGER, "
+                 "text_data TEXT)")
+    conn.executemany("INSERT INTO message VALUES (?, 1, ?, ?)", [(i, i * 1000, f"m{i}") for i in range(1, 501)])
+    conn.commit()
+    if checkpointed:
+        conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    extracted = folder / "db"
+    extracted.mkdir()
+    for name in ("msgstore.db", "msgstore.db-wal", "msgstore.db-shm"):
+        if (live / name).exists():
+            shutil.copyfile(live / name, extracted / name)
+    conn.close()
+    return extracted / "msgstore.db"
+
+
+def _hashes(folder):
+    return {name: hashlib.sha256((folder / name).read_bytes()).hexdigest() for name in sorted(os.listdir(folder))}
+
+
+def test_build_leaves_wal_source_untouched(tmp_path):
+    for checkpointed in (False, True):
+        msgstore = _wal_msgstore(tmp_path / str(checkpointed), checkpointed)
+        before = _hashes(msgstore.parent)
+        out, stats = viewer_db.build_viewer_db(str(msgstore), str(tmp_path / f"{checkpointed}.viewer.db"))
+        assert _hashes(msgstore.parent) == before
+        conn = sqlite3.connect(out)
+        # The rows still in the WAL are in the copy
+        assert conn.execute("SELECT COUNT(*) FROM message").fetchone()[0] == 500
+        conn.close()
+        assert not stats.get("cached")
+        assert viewer_db.build_viewer_db(str(msgstore), out)[1]["cached"]
+
+
+def test_batch_then_verify(tmp_path, run_whatsapp):
+    msgstore = _wal_msgstore(tmp_path / "device")
+    (tmp_path / "in").mkdir()
+    gen_ab.generate_backup(str(tmp_path / "in" / "phone.ab"), size_mb=1, msgstore=str(msgstore))
+    batch = run_whatsapp("--batch", str(tmp_path / "in"), "--out", str(tmp_path / "out"), "--jobs", "1")
+    assert batch.returncode == 0, batch.stdout + batch.stderr
+    assert (tmp_path / "out" / "phone" / "com.whatsapp" / "db" / "msgstore.viewer.db").is_file()
+    verify = run_whatsapp("--verify", str(tmp_path / "out" / "phone"))
+    assert verify.returncode == 0, verify.stdout + verify.stderr
+
+
+def test_concurrent_builds_convert_once(tmp_path):
+    msgstore = _wal_msgstore(tmp_path / "device", checkpointed=True)
+    out_path = str(tmp_path / "cache" / "msgstore.viewer.db")
+    (tmp_path / "cache").mkdir()
+    with concurrent.futures.ThreadPoolExecutor(4) as pool:
+        results = list(pool.map(lambda _: viewer_db.build_viewer_db(str(msgstore), out_path), range(4)))
+    assert [stats.get("cached", False) for _, stats in results].count(False) == 1
+    # No temporary file left next to the copy
+    assert sorted(os.listdir(tmp_path / "cache")) == ["msgstore.viewer.db", "msgstore.viewer.db.lock"]
+
+
+def test_batch_job_keeps_extraction_when_viewer_build_fails(tmp_path, whatsapp, monkeypatch):
+    msgstore = _wal_msgstore(tmp_path / "device")
+    gen_ab.generate_backup(str(tmp_path / "phone.ab"), size_mb=1, msgstore=str(msgstore))
+
+    def fail(path):
+        raise sqlite3.DatabaseError("database disk image is malformed")
+
+    monkeypatch.setattr(viewer_db, "build_viewer_db", fail)
+    result = whatsapp.batch_job(str(tmp_path / "phone.ab"), str(tmp_path / "out"), None, ["db/*"], True)
+    assert "error" not in result
+    assert "malformed" in result["warning"]
+    assert result["sha256"] == hashlib.sha256((tmp_path / "phone.ab").read_bytes()).hexdigest()
+    assert "db/msgstore.db" in [name for name, _, _, _ in result["extracted"]]
+
+
+def test_legacy_conversion_matches_modern_rows(tmp_path):
+    modern, legacy = str(tmp_path / "modern.db"), str(tmp_path / "msgstore.db")
+    for path, is_legacy in ((modern, False), (legacy, True)):
+        gen_msgstore.generate_msgstore(path, messages=3000, chats=40, seed=7, legacy=is_legacy)
+    out = viewer_db.legacy_viewer_db(legacy, str(tmp_path / "viewer-cache"))
+    queries = {
+        "chat": "SELECT c._id, j.raw_string, c.subject, COALESCE(c.sort_timestamp, 0) FROM chat c "
+                "JOIN jid j ON j._id = c.jid_row_id ORDER BY c._id",
+        "message": "SELECT m._id, m.chat_row_id, m.from_me, m.key_id, s.raw_string, m.status, m.timestamp, "
+                   "m.received_timestamp, m.message_type, m.text_data FROM message m "
+                   "LEFT JOIN jid s ON s._id = m.sender_jid_row_id ORDER BY m._id",
+        "message_media": "SELECT message_row_id, chat_row_id, file_path, file_size, {url}, mime_type, media_name "
+                         "FROM message_media ORDER BY message_row_id",
+    }
+    expected_conn, converted_conn = sqlite3.connect(modern), sqlite3.connect(out)
+    for table, query in queries.items():
+        expected = expected_conn.execute(query.format(url="direct_path")).fetchall()
+        if table == "message_media":
+            # Legacy media only keep their file name
+            expected = [(row[0], row[1], os.path.basename(row[2]), *row[3:]) for row in expected]
+        assert expected
+        assert converted_conn.execute(query.format(url="message_url")).fetchall() == expected, table
+    expected_conn.close()
+    converted_conn.close()
+
+
+def test_legacy_copy_is_found_without_rehashing(tmp_path, monkeypatch):
+    legacy = str(tmp_path / "msgstore.db")
+    gen_msgstore.generate_msgstore(legacy, messages=500, chats=10, legacy=True)
+    hashed = []
+    source_digest = viewer_db.source_digest
+    monkeypatch.setattr(viewer_db, "source_digest", lambda path: hashed.append(path) or source_digest(path))
+    cache = str(tmp_path / "viewer-cache")
+    first = viewer_db.legacy_viewer_db(legacy, cache)
+    assert viewer_db.legacy_viewer_db(legacy, cache) == first
+    assert len(hashed) == 1
+    # A changed file is hashed and converted again
+    conn = sqlite3.connect(legacy)
+    conn.execute("UPDATE messages SET data = 'edited' WHERE _id = 1")
+    conn.commit()
+    conn.close()
+    second = viewer_db.legacy_viewer_db(legacy, cache)
+    assert len(hashed) == 2 and second != first and not os.path.exists(first)
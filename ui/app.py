@@ -1,15 +1,80 @@
+import base64
+import functools
+import json
+import mimetypes
 import os
 import sqlite3
+import sys
+import threading
 import urllib.parse
+import zlib
+from datetime import datetime, timezone
 # pip install flask
-from flask import Flask, jsonify, request, render_template_string, send_file
-
-# Make sure to change this to the path of your WhatsApp msgstore.db file
-DB_PATH = r"D:\Projects\whatsapp-key-database-extractor\data\com.whatsapp\db\msgstore.db"
+from flask import Flask, g, jsonify, request, render_template_string, send_file
+from werkzeug.http import is_resource_modified
+
+import chat_summary
+import db_pool
+import db_registry
+import media_store
+import message_query
+import response_cache
+import search_index
+
+# viewer_db.py sits at the top of the repository, next to whatsapp.py
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import viewer_db
+
+# Make sure to change this to the path of your WhatsApp database. whatsapp.py builds msgstore.viewer.db next to
+# msgstore.db (indexed, read-only, WAL merged in); point this at msgstore.db itself if you extracted without it
+DB_PATH = r"D:\Projects\whatsapp-key-database-extractor\data\com.whatsapp\db\msgstore.viewer.db"
+# Folder searched for more extractions (DATA_DIR of whatsapp.py: one per device, batch run, ...), offered in the
+# viewer's database picker after DB_PATH; None = DB_PATH only
+DATA_ROOT = None
+# Databases kept open with their connections and warm caches; beyond that, or after DB_IDLE_SECONDS without a
+# request, the least recently used is closed
+MAX_OPEN_DATABASES = db_registry.MAX_OPEN
+DB_IDLE_SECONDS = db_registry.IDLE_SECONDS
 # Set MEDIA_ROOT to your WhatsApp media folder if you want media previews, otherwise leave as None
 MEDIA_ROOT = None
+# Image previews are thumbnails of this size (longest side, needs pip install pillow), cached on disk up to
+# THUMBNAIL_CACHE_MB and made by THUMBNAIL_WORKERS threads
+THUMBNAIL_SIZE = media_store.THUMBNAIL_SIZE
+THUMBNAIL_CACHE_MB = 512
+THUMBNAIL_WORKERS = media_store.THUMBNAIL_WORKERS
+# A thumbnail not made within this long is answered with 202, so the request thread is not held; the page asks again
+THUMBNAIL_WAIT_SECONDS = 0.2
+# How long browsers may reuse media and thumbnails before revalidating
+MEDIA_MAX_AGE = 24 * 3600
 # Default batch size for message loading
 BATCH_SIZE = 400
+# Chats per /chats page (the sidebar loads more while scrolling)
+CHAT_PAGE_SIZE = 100
+# Largest ?limit= each endpoint accepts, so no request can read a whole chat (or database) in one query
+MAX_MESSAGE_PAGE = 5000
+MAX_CHAT_PAGE = 1000
+MAX_SEARCH_PAGE = 500
+# Where the viewer keeps derived data (chat summaries, search index); None = a viewer-cache folder next to each
+# database
+CACHE_DIR = None
+# Results per /search page
+SEARCH_PAGE_SIZE = 50
+# Stream /messages?format=ndjson pages gzip/deflate-compressed to clients that accept it
+STREAM_COMPRESSION = True
+# zlib level for those: 1 keeps up with the database, higher levels mostly cost time
+STREAM_COMPRESSION_LEVEL = 1
+# Bytes of a streamed page collected before they are sent
+STREAM_CHUNK_SIZE = 16 * 1024
+# Memory for rendered /chats and /messages pages kept between requests, per open database (least recently used
+# evicted first)
+RESPONSE_CACHE_MB = 64
+# Database queries run at once per worker process (see ui/serve.py). Requests beyond that wait up to
+# QUERY_WAIT_SECONDS for a slot, then get 503, so one heavy chat cannot tie up every server thread
+MAX_CONCURRENT_QUERIES = 4
+QUERY_WAIT_SECONDS = 10
+# SQLite memory-mapped I/O and page cache per pooled connection
+DB_MMAP_SIZE = db_pool.MMAP_SIZE
+DB_CACHE_SIZE_KB = db_pool.CACHE_SIZE_KB
 
 app = Flask(__name__)
 
@@ -36,6 +101,11 @@ HTML_TEMPLATE = """
     background: rgba(0,0,0,0.3);
   }
 
+  /* The list keeps the reader's position itself when pages are added or dropped above */
+  #messages {
+    overflow-anchor: none;
+  }
+
   /* Message bubble tails */
   .msg-tail-right::after {
     content: '';
@@ -68,25 +138,22 @@ HTML_TEMPLATE = """
   <div class="w-80 bg-white border-r border-gray-200 flex flex-col">
     <!-- Header -->
     <div class="bg-gray-50 px-4 py-3 border-b border-gray-200">
-      <h1 class="text-lg font-semibold text-gray-800">Chats</h1>
+      <div class="flex items-center justify-between space-x-2">
+        <h1 class="text-lg font-semibold text-gray-800">Chats</h1>
+        <select id="db-select" class="hidden min-w-0 flex-1 border rounded px-1 py-1 text-sm" title="Extraction"
+                onchange="selectDatabase(this.value)"></select>
+      </div>
+      <div class="flex items-center mt-2 space-x-2">
+        <input id="search-input" type="search" placeholder="Search messages" class="flex-1 border rounded px-2 py-1 text-sm"
+               onkeydown="if (event.key === 'Enter') runSearch()">
+        <button id="search-close" class="hidden text-sm text-gray-500 hover:text-gray-800" onclick="closeSearch()">✕</button>
+      </div>
     </div>
     <div class="flex-1 overflow-y-auto custom-scrollbar" id="sidebar">
-      {% for chat in chats %}
-        <div class="px-4 py-3 border-b border-gray-100 cursor-pointer hover:bg-gray-50 transition-colors" 
-             onclick="selectChat({{ chat['chat_id'] }}, '{{ chat['chat_name']|e }}')">
-          <div class="flex items-center space-x-3">
-            <div class="w-12 h-12 bg-gray-300 rounded-full flex items-center justify-center">
-              <span class="text-gray-600 font-medium text-sm">
-                {{ chat['chat_name'][:2].upper() if chat['chat_name'] else '?' }}
-              </span>
-            </div>
-            <div class="flex-1 min-w-0">
-              <div class="font-medium text-gray-900 truncate">{{ chat['chat_name'] }}</div>
-              <div class="text-sm text-gray-500 truncate">{{ chat['preview'] }}</div>
-            </div>
-          </div>
-        </div>
-      {% endfor %}
+      <div class="text-center text-gray-500 py-8 text-sm" id="sidebar-status">Loading chats...</div>
+    </div>
+    <div class="flex-1 overflow-y-auto custom-scrollbar hidden" id="search-panel">
+      <div class="text-center text-gray-500 py-4 text-sm" id="search-status"></div>
     </div>
   </div>
   <div class="flex-1 flex flex-col bg-gray-50">
@@ -109,8 +176,12 @@ HTML_TEMPLATE = """
             <option value="asc">Oldest first (old → new)</option>
           </select>
           <label class="text-sm text-gray-600">Batch</label>
-          <input id="batch-input" type="number" min="1" max="5000" step="1" class="w-20 border rounded px-2 py-1 text-sm"
+          <input id="batch-input" type="number" min="1" max="{{ max_batch }}" step="1" class="w-20 border rounded px-2 py-1 text-sm"
                  value="{{ batch }}" onchange="onOrderOrBatchChanged()">
+          <label class="text-sm text-gray-600">Jump to</label>
+          <input id="jump-date" type="date" class="border rounded px-2 py-1 text-sm" onchange="jumpToDate()">
+          <input id="jump-id" type="number" min="1" placeholder="Message id" class="w-28 border rounded px-2 py-1 text-sm"
+                 onkeydown="if (event.key === 'Enter') jumpToMessage()">
         </div>
       </div>
     </div>
@@ -126,11 +197,48 @@ HTML_TEMPLATE = """
 </div>
 
 <script>
+// Extraction being viewed (?db=<id>); null = the server's default
+const currentDb = new URLSearchParams(location.search).get('db');
 let currentChatId = null;
-let oldestTimestamp = null;
-let newestTimestamp = null;
+let chatsCursor = null;
+let chatsLoading = false;
+let chatsExhausted = false;
+// Messages are shown oldest at the top; each cursor continues the list at one end (null = nothing more there)
+let olderCursor = null;
+let newerCursor = null;
 let loading = false;
-let exhausted = false;
+let searchText = '';
+let searchCursor = null;
+let searchLoading = false;
+let searchPoll = null;
+
+// API URL for the extraction being viewed
+function apiUrl(path, params = new URLSearchParams()) {
+  if (currentDb) params.set('db', currentDb);
+  return path + '?' + params.toString();
+}
+
+async function loadDatabases() {
+  const res = await fetch('/databases');
+  if (!res.ok) return;
+  const json = await res.json();
+  // Only worth showing when there is a choice
+  if (json.databases.length < 2) return;
+  const select = document.getElementById('db-select');
+  for (const db of json.databases) {
+    const option = document.createElement('option');
+    option.value = db.id;
+    option.textContent = `${db.label} (${new Date(db.modified_ms).toLocaleDateString()})`;
+    select.appendChild(option);
+  }
+  select.value = currentDb || json.databases[0].id;
+  select.classList.remove('hidden');
+}
+
+function selectDatabase(dbId) {
+  // A fresh page for the other extraction; the server keeps recently used ones open, so this is quick
+  location.search = '?db=' + encodeURIComponent(dbId);
+}
 
 function getOrder() {
   return document.getElementById('order-select').value;
@@ -139,15 +247,12 @@ function getOrder() {
 function getBatchSize() {
   const v = parseInt(document.getElementById('batch-input').value, 10);
   if (!Number.isFinite(v) || v < 1) return {{ batch }};
-  return v;
+  return Math.min(v, {{ max_batch }});
 }
 
 function onOrderOrBatchChanged() {
   if (currentChatId !== null) {
-    oldestTimestamp = null;
-    newestTimestamp = null;
-    exhausted = false;
-    loadMessages(true);
+    loadMessages(null, true);
   }
 }
 
@@ -187,6 +292,46 @@ function escapeHtml(s) {
     .replace(/"/g, "&quot;");
 }
 
+// A thumbnail still being made comes back as a 202 the <img> cannot show: ask again a few times, later each time
+const THUMBNAIL_RETRIES = 5;
+
+function retryThumbnail(img) {
+  const tries = Number(img.dataset.tries || 0);
+  if (tries >= THUMBNAIL_RETRIES) {
+    img.style.display = 'none';
+    return;
+  }
+  img.dataset.tries = tries + 1;
+  img.dataset.src = img.dataset.src || img.src;
+  setTimeout(() => { img.src = `${img.dataset.src}&retry=${tries + 1}`; }, 1000 * (tries + 1));
+}
+
+// Images show a lazily loaded thumbnail and open the original on click; video and voice notes are only fetched
+// (in ranges) when played
+function renderMedia(msg) {
+  const mime = msg.media_mime || '';
+  const name = `<div class="text-sm text-gray-500 italic">${escapeHtml(msg.media_name || '[media]')}</div>`;
+  if (mime.startsWith('video/')) {
+    return `<video controls preload="none" src="${msg.media_url}" class="max-w-xs max-h-48 rounded-lg mb-2"></video>${name}`;
+  }
+  if (mime.startsWith('audio/')) {
+    return `<audio controls preload="none" src="${msg.media_url}" class="mb-2"></audio>${name}`;
+  }
+  if (mime && !mime.startsWith('image/')) {
+    return `<a href="${msg.media_url}" target="_blank" class="text-sm text-blue-600 underline">${escapeHtml(msg.media_name || 'file')}</a>`;
+  }
+  return `
+    <div class="mb-2">
+      <a href="${msg.media_url}" target="_blank">
+        <img src="${msg.media_url}&thumb=1" loading="lazy"
+             class="max-w-xs max-h-48 rounded-lg"
+             onerror="retryThumbnail(this)">
+      </a>
+    </div>
+    ${name}
+  `;
+}
+
 function renderMessageNode(msg) {
   const container = document.createElement('div');
   const isMe = msg.from_me;
@@ -219,14 +364,7 @@ function renderMessageNode(msg) {
     inner += `<div class="break-words">${escapeHtml(msg.text)}</div>`;
   } else if (msg.media_name || msg.media_url) {
     if (msg.media_url) {
-      inner += `
-        <div class="mb-2">
-          <img src="${msg.media_url}" 
-               class="max-w-xs max-h-48 rounded-lg" 
-               onerror="this.style.display='none'">
-        </div>
-        <div class="text-sm text-gray-500 italic">${escapeHtml(msg.media_name || '[media]')}</div>
-      `;
+      inner += renderMedia(msg);
     } else {
       inner += `<div class="text-sm text-gray-500 italic flex items-center">
         <svg class="w-4 h-4 mr-1" fill="currentColor" viewBox="0 0 20 20">
@@ -250,98 +388,178 @@ function renderMessageNode(msg) {
   return container;
 }
 
-function dedupeSeparators(messagesEl) {
-  const nodes = Array.from(messagesEl.childNodes);
-  for (let i = 0; i < nodes.length - 1; i++) {
-    const a = nodes[i];
-    const b = nodes[i + 1];
-    if (a.dataset?.date && b.dataset?.date && 
-        a.querySelector('.bg-white.bg-opacity-90') && b.querySelector('.bg-white.bg-opacity-90')) {
-      if (a.dataset.date === b.dataset.date) {
-        a.remove();
-        nodes.splice(i, 1);
-        i--;
-      }
+// The message list holds one page per /messages request, oldest first, each split into blocks of BLOCK_SIZE
+// messages. Only blocks near the viewport have their messages in the DOM; the others are empty boxes of the same
+// height. Once more than MAX_LOADED_MESSAGES are loaded, whole pages are dropped at the end away from the reader and
+// the cursor of the new last page takes over, so scrolling back there loads them again.
+const BLOCK_SIZE = 100;
+const MAX_LOADED_MESSAGES = 4000;
+let pages = [];
+let blockObserver = null;
+
+function resetMessageList() {
+  pages = [];
+  if (blockObserver) blockObserver.disconnect();
+  // Blocks within about two screens of the viewport are rendered
+  blockObserver = new IntersectionObserver((entries) => {
+    for (const entry of entries) {
+      if (entry.isIntersecting) renderBlock(entry.target.block);
+      else collapseBlock(entry.target.block);
     }
-  }
-
-  const messageNodes = Array.from(messagesEl.childNodes);
-  let currentDate = null;
+  }, {root: document.getElementById('messages'), rootMargin: '1500px 0px'});
+}
 
-  for (let i = 0; i < messageNodes.length; i++) {
-    const node = messageNodes[i];
-    if (node.dataset?.date && !node.querySelector('.bg-white.bg-opacity-90')) {
-      const messageDate = node.dataset.date;
-      if (messageDate !== currentDate) {
-        const existingSeparator = i > 0 && messageNodes[i-1].querySelector('.bg-white.bg-opacity-90');
-        if (!existingSeparator) {
-          const separator = makeDateSeparator(messageDate, formatDateDisplay(new Date(messageDate).getTime()));
-          messagesEl.insertBefore(separator, node);
-        }
-        currentDate = messageDate;
-      }
-    } else if (node.dataset?.date && node.querySelector('.bg-white.bg-opacity-90')) {
-      currentDate = node.dataset.date;
+function renderBlock(block) {
+  if (block.rendered) return;
+  // A date separator goes wherever the date changes, including at the join with the block above
+  const prev = block.el.previousElementSibling?.block;
+  let lastDate = prev ? getDateKey(prev.messages[prev.messages.length - 1].timestamp_ms) : null;
+  const fragment = document.createDocumentFragment();
+  for (const m of block.messages) {
+    const dateKey = getDateKey(m.timestamp_ms);
+    if (dateKey !== lastDate) {
+      fragment.appendChild(makeDateSeparator(dateKey, formatDateDisplay(m.timestamp_ms)));
+      lastDate = dateKey;
     }
+    fragment.appendChild(renderMessageNode(m));
   }
+  block.el.replaceChildren(fragment);
+  block.el.style.height = '';
+  block.rendered = true;
+}
+
+function collapseBlock(block) {
+  if (!block.rendered) return;
+  block.el.style.height = block.el.offsetHeight + 'px';
+  block.el.replaceChildren();
+  block.rendered = false;
 }
 
-async function insertBatch(chronological, initial=false, orderMode='desc') {
+// The block's first separator depends on the block above it, which just changed
+function refreshJoin(block) {
+  if (!block || !block.rendered) return;
+  block.rendered = false;
+  renderBlock(block);
+}
+
+// Adds messages (chronological) to the page, on top of the list ('desc') or at the bottom ('asc')
+function addMessages(page, chronological, placement) {
   const messagesEl = document.getElementById('messages');
-  if (chronological.length === 0) return;
-
-  if (initial) {
-    messagesEl.innerHTML = '';
-    let lastDate = null;
-    for (const m of chronological) {
-      const dateKey = getDateKey(m.timestamp_ms);
-      if (dateKey !== lastDate) {
-        messagesEl.appendChild(makeDateSeparator(dateKey, formatDateDisplay(m.timestamp_ms)));
-        lastDate = dateKey;
-      }
-      messagesEl.appendChild(renderMessageNode(m));
-    }
-    return;
+  const blocks = [];
+  const fragment = document.createDocumentFragment();
+  for (let i = 0; i < chronological.length; i += BLOCK_SIZE) {
+    const el = document.createElement('div');
+    const block = {el, messages: chronological.slice(i, i + BLOCK_SIZE), rendered: false};
+    el.block = block;
+    blocks.push(block);
+    fragment.appendChild(el);
   }
 
-  if (orderMode === 'desc') {
-    const messagesFragment = document.createDocumentFragment();
-    let lastInsertedDate = null;
-    for (const m of chronological) {
-      const dateKey = getDateKey(m.timestamp_ms);
-      if (dateKey !== lastInsertedDate) {
-        messagesFragment.appendChild(makeDateSeparator(dateKey, formatDateDisplay(m.timestamp_ms)));
-        lastInsertedDate = dateKey;
-      }
-      messagesFragment.appendChild(renderMessageNode(m));
-    }
-    const firstChild = messagesEl.firstChild;
+  if (placement === 'desc') {
+    const next = messagesEl.firstElementChild;
     const prevScrollHeight = messagesEl.scrollHeight;
-    messagesEl.insertBefore(messagesFragment, firstChild);
-    dedupeSeparators(messagesEl);
-    const newScrollHeight = messagesEl.scrollHeight;
-    messagesEl.scrollTop = newScrollHeight - prevScrollHeight;
+    messagesEl.insertBefore(fragment, next);
+    blocks.forEach(renderBlock);
+    refreshJoin(next?.block);
+    // Keep the messages the reader is looking at in place
+    messagesEl.scrollTop += messagesEl.scrollHeight - prevScrollHeight;
+    page.blocks.unshift(...blocks);
   } else {
-    const messagesFragment = document.createDocumentFragment();
-    let lastInsertedDate = null;
-    for (const m of chronological) {
-      const dateKey = getDateKey(m.timestamp_ms);
-      if (dateKey !== lastInsertedDate) {
-        messagesFragment.appendChild(makeDateSeparator(dateKey, formatDateDisplay(m.timestamp_ms)));
-        lastInsertedDate = dateKey;
-      }
-      messagesFragment.appendChild(renderMessageNode(m));
+    messagesEl.appendChild(fragment);
+    blocks.forEach(renderBlock);
+    page.blocks.push(...blocks);
+  }
+  page.count += chronological.length;
+  // New blocks are rendered once to get their height; the observer collapses those out of view
+  for (const block of blocks) blockObserver.observe(block.el);
+}
+
+function removePage(page) {
+  for (const block of page.blocks) {
+    blockObserver.unobserve(block.el);
+    block.el.remove();
+  }
+}
+
+// After loading at one end, drop pages at the other until the list is back under MAX_LOADED_MESSAGES
+function trimPages(placement) {
+  const messagesEl = document.getElementById('messages');
+  let loaded = pages.reduce((n, page) => n + page.count, 0);
+  while (loaded > MAX_LOADED_MESSAGES && pages.length > 2) {
+    let page;
+    if (placement === 'desc') {
+      page = pages.pop();
+      removePage(page);
+      newerCursor = pages[pages.length - 1].newerCursor;
+    } else {
+      page = pages.shift();
+      const prevScrollHeight = messagesEl.scrollHeight;
+      removePage(page);
+      messagesEl.scrollTop -= prevScrollHeight - messagesEl.scrollHeight;
+      olderCursor = pages[0].olderCursor;
+      refreshJoin(pages[0].blocks[0]);
     }
-    messagesEl.appendChild(messagesFragment);
-    dedupeSeparators(messagesEl);
+    loaded -= page.count;
   }
 }
 
-async function selectChat(chatId, chatName) {
+function renderChatNode(chat) {
+  const node = document.createElement('div');
+  node.className = 'px-4 py-3 border-b border-gray-100 cursor-pointer hover:bg-gray-50 transition-colors';
+  const name = chat.chat_name || '?';
+  node.innerHTML = `
+    <div class="flex items-center space-x-3">
+      <div class="w-12 h-12 bg-gray-300 rounded-full flex items-center justify-center">
+        <span class="text-gray-600 font-medium text-sm">${escapeHtml(name.substring(0, 2).toUpperCase())}</span>
+      </div>
+      <div class="flex-1 min-w-0">
+        <div class="font-medium text-gray-900 truncate">${escapeHtml(name)}</div>
+        <div class="text-sm text-gray-500 truncate">${escapeHtml(chat.preview)}</div>
+      </div>
+    </div>
+  `;
+  node.addEventListener('click', () => selectChat(chat.chat_id, name));
+  return node;
+}
+
+async function loadChats() {
+  if (chatsLoading || chatsExhausted) return;
+  chatsLoading = true;
+
+  const params = new URLSearchParams();
+  params.set('limit', {{ chat_page_size }});
+  if (chatsCursor) params.set('cursor', chatsCursor);
+
+  const sidebar = document.getElementById('sidebar');
+  const status = document.getElementById('sidebar-status');
+  const res = await fetch(apiUrl('/chats', params));
+  if (!res.ok) {
+    status.textContent = 'Unable to load chats';
+    chatsLoading = false;
+    return;
+  }
+  const json = await res.json();
+
+  const fragment = document.createDocumentFragment();
+  for (const chat of json.chats) fragment.appendChild(renderChatNode(chat));
+  sidebar.insertBefore(fragment, status);
+
+  chatsCursor = json.next_cursor;
+  chatsExhausted = !chatsCursor;
+  if (chatsExhausted) {
+    status.textContent = sidebar.childElementCount > 1 ? '' : 'No chats';
+  }
+  chatsLoading = false;
+
+  // Keep loading until the sidebar can scroll
+  if (!chatsExhausted && sidebar.scrollHeight <= sidebar.clientHeight) loadChats();
+}
+
+function showChat(chatId, chatName) {
   currentChatId = chatId;
-  oldestTimestamp = null;
-  newestTimestamp = null;
-  exhausted = false;
+  olderCursor = null;
+  newerCursor = null;
+  resetMessageList();
 
   document.getElementById('chat-header').textContent = chatName;
   document.getElementById('chat-avatar').textContent = chatName.substring(0, 2).toUpperCase();
@@ -355,8 +573,13 @@ async function selectChat(chatId, chatName) {
       </div>
     </div>
   `;
+}
 
-  await loadMessages(true);
+async function selectChat(chatId, chatName) {
+  showChat(chatId, chatName);
+  const messagesEl = document.getElementById('messages');
+
+  await loadMessages(null, true);
 
   const order = getOrder();
   if (order === 'desc') {
@@ -366,81 +589,257 @@ async function selectChat(chatId, chatName) {
   }
 }
 
-async function loadMessages(initial=false) {
-  if (loading || currentChatId === null || exhausted) return;
+// direction: 'older' or 'newer' to extend the list, null for the first page (at the end picked by the order
+// selector); jump: {anchor_id} or {anchor_ms} to start the list at a message or date
+async function loadMessages(direction, initial=false, jump=null) {
+  if (loading || (currentChatId === null && !jump)) return;
+  const cursor = direction === 'older' ? olderCursor : direction === 'newer' ? newerCursor : null;
+  if (direction && !cursor) return;
   loading = true;
 
   const params = new URLSearchParams();
-  params.set('chat_id', currentChatId);
+  if (currentChatId !== null) params.set('chat_id', currentChatId);
   params.set('limit', getBatchSize());
   const order = getOrder();
   params.set('order', order);
-
-  if (order === 'desc') {
-    if (oldestTimestamp) params.set('before_ms', oldestTimestamp);
-  } else {
-    if (newestTimestamp) params.set('after_ms', newestTimestamp);
+  params.set('format', 'ndjson');
+  if (cursor) params.set('cursor', cursor);
+  if (jump) {
+    for (const [key, value] of Object.entries(jump)) params.set(key, value);
   }
 
-  const res = await fetch('/messages?' + params.toString());
+  const res = await fetch(apiUrl('/messages', params));
   if (!res.ok) { loading = false; return; }
-  const json = await res.json();
-  const msgs = json.messages;
   const messagesEl = document.getElementById('messages');
+  // Older pages go on top, newer ones at the bottom
+  const placement = direction === 'older' || (direction === null && !jump && order === 'desc') ? 'desc' : 'asc';
+
+  // Messages are rendered chunk by chunk as they arrive, in the order the page is queried
+  const page = {blocks: [], count: 0, olderCursor: null, newerCursor: null};
+  let header = null;
+  let trailer = null;
+  for await (const items of readNdjson(res)) {
+    const batch = [];
+    for (const item of items) {
+      if (header === null) {
+        header = item;
+        if (header.chat_name && header.chat_id !== currentChatId) {
+          showChat(header.chat_id, header.chat_name);
+        }
+        const loader = messagesEl.querySelector('.animate-spin')?.closest('.flex');
+        if (loader) loader.remove();
+      } else if (Array.isArray(item)) {
+        batch.push(Object.fromEntries(header.fields.map((field, i) => [field, item[i]])));
+      } else {
+        trailer = item;
+      }
+    }
+    if (batch.length === 0) continue;
+    if (page.count === 0) {
+      if (initial) {
+        messagesEl.replaceChildren();
+        resetMessageList();
+      }
+      if (placement === 'desc') pages.unshift(page);
+      else pages.push(page);
+    }
+    const chronological = batch.sort((a,b) => a.timestamp_ms - b.timestamp_ms || a.id - b.id);
+    addMessages(page, chronological, placement);
+  }
 
-  const loader = messagesEl.querySelector('.animate-spin')?.closest('.flex');
-  if (loader) loader.remove();
-
-  if (msgs.length === 0) {
-    exhausted = true;
-    if (initial) {
-      messagesEl.innerHTML = `
-        <div class="flex justify-center items-center h-full">
-          <div class="text-center text-gray-500">
-            <div class="text-4xl mb-4">💬</div>
-            <div>No messages in this chat</div>
-          </div>
+  if (trailer) {
+    page.olderCursor = trailer.older_cursor;
+    page.newerCursor = trailer.newer_cursor;
+    if (direction !== 'newer') olderCursor = trailer.older_cursor;
+    if (direction !== 'older') newerCursor = trailer.newer_cursor;
+    if (page.count) trimPages(placement);
+  }
+
+  if (page.count === 0 && initial) {
+    messagesEl.innerHTML = `
+      <div class="flex justify-center items-center h-full">
+        <div class="text-center text-gray-500">
+          <div class="text-4xl mb-4">💬</div>
+          <div>No messages in this chat</div>
         </div>
-      `;
-    }
-    loading = false;
+      </div>
+    `;
+  }
+
+  loading = false;
+}
+
+// Yields the complete NDJSON lines of each network chunk as parsed values
+async function* readNdjson(res) {
+  const reader = res.body.getReader();
+  const decoder = new TextDecoder();
+  let pending = '';
+  while (true) {
+    const {value, done} = await reader.read();
+    if (done) break;
+    pending += decoder.decode(value, {stream: true});
+    const lines = pending.split('\\n');
+    pending = lines.pop();
+    yield lines.filter(line => line).map(line => JSON.parse(line));
+  }
+  if (pending.trim()) yield [JSON.parse(pending)];
+}
+
+function highlightMessage(messageId) {
+  const block = pages.flatMap(page => page.blocks).find(b => b.messages.some(m => m.id === messageId));
+  if (!block) return;
+  renderBlock(block);
+  const node = block.el.querySelector(`[data-message-id="${messageId}"]`);
+  if (!node) return;
+  node.scrollIntoView({block: 'center'});
+  node.firstElementChild.classList.add('ring-2', 'ring-yellow-400');
+}
+
+async function jumpToDate() {
+  const value = document.getElementById('jump-date').value;
+  if (!value || currentChatId === null) return;
+  await loadMessages(null, true, {anchor_ms: new Date(value + 'T00:00:00').getTime()});
+  document.getElementById('messages').scrollTop = 0;
+}
+
+async function openMessage(messageId) {
+  await loadMessages(null, true, {anchor_id: messageId});
+  highlightMessage(messageId);
+}
+
+async function jumpToMessage() {
+  const messageId = parseInt(document.getElementById('jump-id').value, 10);
+  if (!Number.isFinite(messageId)) return;
+  await openMessage(messageId);
+}
+
+function renderSearchResult(result) {
+  const node = document.createElement('a');
+  node.href = result.url;
+  node.className = 'block px-4 py-3 border-b border-gray-100 hover:bg-gray-50 transition-colors';
+  // The server marks matches with \\x02...\\x03 so the text can be escaped before highlighting
+  const snippet = escapeHtml(result.snippet).replace(/\\x02/g, '<mark>').replace(/\\x03/g, '</mark>');
+  node.innerHTML = `
+    <div class="flex justify-between text-xs text-gray-500">
+      <span class="font-medium text-gray-900 truncate">${escapeHtml(result.chat_name)}</span>
+      <span>${new Date(result.timestamp_ms).toLocaleDateString()}</span>
+    </div>
+    <div class="text-sm text-gray-600 break-words">${snippet}</div>
+  `;
+  node.addEventListener('click', (event) => {
+    event.preventDefault();
+    history.replaceState(null, '', result.url);
+    openMessage(result.id);
+  });
+  return node;
+}
+
+function showSearchProgress(progress) {
+  const status = document.getElementById('search-status');
+  if (progress.state === 'indexing') {
+    status.textContent = `Indexing messages... ${progress.percent}% (results so far)`;
+    if (!searchPoll) searchPoll = setInterval(pollSearchIndex, 2000);
+  } else if (progress.state === 'error') {
+    status.textContent = 'Search index failed: ' + progress.error;
+  }
+}
+
+async function pollSearchIndex() {
+  const res = await fetch(apiUrl('/search/status'));
+  const progress = res.ok ? await res.json() : {state: 'error', error: res.statusText};
+  if (progress.state === 'indexing') {
+    showSearchProgress(progress);
     return;
   }
+  clearInterval(searchPoll);
+  searchPoll = null;
+  // Index complete: run the search again over everything
+  if (searchText) runSearch();
+}
+
+async function loadSearchResults() {
+  if (searchLoading) return;
+  searchLoading = true;
+  const params = new URLSearchParams();
+  params.set('q', searchText);
+  params.set('limit', {{ search_page_size }});
+  if (searchCursor) params.set('cursor', searchCursor);
 
-  const chronological = msgs.slice().sort((a,b) => a.timestamp_ms - b.timestamp_ms);
+  const panel = document.getElementById('search-panel');
+  const status = document.getElementById('search-status');
+  const res = await fetch(apiUrl('/search', params));
+  const json = await res.json();
+  if (!res.ok) {
+    status.textContent = json.error || 'Search failed';
+    searchLoading = false;
+    return;
+  }
 
-  await insertBatch(chronological, initial, order);
+  const fragment = document.createDocumentFragment();
+  for (const result of json.results) fragment.appendChild(renderSearchResult(result));
+  panel.insertBefore(fragment, status);
+  searchCursor = json.next_cursor;
+  status.textContent = panel.childElementCount > 1 ? '' : 'No messages found';
+  showSearchProgress(json.progress);
+  searchLoading = false;
+}
 
-  if (order === 'desc') {
-    oldestTimestamp = chronological[0].timestamp_ms;
-    newestTimestamp = chronological[chronological.length - 1].timestamp_ms;
-    if (json.count < getBatchSize()) exhausted = true;
-  } else {
-    newestTimestamp = chronological[chronological.length - 1].timestamp_ms;
-    oldestTimestamp = chronological[0].timestamp_ms;
-    if (json.count < getBatchSize()) exhausted = true;
+function runSearch() {
+  searchText = document.getElementById('search-input').value.trim();
+  if (!searchText) {
+    closeSearch();
+    return;
   }
+  const panel = document.getElementById('search-panel');
+  const status = document.getElementById('search-status');
+  panel.replaceChildren(status);
+  status.textContent = 'Searching...';
+  searchCursor = null;
+  document.getElementById('sidebar').classList.add('hidden');
+  document.getElementById('search-close').classList.remove('hidden');
+  panel.classList.remove('hidden');
+  loadSearchResults();
+}
 
-  loading = false;
+function closeSearch() {
+  searchText = '';
+  document.getElementById('search-input').value = '';
+  document.getElementById('search-panel').classList.add('hidden');
+  document.getElementById('search-close').classList.add('hidden');
+  document.getElementById('sidebar').classList.remove('hidden');
 }
 
 document.addEventListener('DOMContentLoaded', () => {
   const messagesEl = document.getElementById('messages');
+  const sidebar = document.getElementById('sidebar');
 
-  messagesEl.addEventListener('scroll', () => {
-    if (loading || exhausted || currentChatId === null) return;
+  loadDatabases();
+  loadChats();
+  sidebar.addEventListener('scroll', () => {
+    if (sidebar.scrollTop + sidebar.clientHeight >= sidebar.scrollHeight - 200) {
+      loadChats();
+    }
+  });
+
+  const searchPanel = document.getElementById('search-panel');
+  searchPanel.addEventListener('scroll', () => {
+    if (searchCursor && searchPanel.scrollTop + searchPanel.clientHeight >= searchPanel.scrollHeight - 200) {
+      loadSearchResults();
+    }
+  });
 
-    const order = getOrder();
+  // Links from search results: /?message=<id> opens the chat at that message
+  const linked = parseInt(new URLSearchParams(location.search).get('message'), 10);
+  if (Number.isFinite(linked)) openMessage(linked);
 
-    if (order === 'desc') {
-      if (messagesEl.scrollTop === 0 && !loading && !exhausted) {
-        loadMessages(false);
-      }
-    } else {
-      const threshold = 20;
-      if (messagesEl.scrollTop + messagesEl.clientHeight >= messagesEl.scrollHeight - threshold) {
-        loadMessages(false);
-      }
+  messagesEl.addEventListener('scroll', () => {
+    if (loading || currentChatId === null) return;
+
+    const threshold = 20;
+    if (messagesEl.scrollTop <= threshold && olderCursor) {
+      loadMessages('older');
+    } else if (newerCursor && messagesEl.scrollTop + messagesEl.clientHeight >= messagesEl.scrollHeight - threshold) {
+      loadMessages('newer');
     }
   });
 });
@@ -450,12 +849,217 @@ document.addEventListener('DOMContentLoaded', () => {
 """
 
 
+def cache_dir(db_path=None):
+    # Data shared by every database (thumbnails) goes next to DATA_ROOT, or DB_PATH without one
+    if CACHE_DIR:
+        return CACHE_DIR
+    folder = os.path.dirname(db_path) if db_path else DATA_ROOT or os.path.dirname(DB_PATH)
+    return os.path.join(os.path.abspath(folder), 'viewer-cache')
+
+
+def cache_path(db_path, suffix):
+    name = os.path.basename(db_path) + suffix
+    if CACHE_DIR:
+        # Every extraction's msgstore.viewer.db shares the folder
+        name = db_registry.database_id(db_path) + '-' + name
+    return os.path.join(cache_dir(db_path), name)
+
+
+class Database:
+    """An open extraction: its connection pool, chat summaries, search index and rendered pages."""
+
+    def __init__(self, entry):
+        self.id = entry['id']
+        self.label = entry['label']
+        self.source = self.path = entry['path']
+        if viewer_db.is_legacy(self.source):
+            # A 2.11-era msgstore.db without a viewer copy: converted to the modern tables once, into viewer-cache
+            self.path = viewer_db.legacy_viewer_db(self.source, cache_dir(self.source))
+        self.pool = db_pool.ConnectionPool(self.path, mmap_size=DB_MMAP_SIZE, cache_size_kb=DB_CACHE_SIZE_KB)
+        # Named after the source, so a converted copy does not put its caches inside viewer-cache
+        self.summaries = chat_summary.ChatSummaryCache(self.path, cache_path(self.source, '.chats.db'))
+        self.search = search_index.SearchIndex(self.path, cache_path(self.source, '.fts.db'), self.pool)
+        self.responses = response_cache.ResponseCache(RESPONSE_CACHE_MB * 1024 * 1024)
+        # SQL ordering the chat list, set by the first /chats (viewer_db.chat_sort_expression)
+        self.chat_sort = None
+
+    def close(self):
+        self.pool.close()
+        # Requests still running keep their own reference
+        self.responses = response_cache.ResponseCache(0)
+
+
+registry = None
+
+
+def databases():
+    global registry
+    if registry is None or registry.root != DATA_ROOT or registry.default_path != DB_PATH:
+        if registry is not None:
+            registry.close()
+        registry = db_registry.Registry(DATA_ROOT, DB_PATH, Database, MAX_OPEN_DATABASES, DB_IDLE_SECONDS)
+    return registry
+
+
+def current_db():
+    """The database named by the request's ?db=<id>; DB_PATH (else the newest under DATA_ROOT) without one."""
+    if 'database' not in g:
+        g.database = databases().get(request.args.get('db') or None)
+    return g.database
+
+
 def open_db():
-    if not os.path.isfile(DB_PATH):
-        raise FileNotFoundError(f"DB file not found at {DB_PATH!r}")
-    conn = sqlite3.connect(DB_PATH)
-    conn.row_factory = sqlite3.Row
-    return conn
+    db = current_db()
+    if not os.path.isfile(db.path):
+        raise FileNotFoundError(f"DB file not found at {db.path!r}")
+    return db.pool.acquire()
+
+
+def close_db(conn, db=None):
+    # Back to the pool, ready for the next request. Streamed pages pass db, as they finish after the request
+    (db or current_db()).pool.release(conn)
+
+
+def chat_summaries(conn):
+    summaries = current_db().summaries
+    summaries.refresh(conn)
+    return summaries
+
+
+def message_search():
+    index = current_db().search
+    index.ensure_current()
+    return index
+
+
+media_index = None
+thumbnail_cache = None
+
+
+def media_files():
+    global media_index
+    if media_index is None or media_index.root != os.path.abspath(MEDIA_ROOT):
+        media_index = media_store.MediaIndex(MEDIA_ROOT)
+    return media_index
+
+
+def thumbnails():
+    global thumbnail_cache
+    if thumbnail_cache is None:
+        thumbnail_cache = media_store.ThumbnailCache(os.path.join(cache_dir(), 'thumbnails'),
+                                                     THUMBNAIL_CACHE_MB * 1024 * 1024, THUMBNAIL_SIZE,
+                                                     THUMBNAIL_WORKERS)
+    return thumbnail_cache
+
+
+def db_validators(db):
+    """(generation, etag, last_modified) for the database file and its -wal as they are now."""
+    wal = db.path + '-wal'
+    stats = [os.stat(path) for path in (db.path, wal) if path == db.path or os.path.exists(path)]
+    # The viewer's settings change what is rendered from the same database
+    settings = zlib.crc32(repr((HTML_TEMPLATE, BATCH_SIZE, CHAT_PAGE_SIZE, SEARCH_PAGE_SIZE, MAX_MESSAGE_PAGE,
+                                MAX_CHAT_PAGE, MAX_SEARCH_PAGE, MEDIA_ROOT)).encode())
+    generation = (tuple((st.st_mtime_ns, st.st_size, st.st_ino) for st in stats), settings)
+    etag = '-'.join(f'{st.st_mtime_ns:x}-{st.st_size:x}' for st in stats) + f'-{settings:x}'
+    last_modified = datetime.fromtimestamp(max(st.st_mtime for st in stats), timezone.utc)
+    return generation, etag, last_modified
+
+
+def conditional(cache_body=True):
+    """ETag/Last-Modified from the database file, 304 on revalidation, and (cache_body) the rendered JSON kept in
+    the response cache. Only for views whose output depends on nothing but the database and the request args."""
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper():
+            try:
+                db = current_db()
+            except db_registry.UnknownDatabase:
+                return view()
+            if not os.path.isfile(db.path):
+                return view()
+            generation, etag, last_modified = db_validators(db)
+            if not is_resource_modified(request.environ, etag=etag, last_modified=last_modified):
+                # The client's copy is current: nothing to query or send
+                response = app.response_class(status=304)
+            else:
+                key = (request.path, tuple(sorted(request.args.items(multi=True))))
+                body = db.responses.get(generation, key) if cache_body else None
+                if body is not None:
+                    response = app.response_class(body, mimetype='application/json')
+                    response.headers['X-Cache'] = 'HIT'
+                else:
+                    response = app.make_response(view())
+                    if response.status_code != 200:
+                        return response
+                    # Streamed pages are never held in memory as a whole
+                    if cache_body and not response.is_streamed:
+                        db.responses.put(generation, key, response.get_data())
+                        response.headers['X-Cache'] = 'MISS'
+            # Weak: the same page may be sent gzip-compressed or not
+            response.set_etag(etag, weak=True)
+            response.last_modified = last_modified
+            # Revalidate on every use: a newer extraction can replace the file at any time
+            response.cache_control.no_cache = True
+            return response
+        return wrapper
+    return decorator
+
+
+# Column order of the message arrays in streamed pages
+STREAM_FIELDS = ('id', 'from_me', 'text', 'timestamp_ms', 'sender', 'quoted_text', 'media_name', 'media_url',
+                 'media_mime', 'message_type')
+
+
+query_slots = threading.BoundedSemaphore(MAX_CONCURRENT_QUERIES)
+
+
+def limit_queries(view):
+    """Run the view only while holding one of MAX_CONCURRENT_QUERIES slots. A streamed page keeps its slot until the
+    last row is sent. Goes under @conditional, so 304s and cached pages do not need a slot."""
+    @functools.wraps(view)
+    def wrapper():
+        if not query_slots.acquire(timeout=QUERY_WAIT_SECONDS):
+            response = jsonify({'error': 'server busy, try again'})
+            response.status_code = 503
+            response.headers['Retry-After'] = '1'
+            return response
+        try:
+            response = app.make_response(view())
+        except BaseException:
+            query_slots.release()
+            raise
+        if response.is_streamed:
+            response.call_on_close(query_slots.release)
+        else:
+            query_slots.release()
+        return response
+    return wrapper
+
+
+def page_limit(default, maximum):
+    # ?limit=, between 1 and maximum: LIMIT -1 would be no limit at all
+    return max(1, min(request.args.get('limit', type=int) or default, maximum))
+
+
+def encode_cursor(*values):
+    # Opaque to the client, which only hands it back
+    return base64.urlsafe_b64encode(json.dumps(values).encode()).decode().rstrip('=')
+
+
+def decode_cursor(token):
+    try:
+        return json.loads(base64.urlsafe_b64decode(token + '=' * (-len(token) % 4)))
+    except ValueError:
+        return None
+
+
+def cursor_position(values, size):
+    # The numbers a cursor seeks from; anything else would only fail once bound to the query
+    if not isinstance(values, list) or len(values) != size:
+        return None
+    if not all(isinstance(value, (int, float)) and not isinstance(value, bool) for value in values):
+        return None
+    return values
 
 
 def build_media_url(path):
@@ -465,45 +1069,204 @@ def build_media_url(path):
 
 
 @app.route('/')
+@conditional(cache_body=False)
 def index():
+    # The chat list is loaded page by page from /chats, so first paint does not depend on the number of chats
+    try:
+        db = current_db()
+    except db_registry.UnknownDatabase as e:
+        return f"<pre>Unable to open DB: {e}</pre>", 500
+    if not os.path.isfile(db.path):
+        return f"<pre>Unable to open DB: DB file not found at {db.path!r}</pre>", 500
+    if search_index.FTS5_AVAILABLE:
+        # Start indexing now so search is ready by the time it is used
+        message_search()
+    return render_template_string(HTML_TEMPLATE, batch=BATCH_SIZE, max_batch=MAX_MESSAGE_PAGE,
+                                  chat_page_size=CHAT_PAGE_SIZE, search_page_size=SEARCH_PAGE_SIZE)
+
+
+@app.route('/chats')
+@conditional()
+@limit_queries
+def chats():
+    limit = page_limit(CHAT_PAGE_SIZE, MAX_CHAT_PAGE)
+    cursor = request.args.get('cursor')
+
     try:
         conn = open_db()
     except Exception as e:
-        return f"<pre>Unable to open DB: {e}</pre>", 500
+        return jsonify({'error': f'unable to open db: {e}'}), 500
 
-    cur = conn.cursor()
-    cur.execute("""
+    db = current_db()
+    if db.chat_sort is None:
+        db.chat_sort = viewer_db.chat_sort_expression(conn)
+    query = f"""
     SELECT c._id AS chat_id,
-           COALESCE(c.subject, j.user, j.raw_string, 'Unknown') AS chat_name,
-           (SELECT text_data FROM message m WHERE m.chat_row_id = c._id ORDER BY m.timestamp DESC LIMIT 1) AS preview
+           {db.chat_sort} AS sort_ts,
+           {message_query.CHAT_NAME} AS chat_name
     FROM chat c
     LEFT JOIN jid j ON c.jid_row_id = j._id
-    ORDER BY c.sort_timestamp DESC, c._id DESC
-    """)
-    chats = []
-    for row in cur.fetchall():
-        preview = row['preview']
-        if preview:
-            preview = (preview[:80] + '...') if len(preview) > 80 else preview
-        chats.append({
+    """
+    params = []
+    if cursor:
+        position = cursor_position(decode_cursor(cursor), 2)
+        if position is None:
+            close_db(conn)
+            return jsonify({'error': 'invalid cursor'}), 400
+        query += f" WHERE ({db.chat_sort}, c._id) < (?, ?)"
+        params += position
+    query += f" ORDER BY {db.chat_sort} DESC, c._id DESC LIMIT ?"
+    params.append(limit)
+
+    try:
+        rows = conn.execute(query, params).fetchall()
+        summary = chat_summaries(conn)
+    finally:
+        close_db(conn)
+
+    result = []
+    for row in rows:
+        s = summary.get(row['chat_id']) or {}
+        result.append({
             'chat_id': row['chat_id'],
             'chat_name': row['chat_name'],
-            'preview': preview or ''
+            'preview': s.get('preview') or '',
+            'message_count': s.get('message_count', 0),
+            'last_timestamp_ms': s.get('last_timestamp'),
         })
-    conn.close()
-    return render_template_string(HTML_TEMPLATE, chats=chats, batch=BATCH_SIZE)
+    next_cursor = encode_cursor(rows[-1]['sort_ts'], rows[-1]['chat_id']) if len(rows) == limit else None
+    return jsonify({'chats': result, 'next_cursor': next_cursor})
+
+
+def message_dict(r):
+    media_path = message_query.media_path(r)
+    media_url = build_media_url(media_path) if (media_path and MEDIA_ROOT) else None
+
+    return {
+        'id': r['id'],
+        'from_me': bool(r['from_me']),
+        'text': r['text'] or '',
+        'timestamp_ms': int(r['timestamp_ms']) if r['timestamp_ms'] is not None else 0,
+        'sender': message_query.sender_label(r),
+        'quoted_text': r['quoted_text'] or '',
+        'media_name': message_query.media_name(r),
+        'media_url': media_url,
+        'media_mime': r['media_mime'] or '',
+        'message_type': r['message_type'] or ''
+    }
+
+
+def page_cursors(first, last, count, limit, order, position):
+    """(older_cursor, newer_cursor) for a page whose first and last rows (in query order) are given."""
+    # A page started at either end of the chat (no position) has nothing beyond that end
+    older_cursor = newer_cursor = None
+    if count:
+        if order == 'asc':
+            oldest, newest = first, last
+            older_open, newer_open = position is not None, count == limit
+        else:
+            oldest, newest = last, first
+            older_open, newer_open = count == limit, position is not None
+        if older_open:
+            older_cursor = encode_cursor('older', oldest['timestamp_ms'], oldest['id'])
+        if newer_open:
+            newer_cursor = encode_cursor('newer', newest['timestamp_ms'], newest['id'])
+    elif position is not None and order == 'asc':
+        # Jumped past the newest message: only older ones are left
+        older_cursor = encode_cursor('older', *position)
+    return older_cursor, newer_cursor
+
+
+def stream_encoding():
+    if not STREAM_COMPRESSION:
+        return None
+    for encoding in ('gzip', 'deflate'):
+        if request.accept_encodings[encoding]:
+            return encoding
+    return None
+
+
+def stream_messages(conn, cur, header, limit, order, position):
+    """NDJSON page: a header line with the field names, one array per message in query order, then a line with the
+    count and cursors. Rows are read from the cursor as they are sent, so memory does not grow with the page size."""
+    encoding = stream_encoding()
+    # wbits 31 writes a gzip wrapper, 15 the zlib one HTTP calls deflate
+    compressor = zlib.compressobj(STREAM_COMPRESSION_LEVEL, wbits=31 if encoding == 'gzip' else 15) if encoding else None
+
+    def encode(text, final=False):
+        data = text.encode('utf-8')
+        if compressor is None:
+            return data
+        # Sync flush, so the client can decode every chunk as soon as it arrives
+        return compressor.compress(data) + compressor.flush(zlib.Z_FINISH if final else zlib.Z_SYNC_FLUSH)
+
+    def generate():
+        yield encode(json.dumps({**header, 'fields': STREAM_FIELDS}) + '\n')
+        first = last = None
+        count = 0
+        buffer, buffered = [], 0
+        for r in cur:
+            m = message_dict(r)
+            line = json.dumps([m[field] for field in STREAM_FIELDS], ensure_ascii=False) + '\n'
+            buffer.append(line)
+            buffered += len(line)
+            if first is None:
+                first = r
+            last = r
+            count += 1
+            # The first message goes out at once, the rest in chunks
+            if count == 1 or buffered >= STREAM_CHUNK_SIZE:
+                yield encode(''.join(buffer))
+                buffer, buffered = [], 0
+        older_cursor, newer_cursor = page_cursors(first, last, count, limit, order, position)
+        buffer.append(json.dumps({'count': count, 'older_cursor': older_cursor, 'newer_cursor': newer_cursor}) + '\n')
+        yield encode(''.join(buffer), final=True)
+
+    db = current_db()
+    response = app.response_class(generate(), mimetype='application/x-ndjson')
+    # After the last chunk is sent, or when the client goes away mid-page
+    response.call_on_close(lambda: close_db(conn, db))
+    if encoding:
+        response.headers['Content-Encoding'] = encoding
+    response.headers['Vary'] = 'Accept-Encoding'
+    return response
 
 
 @app.route('/messages')
+@conditional()
+@limit_queries
 def messages():
     chat_id = request.args.get('chat_id', type=int)
+    cursor = request.args.get('cursor')  # older_cursor/newer_cursor of a previous page
+    anchor_id = request.args.get('anchor_id', type=int)  # jump: page starting at this message (any chat)
+    anchor_ms = request.args.get('anchor_ms', type=int)  # jump: page starting at this time
     before_ms = request.args.get('before_ms', type=int)  # ms
     after_ms = request.args.get('after_ms', type=int)  # ms (for asc)
-    limit = request.args.get('limit', type=int) or BATCH_SIZE
+    limit = page_limit(BATCH_SIZE, MAX_MESSAGE_PAGE)
     order = request.args.get('order', 'desc')  # 'asc' or 'desc'
+    fmt = request.args.get('format', 'json')  # 'json', or 'ndjson' to stream the page
 
-    if chat_id is None:
+    if chat_id is None and anchor_id is None:
         return jsonify({'error': 'chat_id required'}), 400
+    if fmt not in ('json', 'ndjson'):
+        return jsonify({'error': 'format must be json or ndjson'}), 400
+
+    # (timestamp, _id) position to continue from; the message with the same timestamp as a page's last one
+    # is still on the next page, since _id breaks the tie
+    position = None
+    inclusive = False
+    if cursor:
+        decoded = decode_cursor(cursor)
+        if not isinstance(decoded, list) or len(decoded) != 3 or decoded[0] not in ('older', 'newer'):
+            return jsonify({'error': 'invalid cursor'}), 400
+        order = 'asc' if decoded[0] == 'newer' else 'desc'
+        position = cursor_position(decoded[1:], 2)
+        if position is None:
+            return jsonify({'error': 'invalid cursor'}), 400
+    elif anchor_ms is not None:
+        order = 'asc'
+        position = [anchor_ms, 0]
+        inclusive = True
 
     try:
         conn = open_db()
@@ -511,84 +1274,153 @@ def messages():
         return jsonify({'error': f'unable to open db: {e}'}), 500
 
     conn.row_factory = sqlite3.Row
-    cur = conn.cursor()
-
-    base_query = """
-    SELECT m._id as id,
-           m.from_me as from_me,
-           m.text_data as text,
-           m.timestamp as timestamp_ms,
-           j.user as sender_user,
-           j.raw_string as sender_raw,
-           cj.user as chat_user,
-           cj.raw_string as chat_raw,
-           mq.text_data as quoted_text,
-           mm.file_path as media_path,
-           mm.direct_path as media_direct_path,
-           mm.media_name as media_name,
-           m.message_type as message_type
-    FROM message m
-    LEFT JOIN jid j ON m.sender_jid_row_id = j._id
-    LEFT JOIN chat c ON m.chat_row_id = c._id
-    LEFT JOIN jid cj ON c.jid_row_id = cj._id
-    LEFT JOIN message_quoted mq ON m._id = mq.message_row_id
-    LEFT JOIN message_media mm ON m._id = mm.message_row_id
-    WHERE m.chat_row_id = ?
-    """
-
-    params = [chat_id]
-
-    if order == 'asc':
-        if after_ms:
+    streaming = False
+    try:
+        cur = conn.cursor()
+
+        chat_name = None
+        if anchor_id is not None:
+            anchor = cur.execute(f"""
+            SELECT m.chat_row_id, m.timestamp, {message_query.CHAT_NAME} AS chat_name
+            FROM message m
+            LEFT JOIN chat c ON m.chat_row_id = c._id
+            LEFT JOIN jid j ON c.jid_row_id = j._id
+            WHERE m._id = ?
+            """, (anchor_id,)).fetchone()
+            if anchor is None:
+                return jsonify({'error': 'message not found'}), 404
+            chat_id, chat_name = anchor['chat_row_id'], anchor['chat_name']
+            order = 'asc'
+            position = [anchor['timestamp'], anchor_id]
+            inclusive = True
+
+        base_query = message_query.MESSAGE_QUERY + "WHERE m.chat_row_id = ?"
+
+        params = [chat_id]
+
+        # Seeks on the (chat_row_id, timestamp, _id) index of the viewer database, whatever the depth
+        if position is not None:
+            op = ('>' if order == 'asc' else '<') + ('=' if inclusive else '')
+            base_query += f" AND (m.timestamp, m._id) {op} (?, ?)"
+            params += position
+        elif order == 'asc' and after_ms:
             base_query += " AND m.timestamp > ?"
             params.append(after_ms)
-        base_query += " ORDER BY m.timestamp ASC LIMIT ?"
-        params.append(limit)
-    else:
-        if before_ms:
+        elif order != 'asc' and before_ms:
             base_query += " AND m.timestamp < ?"
             params.append(before_ms)
-        base_query += " ORDER BY m.timestamp DESC LIMIT ?"
+
+        direction = 'ASC' if order == 'asc' else 'DESC'
+        base_query += f" ORDER BY m.timestamp {direction}, m._id {direction} LIMIT ?"
         params.append(limit)
 
-    cur.execute(base_query, params)
-    rows = cur.fetchall()
-    conn.close()
+        cur.execute(base_query, params)
+        if fmt == 'ndjson':
+            header = {'chat_id': chat_id}
+            if chat_name is not None:
+                header['chat_name'] = chat_name
+            response = stream_messages(conn, cur, header, limit, order, position)
+            # The stream hands the connection back when it ends
+            streaming = True
+            return response
+        rows = cur.fetchall()
+    finally:
+        if not streaming:
+            close_db(conn)
+
+    messages = [message_dict(r) for r in rows]
+    older_cursor, newer_cursor = page_cursors(rows[0] if rows else None, rows[-1] if rows else None, len(rows),
+                                              limit, order, position)
+
+    result = {'messages': messages, 'count': len(messages), 'chat_id': chat_id,
+              'older_cursor': older_cursor, 'newer_cursor': newer_cursor}
+    if chat_name is not None:
+        result['chat_name'] = chat_name
+    return jsonify(result)
+
+
+@app.route('/search')
+@limit_queries
+def search_messages():
+    text = request.args.get('q', '').strip()
+    chat_id = request.args.get('chat_id', type=int)
+    limit = page_limit(SEARCH_PAGE_SIZE, MAX_SEARCH_PAGE)
+    cursor = request.args.get('cursor')
+
+    if not text:
+        return jsonify({'error': 'q required'}), 400
+    before_id = None
+    if cursor:
+        position = cursor_position(decode_cursor(cursor), 1)
+        if position is None:
+            return jsonify({'error': 'invalid cursor'}), 400
+        before_id = position[0]
+    if not search_index.FTS5_AVAILABLE:
+        return jsonify({'error': 'this Python\'s SQLite was built without FTS5'}), 501
 
-    messages = []
-    for r in rows:
-        if r['from_me']:
-            sender_label = 'Me'
-        else:
-            sender_label = None
-            if r['sender_user']:
-                sender_label = r['sender_user']
-            elif r['sender_raw']:
-                sender_label = r['sender_raw']
-            elif r['chat_user']:
-                sender_label = r['chat_user']
-            elif r['chat_raw']:
-                sender_label = r['chat_raw']
-            else:
-                sender_label = 'Unknown'
-
-        media_path = r['media_path'] or r['media_direct_path'] or None
-
-        media_url = build_media_url(media_path) if (media_path and MEDIA_ROOT) else None
-
-        messages.append({
-            'id': r['id'],
-            'from_me': bool(r['from_me']),
-            'text': r['text'] or '',
-            'timestamp_ms': int(r['timestamp_ms']) if r['timestamp_ms'] is not None else 0,
-            'sender': sender_label,
-            'quoted_text': r['quoted_text'] or '',
-            'media_name': (r['media_name'] or (os.path.basename(media_path) if media_path else '')),
-            'media_url': media_url,
-            'message_type': r['message_type'] or ''
-        })
+    try:
+        index = message_search()
+        rows = index.search(text, limit, chat_id, before_id)
+    except sqlite3.Error as e:
+        return jsonify({'error': f'search failed: {e}'}), 500
+    except Exception as e:
+        return jsonify({'error': f'unable to open db: {e}'}), 500
+
+    chat_names = {}
+    if rows:
+        conn = open_db()
+        chat_ids = sorted({row[1] for row in rows})
+        try:
+            chat_names = dict(conn.execute(f"""
+            SELECT c._id, {message_query.CHAT_NAME}
+            FROM chat c
+            LEFT JOIN jid j ON c.jid_row_id = j._id
+            WHERE c._id IN ({', '.join('?' * len(chat_ids))})
+            """, chat_ids).fetchall())
+        finally:
+            close_db(conn)
+
+    results = [{
+        'id': message_id,
+        'chat_id': row_chat_id,
+        'chat_name': chat_names.get(row_chat_id, 'Unknown'),
+        'timestamp_ms': int(timestamp) if timestamp is not None else 0,
+        'snippet': snippet,
+        'url': f'/?db={current_db().id}&message={message_id}',
+    } for message_id, row_chat_id, timestamp, snippet in rows]
+    next_cursor = encode_cursor(rows[-1][0]) if len(rows) == limit else None
+    return jsonify({'results': results, 'next_cursor': next_cursor, 'progress': index.progress()})
+
+
+@app.route('/search/status')
+def search_status():
+    if not search_index.FTS5_AVAILABLE:
+        return jsonify({'error': 'this Python\'s SQLite was built without FTS5'}), 501
+    try:
+        return jsonify(message_search().progress())
+    except Exception as e:
+        return jsonify({'error': f'unable to open db: {e}'}), 500
 
-    return jsonify({'messages': messages, 'count': len(messages)})
+
+@app.route('/cache/stats')
+def cache_stats():
+    try:
+        return jsonify(current_db().responses.stats())
+    except db_registry.UnknownDatabase as e:
+        return jsonify({'error': str(e)}), 404
+
+
+@app.route('/databases')
+def list_databases():
+    # Extractions for the picker, DB_PATH first, then newest first
+    registry = databases()
+    result = [{
+        'id': entry['id'],
+        'label': entry['label'],
+        'size': entry['size'],
+        'modified_ms': int(entry['modified'] * 1000),
+    } for entry in registry.entries()]
+    return jsonify({'databases': result, **registry.stats()})
 
 
 @app.route('/media')
@@ -600,31 +1432,48 @@ def media():
     if not raw_path:
         return jsonify({'error': 'path required'}), 400
 
-    candidate = raw_path
-    candidate = candidate.replace('\\', os.sep).replace('/', os.sep)
-
-    if os.path.isabs(candidate):
-        file_path = os.path.abspath(candidate)
-    else:
-        file_path = os.path.abspath(os.path.join(MEDIA_ROOT, candidate))
-
-    media_root_abs = os.path.abspath(MEDIA_ROOT)
-    if not file_path.startswith(media_root_abs):
-        return jsonify({'error': 'file not allowed'}), 403
-
-    if not os.path.exists(file_path):
-        return jsonify({'error': 'file not found', 'path': file_path}), 404
+    file_path = media_files().lookup(raw_path)
+    if file_path is None:
+        return jsonify({'error': 'file not found', 'path': raw_path}), 404
 
     try:
-        return send_file(file_path)
+        if request.args.get('thumb') and (mimetypes.guess_type(file_path)[0] or '').startswith('image/'):
+            try:
+                thumbnail = thumbnails().get(file_path, THUMBNAIL_WAIT_SECONDS)
+            except media_store.ThumbnailPending:
+                response = jsonify({'status': 'thumbnail pending'})
+                response.status_code = 202
+                response.headers['Retry-After'] = '1'
+                response.cache_control.no_store = True
+                return response
+            if thumbnail:
+                return send_file(thumbnail, mimetype='image/jpeg', conditional=True, max_age=MEDIA_MAX_AGE)
+        # conditional=True answers Range requests with 206, so video and voice notes stream and seek
+        return send_file(file_path, conditional=True, max_age=MEDIA_MAX_AGE)
     except Exception as e:
         return jsonify({'error': f'could not send file: {e}'}), 500
 
 
+@app.route('/media/stats')
+def media_stats():
+    if MEDIA_ROOT is None:
+        return jsonify({'error': 'media serving disabled (MEDIA_ROOT is None)'}), 404
+    index = media_files()
+    return jsonify({'files': index.files, 'thumbnails': thumbnails().stats()})
+
+
 if __name__ == '__main__':
-    if not os.path.isfile(DB_PATH):
-        print(f"ERROR: DB file not found at {DB_PATH!r}. Edit DB_PATH at top of script.")
+    if DATA_ROOT:
+        print(f"Found {len(databases().entries())} databases under {DATA_ROOT!r}")
+    elif not os.path.isfile(DB_PATH):
+        print(f"ERROR: DB file not found at {DB_PATH!r}. Edit DB_PATH (or DATA_ROOT) at top of script.")
     if MEDIA_ROOT and not os.path.isdir(MEDIA_ROOT):
         print(
             f"WARNING: MEDIA_ROOT directory not found at {MEDIA_ROOT!r}. Media preview disabled until path is correct.")
+    elif MEDIA_ROOT:
+        if not thumbnails().available:
+            print("WARNING: pillow is not installed (pip install pillow). Images are shown full size.")
+        # Index the media folder while the server starts
+        media_files()
+    # Flask's development server, fine for one person. ui/serve.py serves several reviewers at once
     app.run()
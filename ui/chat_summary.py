@@ -0,0 +1,114 @@
+import os
+import sqlite3
+import threading
+
+import db_pool
+
+SCHEMA_VERSION = 1
+PREVIEW_LENGTH = 80
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS chat_summary (
+    chat_id INTEGER PRIMARY KEY,
+    message_count INTEGER NOT NULL,
+    last_message_id INTEGER,
+    last_timestamp INTEGER,
+    preview TEXT
+);
+CREATE TABLE IF NOT EXISTS state (
+    key TEXT PRIMARY KEY,
+    value
+);
+"""
+
+# One pass over the new rows. With a single max() aggregate SQLite takes the bare columns (_id, text_data)
+# from the row holding the maximum, i.e. the chat's last message.
+SUMMARY_QUERY = """
+SELECT chat_row_id, COUNT(*), MAX(timestamp), _id, text_data
+FROM message
+WHERE _id > ?
+GROUP BY chat_row_id
+"""
+
+
+def _preview(text):
+    if not text:
+        return ''
+    return (text[:PREVIEW_LENGTH] + '...') if len(text) > PREVIEW_LENGTH else text
+
+
+class ChatSummaryCache:
+    """Per-chat message count, last message and preview, kept in a sidecar SQLite file next to the database.
+    Built once, then brought up to date from the messages added since (by _id) whenever the database changes."""
+
+    def __init__(self, db_path, cache_path):
+        self.db_path = db_path
+        self.cache_path = cache_path
+        self.lock = threading.Lock()
+        self.summaries = None
+        self.signature = None
+
+    def _open_cache(self):
+        try:
+            os.makedirs(os.path.dirname(self.cache_path), exist_ok=True)
+            conn = sqlite3.connect(self.cache_path)
+        except (OSError, sqlite3.Error):
+            # Read-only location: keep the summary for this process only
+            conn = sqlite3.connect(":memory:")
+        conn.executescript(SCHEMA)
+        return conn
+
+    def _load(self, cache):
+        state = dict(cache.execute("SELECT key, value FROM state"))
+        summaries = {row[0]: {"message_count": row[1], "last_message_id": row[2], "last_timestamp": row[3],
+                              "preview": row[4]}
+                     for row in cache.execute("SELECT chat_id, message_count, last_message_id, last_timestamp, "
+                                              "preview FROM chat_summary")}
+        return state, summaries
+
+    def refresh(self, conn):
+        """Bring the summary up to date with `conn` (a connection to db_path). Cheap when nothing changed."""
+        signature = db_pool.source_signature(self.db_path)
+        if signature == self.signature:
+            return
+        with self.lock:
+            if signature == self.signature:
+                return
+            cache = self._open_cache()
+            try:
+                state, summaries = self._load(cache)
+                max_id = conn.execute("SELECT MAX(_id) FROM message").fetchone()[0] or 0
+                since = state.get("max_message_id", 0)
+                if (state.get("schema_version") != SCHEMA_VERSION or state.get("db_path") != self.db_path
+                        or max_id < since):
+                    # New, rebuilt from scratch or rolled back: start over
+                    summaries, since = {}, 0
+                    cache.execute("DELETE FROM chat_summary")
+
+                if state.get("signature") != signature and max_id > since:
+                    for chat_id, count, timestamp, message_id, text in conn.execute(SUMMARY_QUERY, (since,)):
+                        summary = summaries.get(chat_id)
+                        if summary is None:
+                            summary = summaries[chat_id] = {"message_count": 0, "last_message_id": None,
+                                                            "last_timestamp": None, "preview": ''}
+                        summary["message_count"] += count
+                        if summary["last_timestamp"] is None or (timestamp or 0, message_id) > (
+                                summary["last_timestamp"] or 0, summary["last_message_id"]):
+                            summary.update(last_message_id=message_id, last_timestamp=timestamp,
+                                           preview=_preview(text))
+                    cache.executemany(
+                        "INSERT OR REPLACE INTO chat_summary VALUES (?, ?, ?, ?, ?)",
+                        ((chat_id, s["message_count"], s["last_message_id"], s["last_timestamp"], s["preview"])
+                         for chat_id, s in summaries.items()))
+
+                cache.executemany("INSERT OR REPLACE INTO state VALUES (?, ?)", [
+                    ("schema_version", SCHEMA_VERSION), ("db_path", self.db_path),
+                    ("max_message_id", max_id), ("signature", signature)])
+                cache.commit()
+            finally:
+                cache.close()
+            self.summaries = summaries
+            self.signature = signature
+
+    def get(self, chat_id):
+        return (self.summaries or {}).get(chat_id)
@@ -0,0 +1,90 @@
+import os
+import pathlib
+import sqlite3
+import stat
+import threading
+
+# Defaults sized for multi-GB msgstore copies: map up to 1 GB, keep 64 MB of pages per connection
+MMAP_SIZE = 1024 * 1024 * 1024
+CACHE_SIZE_KB = 64 * 1024
+# Prepared statements kept per connection (sqlite3 caches them by SQL text)
+STATEMENT_CACHE = 256
+MAX_IDLE = 8
+
+
+def file_signature(path):
+    st = os.stat(path)
+    return st.st_mtime_ns, st.st_size, st.st_ino
+
+
+def source_signature(path):
+    # A live msgstore.db only grows its -wal, so that file counts as well
+    wal = path + "-wal"
+    return repr([file_signature(path), file_signature(wal) if os.path.exists(wal) else None])
+
+
+def _is_immutable(path):
+    # immutable=1 skips locking and change detection, which is only safe for a file nobody writes:
+    # the read-only viewer copy, not a live msgstore.db whose WAL still holds data. Decided from the mode bits,
+    # not os.access, which is always true for root (the usual user on a forensics box)
+    writable = os.stat(path).st_mode & (stat.S_IWUSR | stat.S_IWGRP | stat.S_IWOTH)
+    return not writable and not os.path.exists(path + "-wal")
+
+
+class ConnectionPool:
+    """Read-only SQLite connections reused across requests, reopened when the file changes on disk."""
+
+    def __init__(self, path, mmap_size=MMAP_SIZE, cache_size_kb=CACHE_SIZE_KB, statement_cache=STATEMENT_CACHE,
+                 max_idle=MAX_IDLE):
+        self.path = path
+        self.mmap_size = mmap_size
+        self.cache_size_kb = cache_size_kb
+        self.statement_cache = statement_cache
+        self.max_idle = max_idle
+        self.lock = threading.Lock()
+        self.idle = []
+        self.signatures = {}
+        self.opened = 0
+
+    def _open(self, signature):
+        uri = pathlib.Path(self.path).resolve().as_uri() + "?mode=ro"
+        if _is_immutable(self.path):
+            uri += "&immutable=1"
+        # Handed from thread to thread, but only ever used by one request at a time
+        conn = sqlite3.connect(uri, uri=True, check_same_thread=False, cached_statements=self.statement_cache)
+        conn.row_factory = sqlite3.Row
+        conn.execute(f"PRAGMA mmap_size={int(self.mmap_size)}")
+        conn.execute(f"PRAGMA cache_size={-int(self.cache_size_kb)}")
+        conn.execute("PRAGMA query_only=1")
+        self.signatures[conn] = signature
+        self.opened += 1
+        return conn
+
+    def acquire(self):
+        signature = file_signature(self.path)
+        with self.lock:
+            while self.idle:
+                conn = self.idle.pop()
+                if self.signatures.get(conn) == signature:
+                    return conn
+                # The file was replaced or rebuilt since this connection was opened
+                self._discard(conn)
+            return self._open(signature)
+
+    def release(self, conn):
+        with self.lock:
+            if conn in self.signatures and len(self.idle) < self.max_idle:
+                self.idle.append(conn)
+            else:
+                self._discard(conn)
+
+    def _discard(self, conn):
+        self.signatures.pop(conn, None)
+        conn.close()
+
+    def close(self):
+        with self.lock:
+            # Connections still in use are closed when they are released
+            self.max_idle = 0
+            while self.idle:
+                self._discard(self.idle.pop())
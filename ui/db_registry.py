@@ -0,0 +1,177 @@
+import collections
+import hashlib
+import os
+import threading
+import time
+
+SOURCE_NAME = "msgstore.db"
+# The indexed copy whatsapp.py builds next to msgstore.db (viewer_db.VIEWER_DB_SUFFIX)
+VIEWER_NAME = "msgstore.viewer.db"
+# Folders that never hold an extraction
+SKIP_DIRS = {"viewer-cache", "apk-store", "logs", "__pycache__"}
+# The root is walked again for new extractions at most this often
+RESCAN_SECONDS = 30
+# Databases kept open (connections, summary cache, search index, rendered pages); the least recently used beyond
+# this are closed
+MAX_OPEN = 4
+# A database not used for this long is closed even while there is room
+IDLE_SECONDS = 15 * 60
+
+
+class UnknownDatabase(LookupError):
+    pass
+
+
+def database_id(source_path):
+    # Stable across restarts and rescans, and the same whether the viewer copy exists yet or not
+    return hashlib.sha1(os.path.abspath(source_path).encode()).hexdigest()[:10]
+
+
+def _entry(source_path, root):
+    source_path = os.path.abspath(source_path)
+    folder = os.path.dirname(source_path)
+    viewer_path = os.path.join(folder, VIEWER_NAME)
+    path = source_path
+    # The viewer copy, unless a newer extraction has replaced msgstore.db since it was built
+    if os.path.isfile(viewer_path) and (not os.path.isfile(source_path)
+                                        or os.path.getmtime(viewer_path) >= os.path.getmtime(source_path)):
+        path = viewer_path
+    # data/<serial>/com.whatsapp/db/msgstore.db is labelled <serial>
+    label_dir = folder
+    for _ in range(2):
+        if os.path.basename(label_dir) in ("db", "com.whatsapp"):
+            label_dir = os.path.dirname(label_dir)
+    if root and os.path.commonpath([os.path.abspath(label_dir), os.path.abspath(root)]) == os.path.abspath(root):
+        label = os.path.relpath(label_dir, root).replace(os.sep, "/")
+        if label == ".":
+            label = os.path.basename(os.path.abspath(root))
+    else:
+        label = label_dir
+    st = os.stat(path)
+    return {"id": database_id(source_path), "label": label, "path": path, "size": st.st_size,
+            "modified": st.st_mtime}
+
+
+def discover(root):
+    """Every extraction under root (a msgstore.db, or only its viewer copy), newest first."""
+    found = []
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames[:] = [d for d in dirnames if d not in SKIP_DIRS and not d.startswith(".")]
+        if SOURCE_NAME in filenames or VIEWER_NAME in filenames:
+            try:
+                found.append(_entry(os.path.join(dirpath, SOURCE_NAME), root))
+            except OSError:
+                # Removed while walking
+                continue
+    found.sort(key=lambda entry: -entry["modified"])
+    return found
+
+
+class Registry:
+    """The extractions found under root (plus default_path), and an LRU of the ones opened with
+    open_database(entry), which returns an object with the entry's path as .source and a close() method. Opened
+    databases are closed when they fall out of the max_open most recently used, or after idle_seconds without a
+    request."""
+
+    def __init__(self, root, default_path, open_database, max_open=MAX_OPEN, idle_seconds=IDLE_SECONDS,
+                 rescan_seconds=RESCAN_SECONDS):
+        self.root = root
+        self.default_path = default_path
+        self.open_database = open_database
+        self.max_open = max_open
+        self.idle_seconds = idle_seconds
+        self.rescan_seconds = rescan_seconds
+        self.lock = threading.Lock()
+        self.by_id = {}
+        self.order = []
+        self.scanned_at = None
+        # id -> [database, last used]
+        self.opened = collections.OrderedDict()
+        # id -> lock held while that database is opened, outside self.lock
+        self.opening = {}
+        self.closed = 0
+
+    def _default_entry(self):
+        if not self.default_path or not os.path.isfile(self.default_path):
+            return None
+        folder, name = os.path.split(os.path.abspath(self.default_path))
+        # DB_PATH may name the viewer copy, the source or any other file
+        source = os.path.join(folder, SOURCE_NAME) if name in (SOURCE_NAME, VIEWER_NAME) else self.default_path
+        entry = _entry(source, self.root)
+        entry["path"] = os.path.abspath(self.default_path)
+        return entry
+
+    def _scan(self):
+        entries = discover(self.root) if self.root and os.path.isdir(self.root) else []
+        default = self._default_entry()
+        if default:
+            entries = [default] + [entry for entry in entries if entry["id"] != default["id"]]
+        self.by_id = {entry["id"]: entry for entry in entries}
+        self.order = entries
+        self.scanned_at = time.monotonic()
+
+    def entries(self):
+        """Known databases, DB_PATH first, then newest first."""
+        with self.lock:
+            if self.scanned_at is None or time.monotonic() - self.scanned_at > self.rescan_seconds:
+                self._scan()
+            return list(self.order)
+
+    def get(self, db_id=None):
+        """The open database for db_id (default: DB_PATH, else the newest), opened now if needed."""
+        entries = self.entries()
+        with self.lock:
+            if db_id is None:
+                if not entries:
+                    raise UnknownDatabase("no database found (set DB_PATH or DATA_ROOT)")
+                db_id = entries[0]["id"]
+            entry = self.by_id.get(db_id)
+            if entry is None:
+                raise UnknownDatabase(f"unknown database {db_id!r}")
+            database = self._use(db_id, entry)
+            if database is not None:
+                return database
+            opening = self.opening.setdefault(db_id, threading.Lock())
+        # Opening hashes the whole file and may convert a legacy database: only the requests for this database wait
+        # for it, the registry lock is only taken to install it
+        with opening:
+            with self.lock:
+                # Opened by the request that held the lock before this one
+                database = self._use(db_id, entry)
+                if database is not None:
+                    return database
+            database = self.open_database(entry)
+            with self.lock:
+                self.opened[db_id] = [database, time.monotonic()]
+                return self._use(db_id, entry)
+
+    def _use(self, db_id, entry):
+        # The open database for entry, marked as just used, else None. Called with self.lock held
+        slot = self.opened.get(db_id)
+        if slot is not None and slot[0].source != entry["path"]:
+            # The viewer copy was built (or dropped) since it was opened
+            self._close(db_id)
+            slot = None
+        if slot is None:
+            return None
+        now = slot[1] = time.monotonic()
+        self.opened.move_to_end(db_id)
+        for other_id, (_, last_used) in list(self.opened.items()):
+            if other_id != db_id and (len(self.opened) > self.max_open or now - last_used > self.idle_seconds):
+                self._close(other_id)
+        return slot[0]
+
+    def _close(self, db_id):
+        database, _ = self.opened.pop(db_id)
+        database.close()
+        self.closed += 1
+
+    def close(self):
+        with self.lock:
+            for db_id in list(self.opened):
+                self._close(db_id)
+
+    def stats(self):
+        with self.lock:
+            return {"known": len(self.order), "open": list(self.opened), "max_open": self.max_open,
+                    "closed": self.closed}
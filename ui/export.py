@@ -0,0 +1,257 @@
+#!/usr/bin/env python3
+import argparse
+import concurrent.futures
+import csv
+import gzip
+import html
+import json
+import os
+import re
+import sys
+import time
+from datetime import datetime, timezone
+
+import db_pool
+import message_query
+
+FORMATS = ("jsonl", "csv", "html")
+# Columns of every exported message, in this order
+EXPORT_FIELDS = ("id", "chat_id", "timestamp_ms", "time", "from_me", "sender", "text", "quoted_text", "media_name",
+                 "media_path", "media_mime", "message_type")
+# gzip level of --gzip output: 1 is several times faster than 9 for slightly larger files
+GZIP_LEVEL = 6
+# Buffer in front of each output file, so rows are written in large blocks
+WRITE_BUFFER = 1024 * 1024
+# Progress line at most this often
+PROGRESS_SECONDS = 5
+
+CHATS_QUERY = f"""
+SELECT m.chat_row_id AS chat_id, COUNT(*) AS messages, {message_query.CHAT_NAME} AS chat_name
+FROM message m
+LEFT JOIN chat c ON m.chat_row_id = c._id
+LEFT JOIN jid j ON c.jid_row_id = j._id
+GROUP BY m.chat_row_id
+"""
+
+# A whole chat oldest first. Read row by row from the (chat_row_id, timestamp, _id) index of the viewer database,
+# so memory does not depend on the size of the chat
+CHAT_MESSAGES_QUERY = message_query.MESSAGE_QUERY + "WHERE m.chat_row_id = ? ORDER BY m.timestamp, m._id"
+
+HTML_HEAD = """<!DOCTYPE html>
+<html lang="en">
+<head>
+<meta charset="utf-8">
+<title>{title}</title>
+<style>
+  body {{ font-family: system-ui, sans-serif; background: #efeae2; margin: 0 auto; max-width: 800px; padding: 16px; }}
+  h1 {{ font-size: 20px; }}
+  .date {{ text-align: center; margin: 16px 0 8px; color: #555; font-size: 12px; }}
+  .msg {{ background: #fff; border-radius: 8px; padding: 6px 10px; margin: 4px 0; max-width: 75%;
+          white-space: pre-wrap; word-wrap: break-word; }}
+  .me {{ background: #d9fdd3; margin-left: auto; }}
+  .sender {{ color: #008069; font-size: 12px; font-weight: 600; }}
+  .quoted {{ border-left: 3px solid #06cf9c; background: #f0f0f0; padding: 2px 6px; margin-bottom: 4px;
+             font-size: 13px; color: #555; }}
+  .media {{ color: #555; font-style: italic; }}
+  .time {{ color: #999; font-size: 11px; text-align: right; }}
+  a {{ color: #008069; }}
+</style>
+</head>
+<body>
+<h1>{title}</h1>
+"""
+HTML_TAIL = "</body>\n</html>\n"
+
+# Connections of this worker process, reused for every chat it exports
+pool = None
+
+
+def _file_name(chat_id, chat_name, fmt, compress):
+    # Chat names are phone numbers or group subjects: keep them readable but safe on every file system
+    safe = re.sub(r"[^\w.-]+", "_", chat_name).strip("._")[:60]
+    return f"{chat_id}-{safe}.{fmt}" + (".gz" if compress else "")
+
+
+def _open_output(path, compress):
+    if compress:
+        return gzip.open(path, "wt", encoding="utf-8", newline="", compresslevel=GZIP_LEVEL)
+    return open(path, "w", encoding="utf-8", newline="", buffering=WRITE_BUFFER)
+
+
+def export_row(chat_id, r):
+    timestamp_ms = int(r["timestamp_ms"]) if r["timestamp_ms"] is not None else 0
+    return {
+        "id": r["id"],
+        "chat_id": chat_id,
+        "timestamp_ms": timestamp_ms,
+        "time": datetime.fromtimestamp(timestamp_ms / 1000, timezone.utc).isoformat(timespec="seconds"),
+        "from_me": bool(r["from_me"]),
+        "sender": message_query.sender_label(r),
+        "text": r["text"] or "",
+        "quoted_text": r["quoted_text"] or "",
+        "media_name": message_query.media_name(r),
+        "media_path": message_query.media_path(r) or "",
+        "media_mime": r["media_mime"] or "",
+        "message_type": r["message_type"] if r["message_type"] is not None else "",
+    }
+
+
+def _write_jsonl(out, rows):
+    for row in rows:
+        out.write(json.dumps(row, ensure_ascii=False) + "\n")
+
+
+def _write_csv(out, rows):
+    writer = csv.writer(out)
+    writer.writerow(EXPORT_FIELDS)
+    for row in rows:
+        writer.writerow([row[field] for field in EXPORT_FIELDS])
+
+
+def _write_html(out, rows, chat_name):
+    out.write(HTML_HEAD.format(title=html.escape(chat_name)))
+    last_date = None
+    for row in rows:
+        # Local time of the machine running the export, like the viewer shows it
+        sent = datetime.fromtimestamp(row["timestamp_ms"] / 1000)
+        date = sent.strftime("%Y-%m-%d")
+        if date != last_date:
+            out.write(f'<div class="date">{date}</div>\n')
+            last_date = date
+        parts = [f'<div class="msg{" me" if row["from_me"] else ""}" id="m{row["id"]}">']
+        if not row["from_me"]:
+            parts.append(f'<div class="sender">{html.escape(row["sender"])}</div>')
+        if row["quoted_text"]:
+            parts.append(f'<div class="quoted">{html.escape(row["quoted_text"])}</div>')
+        if row["media_name"]:
+            parts.append(f'<div class="media">{html.escape(row["media_name"])}</div>')
+        parts.append(html.escape(row["text"]))
+        parts.append(f'<div class="time">{sent.strftime("%H:%M")}</div></div>\n')
+        out.write("".join(parts))
+    out.write(HTML_TAIL)
+
+
+def export_chat(db_path, chat, out_dir, fmt, compress):
+    """Write one chat to its own file in out_dir. Runs in a worker process."""
+    global pool
+    start = time.monotonic()
+    path = os.path.join(out_dir, _file_name(chat["chat_id"], chat["chat_name"], fmt, compress))
+    # Written under a temporary name, so an interrupted export never leaves a truncated file behind
+    tmp = f"{path}.{os.getpid()}.tmp"
+    if pool is None or pool.path != db_path:
+        pool = db_pool.ConnectionPool(db_path)
+    conn = pool.acquire()
+    count = 0
+    try:
+        cur = conn.execute(CHAT_MESSAGES_QUERY, (chat["chat_id"],))
+        rows = (export_row(chat["chat_id"], r) for r in cur)
+
+        def counted(rows):
+            nonlocal count
+            for row in rows:
+                count += 1
+                yield row
+
+        with _open_output(tmp, compress) as out:
+            if fmt == "jsonl":
+                _write_jsonl(out, counted(rows))
+            elif fmt == "csv":
+                _write_csv(out, counted(rows))
+            else:
+                _write_html(out, counted(rows), chat["chat_name"])
+        os.replace(tmp, path)
+    except Exception as e:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        return {**chat, "error": f"{type(e).__name__}: {e}"}
+    finally:
+        pool.release(conn)
+    return {**chat, "file": os.path.basename(path), "messages": count, "bytes": os.path.getsize(path),
+            "seconds": round(time.monotonic() - start, 3)}
+
+
+def write_index(out_dir, results, fmt):
+    """chats.json listing every exported file; for HTML also an index.html linking to the chats."""
+    results = sorted(results, key=lambda r: -r["messages"])
+    with open(os.path.join(out_dir, "chats.json"), "w", encoding="utf-8") as f:
+        json.dump([{key: r[key] for key in ("chat_id", "chat_name", "messages", "file")} for r in results], f,
+                  indent=2, ensure_ascii=False)
+    if fmt != "html":
+        return
+    with open(os.path.join(out_dir, "index.html"), "w", encoding="utf-8") as f:
+        f.write(HTML_HEAD.format(title="WhatsApp chats"))
+        f.write("<ul>\n")
+        for r in results:
+            f.write(f'<li><a href="{html.escape(r["file"])}">{html.escape(r["chat_name"])}</a> '
+                    f'({r["messages"]} messages)</li>\n')
+        f.write("</ul>\n" + HTML_TAIL)
+
+
+def export(db_path, out_dir, fmt="jsonl", compress=False, workers=None, chat_ids=None):
+    """Export every chat (or those in chat_ids) of the database at db_path to out_dir, one file per chat, several
+    chats at once on a process pool. Returns (exported, failed) result lists."""
+    os.makedirs(out_dir, exist_ok=True)
+    source = db_pool.ConnectionPool(db_path)
+    conn = source.acquire()
+    chats = [dict(row) for row in conn.execute(CHATS_QUERY)]
+    source.release(conn)
+    source.close()
+    if chat_ids:
+        chats = [chat for chat in chats if chat["chat_id"] in chat_ids]
+    # Largest first, so one big chat does not start last and keep a single worker busy at the end
+    chats.sort(key=lambda chat: -chat["messages"])
+
+    workers = workers or os.cpu_count() or 1
+    total = sum(chat["messages"] for chat in chats)
+    print(f"[*] Exporting {len(chats)} chats ({total} messages) to {out_dir} as {fmt}"
+          f"{'.gz' if compress else ''} with {workers} processes...")
+    start = last_report = time.monotonic()
+    exported, failed, written = [], [], 0
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(export_chat, db_path, chat, out_dir, fmt, compress) for chat in chats]
+        for future in concurrent.futures.as_completed(futures):
+            result = future.result()
+            if "error" in result:
+                failed.append(result)
+                print(f"[✖] Chat {result['chat_id']} ({result['chat_name']}): {result['error']}")
+                continue
+            exported.append(result)
+            written += result["messages"]
+            if time.monotonic() - last_report >= PROGRESS_SECONDS:
+                last_report = time.monotonic()
+                print(f"[i] {len(exported)}/{len(chats)} chats, {written}/{total} messages "
+                      f"({written / (last_report - start):.0f} messages/s)")
+    write_index(out_dir, exported, fmt)
+    elapsed = time.monotonic() - start
+    size_mb = sum(r["bytes"] for r in exported) / 1048576
+    print(f"[✔] Exported {written} messages from {len(exported)} chats in {elapsed:.1f}s "
+          f"({written / elapsed if elapsed else 0:.0f} messages/s, {size_mb:.1f} MB) -> {out_dir}")
+    return exported, failed
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Export every chat of a WhatsApp database, one file per chat")
+    parser.add_argument("db", help="msgstore.viewer.db (or msgstore.db) to export")
+    parser.add_argument("--out", help="output directory (default: export-<format> next to the database)")
+    parser.add_argument("--format", choices=FORMATS, default="jsonl")
+    parser.add_argument("--gzip", action="store_true", help="compress every file (.gz)")
+    parser.add_argument("--workers", type=int, help="export processes (default: one per CPU core)")
+    parser.add_argument("--chat", type=int, action="append", dest="chat_ids", metavar="ID",
+                        help="only this chat id (repeatable)")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    if not os.path.isfile(args.db):
+        print(f"[✖] DB file not found at {args.db!r}")
+        sys.exit(1)
+    db_path = os.path.abspath(args.db)
+    out_dir = args.out or os.path.join(os.path.dirname(db_path), f"export-{args.format}")
+    _, failed = export(db_path, out_dir, args.format, args.gzip, args.workers, args.chat_ids)
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
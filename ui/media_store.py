@@ -0,0 +1,216 @@
+import hashlib
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
+
+# A lookup that misses rescans the media folder, at most this often
+RESCAN_SECONDS = 60
+THUMBNAIL_SIZE = 320
+THUMBNAIL_QUALITY = 80
+THUMBNAIL_WORKERS = 4
+# Eviction stops once the cache is this far below its limit, so it does not run again on the next write
+EVICT_TO = 0.9
+
+
+def _key(path):
+    return path.replace("\\", "/").strip("/").lower()
+
+
+def _pillow():
+    try:
+        # pip install pillow
+        from PIL import Image, ImageOps
+    except ImportError:
+        return None
+    return Image, ImageOps
+
+
+class MediaIndex:
+    """Files under the media folder by their relative path and every tail of it (file name, parent/file name, ...),
+    so /media resolves a path from the database with dict lookups instead of stat calls, whether the folder is the
+    WhatsApp folder, its Media subfolder or the storage root above it. Only files found in the folder are served, and
+    only a file whose path ends with the whole stored path, or whose path inside the folder is the end of the stored
+    one: a file that merely has the same name is never shown as the attachment."""
+
+    def __init__(self, root, rescan_seconds=RESCAN_SECONDS):
+        self.root = os.path.abspath(root)
+        self.root_name = _key(os.path.basename(self.root))
+        self.rescan_seconds = rescan_seconds
+        self.by_path = {}
+        self.by_suffix = {}
+        self.files = 0
+        self.lock = threading.Lock()
+        self.ready = threading.Event()
+        self.scanning = False
+        self.scanned_at = 0
+        self.scan()
+
+    def scan(self):
+        """Rescan the folder in the background; lookups keep using the previous index until it is done."""
+        with self.lock:
+            if self.scanning:
+                return
+            self.scanning = True
+        threading.Thread(target=self._scan, name="media-index", daemon=True).start()
+
+    def _scan(self):
+        by_path, by_suffix, files = {}, {}, 0
+        try:
+            for dirpath, _, filenames in os.walk(self.root):
+                for name in filenames:
+                    path = os.path.join(dirpath, name)
+                    key = _key(os.path.relpath(path, self.root))
+                    by_path[key] = path
+                    parts = key.split("/")
+                    for i in range(len(parts)):
+                        suffix = "/".join(parts[i:])
+                        # A tail shared by several files (IMG-1.jpg in Sent/ and above it) resolves to none of them
+                        by_suffix[suffix] = None if suffix in by_suffix else path
+                    files += 1
+        finally:
+            self.by_path, self.by_suffix, self.files = by_path, by_suffix, files
+            self.scanned_at = time.monotonic()
+            self.scanning = False
+            self.ready.set()
+
+    def _resolve(self, raw_path):
+        key = _key(raw_path)
+        # Relative to the folder, as the stored path is
+        if key in self.by_path:
+            return self.by_path[key]
+        parts = key.split("/")
+        # The folder is above the stored path (the storage root for Media/WhatsApp Images/...): a file ending with
+        # the whole of it. At least its folder and name, a bare file name could be anyone's
+        deeper = self.by_suffix.get(key) if len(parts) >= 2 else None
+        # The folder is inside the stored path (WhatsApp/ for /storage/emulated/0/WhatsApp/Media/...): the longest
+        # tail that is a whole path in the folder. A file right in the folder matches by the folder's own name
+        shallower = None
+        for i in range(1, len(parts)):
+            path = self.by_path.get("/".join(parts[i:]))
+            if path and (len(parts) - i >= 2 or parts[i - 1] == self.root_name):
+                shallower = path
+                break
+        if deeper and shallower and deeper != shallower:
+            return None
+        return deeper or shallower
+
+    def lookup(self, raw_path):
+        """Absolute path of the media file stored as raw_path in the database, or None when no file matches it
+        unambiguously."""
+        self.ready.wait()
+        path = self._resolve(raw_path)
+        if path is None and time.monotonic() - self.scanned_at > self.rescan_seconds:
+            self.scan()
+        return path
+
+
+class ThumbnailPending(Exception):
+    """The thumbnail is still being made on the pool."""
+
+
+class ThumbnailCache:
+    """JPEG thumbnails of media images, made on a worker pool and kept on disk. The least recently used ones are
+    evicted once the cache grows past max_bytes."""
+
+    def __init__(self, cache_dir, max_bytes, size=THUMBNAIL_SIZE, workers=THUMBNAIL_WORKERS):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.size = size
+        self.pillow = _pillow()
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="thumbnail")
+        self.lock = threading.Lock()
+        self.pending = {}
+        self.total = None
+        self.hits = 0
+        self.made = 0
+
+    @property
+    def available(self):
+        return self.pillow is not None
+
+    def _target(self, path):
+        st = os.stat(path)
+        # A replaced original gets a new thumbnail; the stale one ages out of the cache
+        key = hashlib.sha1(f"{path}\0{st.st_mtime_ns}\0{st.st_size}\0{self.size}".encode()).hexdigest()
+        return os.path.join(self.cache_dir, key[:2], key + ".jpg")
+
+    def get(self, path, wait=None):
+        """Path of the thumbnail of the image at `path`; None when it cannot be made. A missing one is made on the
+        pool: raises ThumbnailPending if it is not done within `wait` seconds (None: no limit), the job carries on."""
+        if not self.available:
+            return None
+        target = self._target(path)
+        try:
+            # Marks it as recently used for eviction. The access time, as the modification time is what
+            # browsers revalidate against
+            os.utime(target, ns=(time.time_ns(), os.stat(target).st_mtime_ns))
+            self.hits += 1
+            return target
+        except FileNotFoundError:
+            pass
+        with self.lock:
+            future = self.pending.get(target)
+            if future is None:
+                # Requests for the same image while it is being made share one job
+                future = self.pending[target] = self.executor.submit(self._make, path, target)
+                future.add_done_callback(lambda _: self.pending.pop(target, None))
+        try:
+            return future.result(wait)
+        except TimeoutError:
+            raise ThumbnailPending(path) from None
+
+    def _make(self, path, target):
+        Image, ImageOps = self.pillow
+        tmp = f"{target}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            with Image.open(path) as image:
+                # JPEGs are decoded straight at a fraction of their size
+                image.draft("RGB", (self.size, self.size))
+                image = ImageOps.exif_transpose(image)
+                image.thumbnail((self.size, self.size))
+                if image.mode not in ("RGB", "L"):
+                    image = image.convert("RGB")
+                os.makedirs(os.path.dirname(target), exist_ok=True)
+                image.save(tmp, "JPEG", quality=THUMBNAIL_QUALITY)
+            os.replace(tmp, target)
+        except (OSError, ValueError, Image.DecompressionBombError):
+            # Not an image Pillow can read: the caller falls back to the original
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            return None
+        self.made += 1
+        self._account(os.path.getsize(target))
+        return target
+
+    def _cached_files(self):
+        files = []
+        for dirpath, _, filenames in os.walk(self.cache_dir):
+            for name in filenames:
+                if name.endswith(".jpg"):
+                    path = os.path.join(dirpath, name)
+                    st = os.stat(path)
+                    files.append((st.st_atime, st.st_size, path))
+        return files
+
+    def _account(self, added):
+        with self.lock:
+            if self.total is None:
+                # Left over from earlier runs
+                self.total = sum(size for _, size, _ in self._cached_files())
+            else:
+                self.total += added
+            if self.total <= self.max_bytes:
+                return
+            for _, size, path in sorted(self._cached_files()):
+                if self.total <= self.max_bytes * EVICT_TO:
+                    break
+                try:
+                    os.remove(path)
+                except OSError:
+                    continue
+                self.total -= size
+
+    def stats(self):
+        return {"available": self.available, "hits": self.hits, "made": self.made, "pending": len(self.pending),
+                "bytes": self.total, "max_bytes": self.max_bytes}
@@ -0,0 +1,44 @@
+import os
+
+# Display name of a chat: group subject, else the contact's number or JID. Expects chat c joined to jid j
+CHAT_NAME = "COALESCE(c.subject, j.user, j.raw_string, 'Unknown')"
+
+# Messages with their sender, chat, quoted text and media. Callers append the WHERE clause and the order
+MESSAGE_QUERY = """
+SELECT m._id as id,
+       m.from_me as from_me,
+       m.text_data as text,
+       m.timestamp as timestamp_ms,
+       j.user as sender_user,
+       j.raw_string as sender_raw,
+       cj.user as chat_user,
+       cj.raw_string as chat_raw,
+       mq.text_data as quoted_text,
+       mm.file_path as media_path,
+       mm.direct_path as media_direct_path,
+       mm.media_name as media_name,
+       mm.mime_type as media_mime,
+       m.message_type as message_type
+FROM message m
+LEFT JOIN jid j ON m.sender_jid_row_id = j._id
+LEFT JOIN chat c ON m.chat_row_id = c._id
+LEFT JOIN jid cj ON c.jid_row_id = cj._id
+LEFT JOIN message_quoted mq ON m._id = mq.message_row_id
+LEFT JOIN message_media mm ON m._id = mm.message_row_id
+"""
+
+
+def sender_label(r):
+    """Who sent the MESSAGE_QUERY row r: 'Me', the sender's number or JID, or the chat's for one-to-one chats."""
+    if r['from_me']:
+        return 'Me'
+    return r['sender_user'] or r['sender_raw'] or r['chat_user'] or r['chat_raw'] or 'Unknown'
+
+
+def media_path(r):
+    return r['media_path'] or r['media_direct_path'] or None
+
+
+def media_name(r):
+    path = media_path(r)
+    return r['media_name'] or (os.path.basename(path) if path else '')
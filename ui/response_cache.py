@@ -0,0 +1,60 @@
+import collections
+import threading
+
+# Rough per-entry overhead (key tuple, OrderedDict node, bytes header) counted on top of the body
+ENTRY_OVERHEAD = 256
+
+
+class ResponseCache:
+    """Rendered response bodies, least recently used evicted first once max_bytes is reached.
+    Entries belong to one database generation; the first lookup for a new generation drops the old ones."""
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        self.entries = collections.OrderedDict()
+        self.generation = None
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _start_generation(self, generation):
+        if generation != self.generation:
+            self.entries.clear()
+            self.size = 0
+            self.generation = generation
+
+    def get(self, generation, key):
+        with self.lock:
+            self._start_generation(generation)
+            body = self.entries.get(key)
+            if body is None:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return body
+
+    def put(self, generation, key, body):
+        cost = len(body) + ENTRY_OVERHEAD
+        if cost > self.max_bytes:
+            return
+        with self.lock:
+            self._start_generation(generation)
+            old = self.entries.pop(key, None)
+            if old is not None:
+                self.size -= len(old) + ENTRY_OVERHEAD
+            self.entries[key] = body
+            self.size += cost
+            while self.size > self.max_bytes:
+                _, evicted = self.entries.popitem(last=False)
+                self.size -= len(evicted) + ENTRY_OVERHEAD
+                self.evictions += 1
+
+    def stats(self):
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {"entries": len(self.entries), "bytes": self.size, "max_bytes": self.max_bytes,
+                    "hits": self.hits, "misses": self.misses, "evictions": self.evictions,
+                    "hit_rate": round(self.hits / lookups, 3) if lookups else None}
@@ -0,0 +1,215 @@
+import hashlib
+import os
+import re
+import sqlite3
+import tempfile
+import threading
+import time
+
+import db_pool
+
+SCHEMA_VERSION = 1
+# Messages read from the database and committed to the index per batch; searches see each batch as it lands
+BATCH_ROWS = 5000
+# Marks the matched terms in snippets. Control characters, so the client can escape the text first and then turn
+# them into <mark> tags
+MATCH_START = "\x02"
+MATCH_END = "\x03"
+SNIPPET_TOKENS = 16
+
+SCHEMA = """
+CREATE VIRTUAL TABLE IF NOT EXISTS message_fts USING fts5(
+    text, quoted, chat_id UNINDEXED, timestamp UNINDEXED,
+    tokenize = 'unicode61 remove_diacritics 2'
+);
+CREATE TABLE IF NOT EXISTS state (
+    key TEXT PRIMARY KEY,
+    value
+);
+"""
+
+# Walks message by primary key, so each batch starts with a seek whatever the size of the database
+BATCH_QUERY = """
+SELECT m._id, m.text_data, {quoted}, m.chat_row_id, m.timestamp
+FROM message m
+{join}
+WHERE m._id > ? AND (m.text_data IS NOT NULL OR {quoted} IS NOT NULL)
+ORDER BY m._id
+LIMIT ?
+"""
+
+
+def _fts5_available():
+    try:
+        sqlite3.connect(":memory:").execute("CREATE VIRTUAL TABLE t USING fts5(x)")
+    except sqlite3.Error:
+        return False
+    return True
+
+
+# Some Python builds ship an SQLite without FTS5
+FTS5_AVAILABLE = _fts5_available()
+
+
+def match_query(text):
+    # Every term is quoted so user input is never parsed as FTS5 syntax; "..." keeps a phrase together
+    terms = [phrase or word for phrase, word in re.findall(r'"([^"]+)"|(\S+)', text)]
+    return " ".join('"' + term.replace('"', '""') + '"' for term in terms)
+
+
+def _batch_query(conn):
+    if conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'message_quoted'").fetchone():
+        return BATCH_QUERY.format(quoted="mq.text_data",
+                                  join="LEFT JOIN message_quoted mq ON mq.message_row_id = m._id")
+    return BATCH_QUERY.format(quoted="NULL", join="")
+
+
+class SearchIndex:
+    """FTS5 index over message text and quoted text, kept in a sidecar SQLite file next to the database.
+    Built by a background thread in batches of _id, then extended with the messages added since."""
+
+    def __init__(self, db_path, index_path, pool, batch_rows=BATCH_ROWS):
+        self.db_path = db_path
+        self.index_path = index_path
+        self.pool = pool
+        self.batch_rows = batch_rows
+        self.lock = threading.Lock()
+        self.thread = None
+        self.signature = None
+        self.status = {"state": "idle", "indexed_id": 0, "max_id": 0, "rows": 0, "seconds": 0.0, "error": None}
+
+    def _open_index(self):
+        try:
+            os.makedirs(os.path.dirname(self.index_path), exist_ok=True)
+            conn = sqlite3.connect(self.index_path)
+            conn.executescript(SCHEMA)
+        except (OSError, sqlite3.Error):
+            # Read-only location: index into the temp directory instead. Every viewer copy has the same file name,
+            # so the name there also carries a digest of the database path
+            path_digest = hashlib.sha1(os.path.abspath(self.db_path).encode()).hexdigest()[:10]
+            self.index_path = os.path.join(tempfile.gettempdir(),
+                                           f"{path_digest}-{os.path.basename(self.index_path)}")
+            conn = sqlite3.connect(self.index_path)
+            conn.executescript(SCHEMA)
+        # Searches read committed batches while the next one is written
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    def ensure_current(self):
+        """Start indexing in the background when the database changed since the last run. Cheap otherwise."""
+        signature = db_pool.source_signature(self.db_path)
+        if signature == self.signature:
+            return
+        with self.lock:
+            if signature == self.signature or (self.thread and self.thread.is_alive()):
+                return
+            self.status.update(state="indexing", error=None)
+            self.thread = threading.Thread(target=self._run, args=(signature,), name="search-index", daemon=True)
+            self.thread.start()
+
+    def _run(self, signature):
+        start = time.monotonic()
+        try:
+            self._index(signature)
+            self.status["state"] = "ready"
+        except Exception as e:
+            self.status.update(state="error", error=str(e))
+        self.status["seconds"] = round(time.monotonic() - start, 3)
+        # Also after an error, so a broken database is not rescanned on every request until it changes
+        self.signature = signature
+
+    def _build_lock(self):
+        # Worker processes of ui/serve.py share the index file: one builds while the others wait, then find it
+        # current. Windows only runs a single process (waitress), so there is nothing to coordinate there
+        try:
+            import fcntl
+        except ImportError:
+            return None
+        lock = open(self.index_path + ".lock", "w")
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        return lock
+
+    def _index(self, signature):
+        index = self._open_index()
+        lock = self._build_lock()
+        conn = self.pool.acquire()
+        try:
+            state = dict(index.execute("SELECT key, value FROM state"))
+            max_id = conn.execute("SELECT MAX(_id) FROM message").fetchone()[0] or 0
+            since = state.get("max_message_id", 0)
+            if (state.get("schema_version") != SCHEMA_VERSION or state.get("db_path") != self.db_path
+                    or max_id < since):
+                # New, rebuilt from scratch or rolled back: start over
+                since = 0
+                index.execute("DELETE FROM message_fts")
+            self.status.update(indexed_id=since, max_id=max_id, rows=0)
+
+            if state.get("signature") != signature:
+                query = _batch_query(conn)
+                added = 0
+                while True:
+                    rows = conn.execute(query, (since, self.batch_rows)).fetchall()
+                    if not rows:
+                        break
+                    index.executemany("INSERT INTO message_fts (rowid, text, quoted, chat_id, timestamp) "
+                                      "VALUES (?, ?, ?, ?, ?)", (tuple(row) for row in rows))
+                    since = rows[-1][0]
+                    # Progress is saved with every batch, so an interrupted build resumes where it stopped
+                    index.executemany("INSERT OR REPLACE INTO state VALUES (?, ?)", [
+                        ("schema_version", SCHEMA_VERSION), ("db_path", self.db_path), ("max_message_id", since)])
+                    index.commit()
+                    added += len(rows)
+                    self.status.update(indexed_id=since, rows=added)
+                if added > self.batch_rows:
+                    # Merge the per-batch segments; queries then read one b-tree per term
+                    index.execute("INSERT INTO message_fts (message_fts) VALUES ('optimize')")
+
+            index.executemany("INSERT OR REPLACE INTO state VALUES (?, ?)", [
+                ("schema_version", SCHEMA_VERSION), ("db_path", self.db_path),
+                ("max_message_id", max_id), ("signature", signature)])
+            index.commit()
+            self.status["indexed_id"] = max_id
+        finally:
+            self.pool.release(conn)
+            index.close()
+            if lock:
+                # Closing the file releases the lock
+                lock.close()
+
+    def progress(self):
+        status = dict(self.status)
+        status["percent"] = round(100 * status["indexed_id"] / status["max_id"], 1) if status["max_id"] else 100.0
+        return status
+
+    def search(self, text, limit, chat_id=None, before_id=None):
+        """Messages matching `text`, newest (highest _id) first, as (id, chat_id, timestamp, snippet) rows."""
+        query = match_query(text)
+        if not query or not os.path.exists(self.index_path):
+            return []
+        sql = f"""
+        SELECT rowid, chat_id, timestamp,
+               snippet(message_fts, -1, '{MATCH_START}', '{MATCH_END}', '...', {SNIPPET_TOKENS})
+        FROM message_fts
+        WHERE message_fts MATCH ?
+        """
+        params = [query]
+        if chat_id is not None:
+            sql += " AND chat_id = ?"
+            params.append(chat_id)
+        if before_id is not None:
+            sql += " AND rowid < ?"
+            params.append(before_id)
+        # FTS5 walks its doclists in rowid order, so the LIMIT stops the scan early even for common terms
+        sql += " ORDER BY rowid DESC LIMIT ?"
+        params.append(limit)
+        conn = sqlite3.connect(self.index_path)
+        try:
+            return conn.execute(sql, params).fetchall()
+        except sqlite3.OperationalError as e:
+            # The first build has created the file but not the table yet
+            if "no such table" in str(e):
+                return []
+            raise
+        finally:
+            conn.close()
@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+import argparse
+import os
+import sys
+import threading
+
+import app as viewer
+
+# Server threads per worker process. Database work is further limited to MAX_CONCURRENT_QUERIES of them, the rest
+# stay free for /media transfers and cached pages
+THREADS = 16
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Serve the WhatsApp viewer with a production WSGI server")
+    parser.add_argument("--host", default="127.0.0.1", help="0.0.0.0 to let other machines connect")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--db", help="database to open (default: DB_PATH in app.py)")
+    parser.add_argument("--data-root", help="also offer every extraction under this folder (default: DATA_ROOT in "
+                                            "app.py)")
+    parser.add_argument("--media-root", help="WhatsApp media folder (default: MEDIA_ROOT in app.py)")
+    parser.add_argument("--threads", type=int, default=THREADS, help="request threads per worker")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="worker processes; more than 1 needs gunicorn (Linux/macOS)")
+    parser.add_argument("--max-queries", type=int, default=viewer.MAX_CONCURRENT_QUERIES,
+                        help="database queries run at once per worker")
+    parser.add_argument("--cache-mb", type=int, default=viewer.RESPONSE_CACHE_MB,
+                        help="memory for rendered pages per worker and open database (0 to disable)")
+    return parser.parse_args()
+
+
+def describe():
+    if viewer.DATA_ROOT:
+        return f"{len(viewer.databases().entries())} databases under {viewer.DATA_ROOT}"
+    return viewer.DB_PATH
+
+
+def serve_waitress(args):
+    try:
+        # pip install waitress
+        from waitress import serve
+    except ImportError:
+        print("[✖] The production server needs waitress (pip install waitress)")
+        sys.exit(1)
+    print(f"[*] Serving {describe()} on http://{args.host}:{args.port} ({args.threads} threads)")
+    serve(viewer.app, host=args.host, port=args.port, threads=args.threads)
+
+
+def serve_gunicorn(args):
+    try:
+        # pip install gunicorn
+        from gunicorn.app.base import BaseApplication
+    except ImportError:
+        print("[✖] Several workers need gunicorn (pip install gunicorn), or use --workers 1")
+        sys.exit(1)
+
+    class ViewerApplication(BaseApplication):
+        def load_config(self):
+            self.cfg.set("bind", f"{args.host}:{args.port}")
+            self.cfg.set("workers", args.workers)
+            # Threaded workers, so slow media transfers do not hold a whole process
+            self.cfg.set("worker_class", "gthread")
+            self.cfg.set("threads", args.threads)
+            # Large streamed pages and media can take a while on slow links
+            self.cfg.set("timeout", 120)
+
+        def load(self):
+            return viewer.app
+
+    print(f"[*] Serving {describe()} on http://{args.host}:{args.port} "
+          f"({args.workers} workers x {args.threads} threads)")
+    ViewerApplication().run()
+
+
+def main():
+    args = parse_args()
+    if args.db:
+        viewer.DB_PATH = os.path.abspath(args.db)
+    if args.data_root:
+        viewer.DATA_ROOT = os.path.abspath(args.data_root)
+    if args.media_root:
+        viewer.MEDIA_ROOT = os.path.abspath(args.media_root)
+    if not viewer.databases().entries():
+        print(f"[✖] DB file not found at {viewer.DB_PATH!r}. Pass --db/--data-root or edit DB_PATH in app.py.")
+        sys.exit(1)
+    viewer.MAX_CONCURRENT_QUERIES = args.max_queries
+    viewer.query_slots = threading.BoundedSemaphore(args.max_queries)
+    # Read when each database is opened
+    viewer.RESPONSE_CACHE_MB = args.cache_mb
+
+    if args.workers > 1:
+        serve_gunicorn(args)
+    else:
+        serve_waitress(args)
+
+
+if __name__ == "__main__":
+    main()
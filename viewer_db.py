@@ -0,0 +1,411 @@
+import glob
+import hashlib
+import json
+import os
+import pathlib
+import shutil
+import sqlite3
+import stat
+import tempfile
+import time
+
+VIEWER_DB_SUFFIX = ".viewer.db"
+
+# (name, table, columns) for the access paths of ui/app.py; skipped when the table or a column is missing
+VIEWER_INDEXES = [
+    # /messages pages and the chat preview: seek to one chat, walk it in timestamp order
+    ("viewer_message_chat_timestamp", "message", ("chat_row_id", "timestamp", "_id")),
+    # Chat list order
+    ("viewer_chat_sort", "chat", ("sort_timestamp", "_id")),
+]
+
+
+# Modern tables the viewer reads, as a legacy (2.11-era) msgstore.db is converted into: the columns ui/app.py,
+# the chat summaries and the search index use, named as in current WhatsApp versions
+MODERN_SCHEMA = """
+CREATE TABLE jid (
+    _id INTEGER PRIMARY KEY AUTOINCREMENT,
+    user TEXT NOT NULL,
+    server TEXT NOT NULL,
+    raw_string TEXT UNIQUE
+);
+CREATE TABLE chat (
+    _id INTEGER PRIMARY KEY AUTOINCREMENT,
+    jid_row_id INTEGER UNIQUE,
+    subject TEXT,
+    sort_timestamp INTEGER
+);
+CREATE TABLE message (
+    _id INTEGER PRIMARY KEY AUTOINCREMENT,
+    chat_row_id INTEGER NOT NULL,
+    from_me INTEGER NOT NULL,
+    key_id TEXT NOT NULL,
+    sender_jid_row_id INTEGER,
+    status INTEGER,
+    timestamp INTEGER,
+    received_timestamp INTEGER,
+    message_type INTEGER,
+    text_data TEXT
+);
+CREATE TABLE message_media (
+    message_row_id INTEGER PRIMARY KEY,
+    chat_row_id INTEGER,
+    file_path TEXT,
+    file_size INTEGER,
+    direct_path TEXT,
+    message_url TEXT,
+    mime_type TEXT,
+    media_name TEXT,
+    media_duration INTEGER
+);
+CREATE TABLE message_quoted (
+    message_row_id INTEGER PRIMARY KEY,
+    chat_row_id INTEGER NOT NULL,
+    text_data TEXT
+);
+"""
+
+# Holds the hash of the msgstore.db a viewer copy was built from
+META_TABLE = "viewer_meta"
+# Bumped when the contents of a viewer copy change, so copies built by an older version are rebuilt
+# 2: a missing chat.sort_timestamp is stored as 0
+VIEWER_FORMAT = 2
+HASH_CHUNK = 1024 * 1024
+
+
+def viewer_db_path(msgstore_path):
+    return os.path.splitext(msgstore_path)[0] + VIEWER_DB_SUFFIX
+
+
+def source_digest(msgstore_path):
+    """SHA-256 of msgstore.db and its -wal: what a viewer copy was built from."""
+    h = hashlib.sha256()
+    for path in (msgstore_path, msgstore_path + "-wal"):
+        if os.path.exists(path):
+            with open(path, "rb") as f:
+                while chunk := f.read(HASH_CHUNK):
+                    h.update(chunk)
+    return h.hexdigest()
+
+
+def source_stat(msgstore_path):
+    """Size and mtime of msgstore.db and its -wal: source_digest is the same for as long as they are."""
+    return [[st.st_size, st.st_mtime_ns] for st in (os.stat(path) for path in (msgstore_path, msgstore_path + "-wal")
+                                                    if os.path.exists(path))]
+
+
+def _tables(conn):
+    return {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+
+
+def _is_legacy(conn):
+    # WhatsApp 2.11 (the version the extractor installs) keeps everything in messages/chat_list
+    tables = _tables(conn)
+    return "messages" in tables and "message" not in tables
+
+
+def is_legacy(db_path):
+    # Immutable, so the -shm and -wal next to an extracted msgstore.db stay as they are; only the schema is read
+    conn = sqlite3.connect(pathlib.Path(db_path).resolve().as_uri() + "?immutable=1", uri=True)
+    try:
+        return _is_legacy(conn)
+    finally:
+        conn.close()
+
+
+def convert_legacy(conn):
+    """Fill the modern jid/chat/message/message_media/message_quoted tables from the legacy messages and chat_list
+    tables of conn, then drop messages (msgstore.db keeps the original). One INSERT ... SELECT per table, in a
+    single transaction. Returns the number of messages converted."""
+    columns = _columns(conn, "messages")
+    has_chat_list = "chat_list" in _tables(conn)
+    # Only in some legacy versions
+    text = "COALESCE(m.data, m.media_caption)" if "media_caption" in columns else "m.data"
+    sender = "m.remote_resource" if "remote_resource" in columns else "NULL"
+    sort_timestamp = "NULL"
+    if has_chat_list and "sort_timestamp" in _columns(conn, "chat_list"):
+        sort_timestamp = "NULLIF(cl.sort_timestamp, 0)"
+
+    # DISTINCT key_remote_jid is read from the messages_key_index alone
+    jids = ["SELECT DISTINCT key_remote_jid AS raw FROM messages"]
+    if "remote_resource" in columns:
+        # Group members
+        jids.append("SELECT remote_resource FROM messages")
+    if has_chat_list:
+        jids.append("SELECT key_remote_jid FROM chat_list")
+    # A legacy database starts with a placeholder row whose key_remote_jid is -1
+    statements = [f"""
+    INSERT INTO jid (user, server, raw_string)
+    SELECT CASE WHEN instr(raw, '@') THEN substr(raw, 1, instr(raw, '@') - 1) ELSE raw END,
+           CASE WHEN instr(raw, '@') THEN substr(raw, instr(raw, '@') + 1) ELSE '' END,
+           raw
+    FROM ({" UNION ".join(jids)})
+    WHERE raw IS NOT NULL AND raw NOT IN ('', '-1')
+    """]
+    if has_chat_list:
+        statements.append(f"""
+        INSERT INTO chat (_id, jid_row_id, subject, sort_timestamp)
+        SELECT cl._id, j._id, cl.subject, {sort_timestamp}
+        FROM chat_list cl
+        JOIN jid j ON j.raw_string = cl.key_remote_jid
+        """)
+    # Chats with messages but no chat_list row
+    statements.append("""
+    INSERT INTO chat (jid_row_id)
+    SELECT j._id
+    FROM (SELECT DISTINCT key_remote_jid FROM messages) t
+    JOIN jid j ON j.raw_string = t.key_remote_jid
+    WHERE j._id NOT IN (SELECT jid_row_id FROM chat)
+    """)
+    # CROSS JOIN keeps messages as the outer loop, so rows are read and appended in _id order
+    statements.append(f"""
+    INSERT INTO message (_id, chat_row_id, from_me, key_id, sender_jid_row_id, status, timestamp,
+                         received_timestamp, message_type, text_data)
+    SELECT m._id, c._id, COALESCE(m.key_from_me, 0), m.key_id, s._id, m.status, m.timestamp,
+           m.received_timestamp, CAST(m.media_wa_type AS INTEGER), {text}
+    FROM messages m
+    CROSS JOIN jid cj ON cj.raw_string = m.key_remote_jid
+    CROSS JOIN chat c ON c.jid_row_id = cj._id
+    LEFT JOIN jid s ON s.raw_string = {sender}
+    """)
+    # The file path of legacy media sits in a serialized Java object (thumb_image). Its file name is enough for
+    # the viewer's media index, which also resolves bare names
+    statements.append("""
+    INSERT INTO message_media (message_row_id, chat_row_id, file_path, file_size, message_url, mime_type,
+                               media_name, media_duration)
+    SELECT m._id, mm.chat_row_id, m.media_name, m.media_size, m.media_url, m.media_mime_type, m.media_name,
+           m.media_duration
+    FROM messages m
+    CROSS JOIN message mm ON mm._id = m._id
+    WHERE m.media_wa_type != '0' AND COALESCE(m.media_name, m.media_url, m.media_mime_type) IS NOT NULL
+    """)
+    if "quoted_row_id" in columns and "messages_quotes" in _tables(conn):
+        statements.append("""
+        INSERT INTO message_quoted (message_row_id, chat_row_id, text_data)
+        SELECT m._id, mm.chat_row_id, q.data
+        FROM messages m
+        CROSS JOIN message mm ON mm._id = m._id
+        JOIN messages_quotes q ON q._id = m.quoted_row_id
+        WHERE m.quoted_row_id > 0
+        """)
+    # Chats without a sort_timestamp sort by their last message: one grouped pass over the converted messages
+    statements.append("""
+    CREATE TEMP TABLE last_message (chat_row_id INTEGER PRIMARY KEY, timestamp INTEGER)
+    """)
+    statements.append("""
+    INSERT INTO last_message
+    SELECT chat_row_id, MAX(timestamp) FROM message
+    WHERE chat_row_id IN (SELECT _id FROM chat WHERE sort_timestamp IS NULL)
+    GROUP BY chat_row_id
+    """)
+    statements.append("""
+    UPDATE chat SET sort_timestamp = (SELECT timestamp FROM last_message WHERE chat_row_id = chat._id)
+    WHERE sort_timestamp IS NULL
+    """)
+    statements.append("DROP TABLE last_message")
+    statements.append("DROP TABLE messages")
+
+    isolation_level = conn.isolation_level
+    conn.isolation_level = None
+    try:
+        conn.execute("BEGIN")
+        for statement in MODERN_SCHEMA.split(";")[:-1]:
+            conn.execute(statement)
+        for statement in statements:
+            conn.execute(statement)
+        converted = conn.execute("SELECT COUNT(*) FROM message").fetchone()[0]
+        conn.execute("COMMIT")
+    except BaseException:
+        conn.execute("ROLLBACK")
+        raise
+    finally:
+        conn.isolation_level = isolation_level
+    return converted
+
+
+def _built_from(out_path, digest):
+    """Stats of the viewer copy at out_path if it was built from the source with this digest, else None."""
+    if not os.path.isfile(out_path):
+        return None
+    try:
+        conn = sqlite3.connect(pathlib.Path(out_path).resolve().as_uri() + "?mode=ro", uri=True)
+        try:
+            meta = dict(conn.execute(f"SELECT key, value FROM {META_TABLE}"))
+        finally:
+            conn.close()
+    except sqlite3.Error:
+        # Built before the hash was recorded, or not a viewer copy
+        return None
+    if meta.get("source_sha256") != digest or meta.get("format") != VIEWER_FORMAT:
+        return None
+    return {"indexes": [], "size": os.path.getsize(out_path), "seconds": 0.0, "cached": True,
+            "legacy_messages": meta.get("legacy_messages")}
+
+
+def legacy_viewer_db(msgstore_path, cache_dir):
+    """Viewer copy of a legacy msgstore.db that has none next to it, built in cache_dir on first use. Named after
+    the hash of the source, so each version of the file is converted once."""
+    stem = os.path.splitext(os.path.basename(msgstore_path))[0]
+    os.makedirs(cache_dir, exist_ok=True)
+    digest = _known_digest(msgstore_path, cache_dir)
+    out_path = os.path.join(cache_dir, f"{stem}-{digest[:16]}{VIEWER_DB_SUFFIX}")
+    # Also checks that the copy there is complete and of the current VIEWER_FORMAT
+    _, stats = build_viewer_db(msgstore_path, out_path, digest)
+    if not stats.get("cached"):
+        # Copies of earlier versions of the file
+        for old in glob.glob(os.path.join(glob.escape(cache_dir), f"{glob.escape(stem)}-*{VIEWER_DB_SUFFIX}")):
+            if old != out_path:
+                _remove(old)
+    return out_path
+
+
+def _known_digest(msgstore_path, cache_dir):
+    # Every open of the database asks for the copy's name: the source is only hashed again once its size or mtime
+    # changed. One record per source path, as several extractions can share cache_dir
+    path_digest = hashlib.sha1(os.path.abspath(msgstore_path).encode()).hexdigest()[:10]
+    record_path = os.path.join(cache_dir, f"{path_digest}-{os.path.basename(msgstore_path)}.source.json")
+    signature = source_stat(msgstore_path)
+    try:
+        with open(record_path, encoding="utf-8") as f:
+            record = json.load(f)
+        if record["stat"] == signature:
+            return record["digest"]
+    except (OSError, ValueError, KeyError, TypeError):
+        pass
+    digest = source_digest(msgstore_path)
+    fd, tmp_path = tempfile.mkstemp(prefix=os.path.basename(record_path) + ".", suffix=".tmp", dir=cache_dir)
+    with os.fdopen(fd, "w", encoding="utf-8") as f:
+        json.dump({"stat": signature, "digest": digest}, f)
+    os.replace(tmp_path, record_path)
+    return digest
+
+
+def chat_sort_expression(conn):
+    """What orders the chats of conn by sort_timestamp: the bare column in a viewer copy, which has no NULLs left,
+    else the column with NULL read as 0."""
+    try:
+        row = conn.execute(f"SELECT value FROM {META_TABLE} WHERE key = 'format'").fetchone()
+    except sqlite3.Error:
+        # Not a viewer copy
+        row = None
+    return "c.sort_timestamp" if row and row[0] >= 2 else "COALESCE(c.sort_timestamp, 0)"
+
+
+def _columns(conn, table):
+    return {row[1] for row in conn.execute(f"PRAGMA table_info({table})")}
+
+
+def _remove(path):
+    if os.path.exists(path):
+        # The previous copy is read-only, which Windows refuses to delete
+        os.chmod(path, stat.S_IREAD | stat.S_IWRITE)
+        os.remove(path)
+
+
+def _backup_source(msgstore_path, dst, work_dir):
+    """Copy msgstore.db and whatever is still in its WAL into the connection dst, without touching the source files.
+    They are evidence listed in the manifest, and even a ?mode=ro connection rewrites the -shm of a WAL database and
+    creates an empty -wal. With nothing in the WAL, msgstore.db alone is the whole database and is opened immutable,
+    which reads no other file. Otherwise msgstore.db and its -wal are copied to work_dir first and the backup reads
+    the copy (SQLite rebuilds its -shm)."""
+    wal_path = msgstore_path + "-wal"
+    if not os.path.exists(wal_path) or os.path.getsize(wal_path) == 0:
+        src = sqlite3.connect(pathlib.Path(msgstore_path).resolve().as_uri() + "?immutable=1", uri=True)
+        try:
+            src.backup(dst)
+        finally:
+            src.close()
+        return
+    snapshot_dir = tempfile.mkdtemp(prefix=".snapshot-", dir=work_dir)
+    try:
+        snapshot = os.path.join(snapshot_dir, os.path.basename(msgstore_path))
+        shutil.copyfile(msgstore_path, snapshot)
+        shutil.copyfile(wal_path, snapshot + "-wal")
+        src = sqlite3.connect(snapshot)
+        try:
+            src.backup(dst)
+        finally:
+            src.close()
+    finally:
+        shutil.rmtree(snapshot_dir, ignore_errors=True)
+
+
+def build_viewer_db(msgstore_path, out_path=None, digest=None):
+    """Copy msgstore.db (with its -wal) into a standalone, indexed, read-only database for the viewer, converted
+    to the modern layout when it is a legacy one. Nothing is done when out_path was built from the same source.
+    Returns (out_path, stats)."""
+    out_path = out_path or viewer_db_path(msgstore_path)
+    digest = digest or source_digest(msgstore_path)
+    cached = _built_from(out_path, digest)
+    if cached:
+        return out_path, cached
+    lock = _build_lock(out_path)
+    try:
+        # Built by the process that held the lock before this one
+        cached = _built_from(out_path, digest)
+        if cached:
+            return out_path, cached
+        return out_path, _build(msgstore_path, out_path, digest)
+    finally:
+        if lock:
+            lock.close()
+
+
+def _build_lock(out_path):
+    # Worker processes of ui/serve.py opening the same legacy database, or two runs of whatsapp.py on one folder:
+    # one builds while the others wait, then find the copy current. Windows only runs a single viewer process
+    # (waitress), so there is nothing to coordinate there
+    try:
+        import fcntl
+    except ImportError:
+        return None
+    lock = open(out_path + ".lock", "w")
+    fcntl.flock(lock, fcntl.LOCK_EX)
+    return lock
+
+
+def _build(msgstore_path, out_path, digest):
+    folder, name = os.path.split(os.path.abspath(out_path))
+    # Left behind by a build that was killed; nobody else builds this copy while the lock is held
+    for stale in glob.glob(os.path.join(glob.escape(folder), f"{glob.escape(name)}.*.tmp")):
+        _remove(stale)
+    fd, tmp_path = tempfile.mkstemp(prefix=name + ".", suffix=".tmp", dir=folder)
+    os.close(fd)
+    start = time.monotonic()
+
+    dst = sqlite3.connect(tmp_path)
+    try:
+        _backup_source(msgstore_path, dst, folder)
+        # The copy inherits WAL mode from the source; the viewer copy must not need -wal/-shm files
+        dst.execute("PRAGMA journal_mode=DELETE")
+        legacy_messages = None
+        if _is_legacy(dst):
+            # A throwaway file until it is renamed: no need to sync every write of the conversion
+            dst.execute("PRAGMA synchronous=OFF")
+            legacy_messages = convert_legacy(dst)
+        dst.execute(f"CREATE TABLE {META_TABLE} (key TEXT PRIMARY KEY, value)")
+        dst.executemany(f"INSERT INTO {META_TABLE} VALUES (?, ?)",
+                        [("source_sha256", digest), ("legacy_messages", legacy_messages), ("format", VIEWER_FORMAT)])
+        if "sort_timestamp" in _columns(dst, "chat"):
+            # The chat list orders on the bare column, so it can walk the viewer_chat_sort index instead of sorting
+            dst.execute("UPDATE chat SET sort_timestamp = 0 WHERE sort_timestamp IS NULL")
+        created = []
+        for name, table, columns in VIEWER_INDEXES:
+            if set(columns) <= _columns(dst, table):
+                dst.execute(f"CREATE INDEX IF NOT EXISTS {name} ON {table} ({', '.join(columns)})")
+                created.append(name)
+        dst.commit()
+        dst.execute("ANALYZE")
+        dst.commit()
+        dst.execute("VACUUM")
+    except BaseException:
+        dst.close()
+        _remove(tmp_path)
+        raise
+    dst.close()
+
+    _remove(out_path)
+    os.replace(tmp_path, out_path)
+    os.chmod(out_path, stat.S_IREAD | stat.S_IRGRP | stat.S_IROTH)
+    return {"indexes": created, "size": os.path.getsize(out_path), "seconds": time.monotonic() - start,
+            "legacy_messages": legacy_messages}
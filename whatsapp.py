@@ -1,38 +1,190 @@
 #!/usr/bin/env python3
+import argparse
+import atexit
+import concurrent.futures
+import contextlib
+import glob
+import hashlib
+import importlib.util
+import multiprocessing
+import queue
 import subprocess
+import threading
+import traceback
 import os
+import re
 import sys
 import shutil
+import sqlite3
 import json
+import tarfile
+import time
 from datetime import datetime
-import whatsapp_config as config
+import adb_client
+import android_backup
+import device_commands
+import viewer_db
+
+
+def load_config():
+    # WHATSAPP_CONFIG names another config file (one per case, or a test's); whatsapp_config.py otherwise
+    path = os.environ.get("WHATSAPP_CONFIG")
+    if not path:
+        import whatsapp_config
+        return whatsapp_config
+    spec = importlib.util.spec_from_file_location("whatsapp_config", path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+config = load_config()
 
 # Directories from config
 ADB_PATH = os.path.normpath(config.ADB_PATH)
 ABE_JAR_PATH = os.path.normpath(config.ABE_JAR_PATH)
-TAR_PATH = os.path.normpath(config.TAR_PATH)
 LEGACY_WHATSAPP_APK = os.path.normpath(config.LEGACY_WHATSAPP_APK)
 DATA_DIR = os.path.normpath(config.DATA_DIR)
 LOGS_DIR = os.path.normpath(config.LOGS_DIR)
+AB_BACKEND = getattr(config, "AB_BACKEND", "native")
+AB_FOLLOW = getattr(config, "AB_FOLLOW", False)
+EXTRACT_PATTERNS = getattr(config, "EXTRACT_PATTERNS", ["f/key", "db/*"])
+BACKUP_PASSWORD = getattr(config, "BACKUP_PASSWORD", None)
+ADB_CLIENT = getattr(config, "ADB_CLIENT", "binary")
+ADB_RESET_SERVER = getattr(config, "ADB_RESET_SERVER", False)
+FLEET_DECODE_WORKERS = getattr(config, "FLEET_DECODE_WORKERS", None) or os.cpu_count() or 1
+LOG_FORMAT = getattr(config, "LOG_FORMAT", "jsonl")
+BUILD_VIEWER_DB = getattr(config, "BUILD_VIEWER_DB", True)
+LEGACY_WHATSAPP_VERSION = getattr(config, "LEGACY_WHATSAPP_VERSION", "2.11.431")
+# Shared by every device and run, so it lives next to (not inside) the per-device data folders
+APK_STORE_DIR = os.path.normpath(getattr(config, "APK_STORE_DIR", None) or os.path.join(DATA_DIR, "apk-store"))
 
 # Ensure dirs exist
 os.makedirs(LOGS_DIR, exist_ok=True)
 os.makedirs(DATA_DIR, exist_ok=True)
 
 # Unique logfile for this run
-LOG_FILE = os.path.join(LOGS_DIR, f"run-{datetime.now().strftime('%Y-%m-%d-%H-%M-%S')}.log")
+RUN_ID = datetime.now().strftime('%Y-%m-%d-%H-%M-%S')
+LOG_EXT = "jsonl" if LOG_FORMAT == "jsonl" else "log"
+LOG_FILE = os.path.join(LOGS_DIR, f"run-{RUN_ID}.{LOG_EXT}")
 
 # Metadata for this run
 metadata = {}
 
+# Device this process talks to (None = the only one connected), the fleet-wide decode limiter
+# and the lock around the APK store lookups and additions of the fleet workers
+ADB_SERIAL = None
+DECODE_SLOTS = None
+APK_STORE_LOCK = None
+
+# Pipeline stage recorded with every log line
+CURRENT_STAGE = "setup"
+
+# Completed pipeline steps, persisted to DATA_DIR/checkpoint.json so a failed run can be resumed
+CHECKPOINT_NAME = "checkpoint.json"
+checkpoint = {"steps": {}}
+
+# SHA-256 of every artifact, written to DATA_DIR/manifest.json at the end of the run
+MANIFEST_NAME = "manifest.json"
+# Hashes computed while this run wrote the files: abspath -> (size, mtime_ns, sha256)
+digests = {}
+
+
+class RunLogger:
+    """Queues log records and writes them from a background thread to a single open, buffered handle."""
+
+    def __init__(self, path, fmt="jsonl"):
+        self.path = path
+        self.fmt = fmt
+        self.queue = queue.SimpleQueue()
+        self.thread = None
+        self.lock = threading.Lock()
+
+    def _format(self, record):
+        if self.fmt == "jsonl":
+            return json.dumps(record, ensure_ascii=False, default=str) + "\n"
+        lines = [record["msg"]]
+        for key in ("stdout", "stderr"):
+            if record.get(key):
+                lines.append(record[key])
+        if "metadata" in record:
+            lines.append(json.dumps(record["metadata"], indent=2))
+        if "traceback" in record:
+            lines.append(record["traceback"])
+        return "\n".join(lines) + "\n"
+
+    def _writer(self):
+        with open(self.path, "a", encoding="utf-8", buffering=1024 * 1024) as f:
+            while True:
+                record = self.queue.get()
+                if record is None:
+                    return
+                f.write(self._format(record))
+                # Only hit the disk once the burst of queued records is written
+                if self.queue.empty():
+                    f.flush()
+
+    def write(self, record):
+        if self.thread is None:
+            with self.lock:
+                if self.thread is None:
+                    self.thread = threading.Thread(target=self._writer, name="run-logger", daemon=True)
+                    self.thread.start()
+        self.queue.put(record)
+
+    def close(self):
+        with self.lock:
+            if self.thread is not None and self.thread.is_alive():
+                self.queue.put(None)
+                self.thread.join()
+            self.thread = None
+
+
+LOGGER = RunLogger(LOG_FILE, LOG_FORMAT)
+
+
+def close_log():
+    LOGGER.close()
+
+
+def log_crash(exc_type, exc, tb):
+    if not issubclass(exc_type, KeyboardInterrupt):
+        log_record(f"[✖] Crashed: {exc_type.__name__}: {exc}",
+                   traceback="".join(traceback.format_exception(exc_type, exc, tb)))
+    close_log()
+    sys.__excepthook__(exc_type, exc, tb)
+
+
+atexit.register(close_log)
+sys.excepthook = log_crash
+
+
+def set_stage(stage):
+    global CURRENT_STAGE
+    CURRENT_STAGE = stage
+
 
 def log_console(msg):
+    if ADB_SERIAL:
+        msg = "\n".join(f"[{ADB_SERIAL}] {line}" for line in str(msg).splitlines())
     print(msg)
 
 
+def log_record(msg, **fields):
+    record = {
+        "t": time.monotonic(),
+        "time": datetime.now().isoformat(timespec="milliseconds"),
+        "stage": CURRENT_STAGE,
+        "msg": msg,
+    }
+    if ADB_SERIAL:
+        record["serial"] = ADB_SERIAL
+    record.update(fields)
+    LOGGER.write(record)
+
+
 def log_file(msg):
-    with open(LOG_FILE, "a", encoding="utf-8") as f:
-        f.write(msg + "\n")
+    log_record(msg)
 
 
 def log_both(msg):
@@ -40,30 +192,205 @@ def log_both(msg):
     log_file(msg)
 
 
+def format_rate(num_bytes, seconds):
+    mb = num_bytes / (1024 * 1024)
+    return f"{mb:.1f} MB in {seconds:.1f}s ({mb / max(seconds, 1e-6):.1f} MB/s)"
+
+
+def adb(*args):
+    if ADB_SERIAL:
+        return [ADB_PATH, "-s", ADB_SERIAL, *args]
+    return [ADB_PATH, *args]
+
+
+def decode_slot():
+    return DECODE_SLOTS if DECODE_SLOTS is not None else contextlib.nullcontext()
+
+
+def apk_store_lock():
+    return APK_STORE_LOCK if APK_STORE_LOCK is not None else contextlib.nullcontext()
+
+
 def run(cmd, capture=False):
-    log_file(f"$ {' '.join(cmd)}")
+    start = time.monotonic()
     try:
-        if capture:
-            result = subprocess.run(cmd, check=True, capture_output=True, text=True)
-            if result.stdout.strip():
-                log_file(result.stdout.strip())
-            if result.stderr.strip():
-                log_file(result.stderr.strip())
-            return result.stdout.strip()
-        else:
-            result = subprocess.run(cmd, check=True, capture_output=True, text=True)
-            if result.stdout.strip():
-                log_file(result.stdout.strip())
-            if result.stderr.strip():
-                log_file(result.stderr.strip())
-            return None
+        result = subprocess.run(cmd, check=True, capture_output=True, text=True)
     except subprocess.CalledProcessError as e:
-        log_file(f"[✖] Failed: {' '.join(cmd)}")
-        log_file(f"STDOUT:\n{e.stdout}")
-        log_file(f"STDERR:\n{e.stderr}")
+        log_record(f"[✖] Failed: {' '.join(cmd)}", argv=cmd, returncode=e.returncode,
+                   stdout=e.stdout, stderr=e.stderr, seconds=round(time.monotonic() - start, 3))
         log_console(f"[✖] Failed: {' '.join(cmd)} (see log file)")
         sys.exit(1)
 
+    log_record(f"$ {' '.join(cmd)}", argv=cmd, returncode=result.returncode,
+               stdout=result.stdout.strip(), stderr=result.stderr.strip(), seconds=round(time.monotonic() - start, 3))
+    if capture:
+        return result.stdout.strip()
+    return None
+
+
+def native_adb_call(description, fn):
+    start = time.monotonic()
+    try:
+        result = fn(adb_client.AdbClient(ADB_SERIAL))
+    except (adb_client.AdbError, OSError) as e:
+        log_record(f"[✖] Failed: adb {description}: {e}", argv=["adb", *description.split(" ", 1)])
+        log_console(f"[✖] Failed: adb {description} (see log file)")
+        sys.exit(1)
+    log_record(f"$ [native] adb {description}", argv=["adb", *description.split(" ", 1)],
+               seconds=round(time.monotonic() - start, 3))
+    return result
+
+
+def adb_shell(*args, capture=False):
+    if ADB_CLIENT != "native":
+        return run(adb("shell", *args), capture=capture)
+
+    command = " ".join(args)
+    output = native_adb_call(f"shell {command}", lambda client: client.shell(command)).strip()
+    if output:
+        log_record(output)
+    return output if capture else None
+
+
+def adb_pull(remote_path, local_path):
+    if ADB_CLIENT != "native":
+        return run(adb("pull", remote_path, local_path))
+
+    start = time.monotonic()
+    digest = hashlib.sha256()
+    size = native_adb_call(f"pull {remote_path} {local_path}",
+                           lambda client: client.pull(remote_path, local_path, digest))
+    record_digest(local_path, size, digest.hexdigest())
+    log_file(f"[i] Pulled {format_rate(size, time.monotonic() - start)}")
+
+
+def adb_push(local_path, remote_path):
+    if ADB_CLIENT != "native":
+        return run(adb("push", local_path, remote_path))
+
+    start = time.monotonic()
+    size = native_adb_call(f"push {local_path} {remote_path}", lambda client: client.push(local_path, remote_path))
+    log_file(f"[i] Pushed {format_rate(size, time.monotonic() - start)}")
+
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(android_backup.CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def record_digest(path, size, sha256):
+    digests[os.path.abspath(path)] = (size, os.stat(path).st_mtime_ns, sha256)
+
+
+def file_digest(path):
+    # Files written by adb or java were not seen by this process, those are hashed here (once)
+    st = os.stat(path)
+    cached = digests.get(os.path.abspath(path))
+    if cached and cached[:2] == (st.st_size, st.st_mtime_ns):
+        return cached[0], cached[2]
+    sha256 = file_sha256(path)
+    digests[os.path.abspath(path)] = (st.st_size, st.st_mtime_ns, sha256)
+    return st.st_size, sha256
+
+
+def write_json(path, data):
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(data, f, indent=2)
+    # Atomic, so an interrupted run never leaves a half-written file behind
+    os.replace(tmp, path)
+
+
+def checkpoint_path():
+    return os.path.join(DATA_DIR, CHECKPOINT_NAME)
+
+
+def save_checkpoint():
+    write_json(checkpoint_path(), {"run_id": RUN_ID, "updated": datetime.now().isoformat(timespec="seconds"),
+                                   "metadata": metadata, "steps": checkpoint["steps"]})
+
+
+def load_checkpoint():
+    try:
+        with open(checkpoint_path(), encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def complete_step(name, paths):
+    # Artifact paths are stored relative to DATA_DIR so the folder can be moved between runs
+    artifacts = []
+    for path in paths:
+        size, sha256 = file_digest(path)
+        artifacts.append({"path": os.path.relpath(path, DATA_DIR), "size": size, "sha256": sha256})
+    checkpoint["steps"][name] = {"completed": datetime.now().isoformat(timespec="seconds"), "artifacts": artifacts}
+    save_checkpoint()
+    log_record(f"[i] Checkpoint: step '{name}' completed", step=name, artifacts=checkpoint["steps"][name]["artifacts"])
+
+
+def write_manifest():
+    files = {}
+    for name, _ in PIPELINE:
+        for artifact in checkpoint["steps"].get(name, {}).get("artifacts", []):
+            files[artifact["path"]] = artifact
+    manifest = {"run_id": RUN_ID, "created": datetime.now().isoformat(timespec="seconds"), "algorithm": "sha256",
+                "serial": metadata.get("serial"), "files": list(files.values())}
+    write_json(os.path.join(DATA_DIR, MANIFEST_NAME), manifest)
+    log_both(f"[✔] Manifest with {len(files)} files saved -> {os.path.join(DATA_DIR, MANIFEST_NAME)}")
+
+
+def check_artifact(data_dir, artifact):
+    path = os.path.join(data_dir, artifact["path"])
+    if not os.path.isfile(path):
+        return "missing"
+    if os.path.getsize(path) != artifact["size"]:
+        return f"size {os.path.getsize(path)} != {artifact['size']}"
+    if file_sha256(path) != artifact["sha256"]:
+        return "sha256 mismatch"
+    return None
+
+
+def verify_manifest(data_dir, workers=None):
+    manifest_file = os.path.join(data_dir, MANIFEST_NAME)
+    try:
+        with open(manifest_file, encoding="utf-8") as f:
+            files = json.load(f)["files"]
+    except (OSError, ValueError, KeyError) as e:
+        sys.exit(f"[✖] Could not read {manifest_file}: {e}")
+
+    log_both(f"[*] Verifying {len(files)} files in {data_dir} against {MANIFEST_NAME}...")
+    start = time.monotonic()
+    # hashlib releases the GIL while hashing, so threads verify large files in parallel
+    with concurrent.futures.ThreadPoolExecutor(max_workers=workers or os.cpu_count()) as pool:
+        results = list(pool.map(lambda artifact: check_artifact(data_dir, artifact), files))
+    elapsed = time.monotonic() - start
+
+    failed = 0
+    for artifact, problem in zip(files, results):
+        if problem:
+            failed += 1
+            log_both(f"[✖] {artifact['path']}: {problem}")
+    log_both(f"[i] Verified {format_rate(sum(a['size'] for a in files), elapsed)}")
+    if failed:
+        sys.exit(f"[✖] {failed} of {len(files)} files failed verification")
+    log_both(f"[✔] All {len(files)} files match the manifest")
+
+
+def step_is_valid(name):
+    step = checkpoint["steps"].get(name)
+    if not step:
+        return False
+    for artifact in step["artifacts"]:
+        path = os.path.join(DATA_DIR, artifact["path"])
+        if not os.path.isfile(path) or os.path.getsize(path) != artifact["size"] or file_sha256(path) != artifact["sha256"]:
+            log_both(f"[!] Artifact of step '{name}' missing or changed: {path}")
+            return False
+    return True
+
 
 def ensure_setup():
     if not shutil.which(ADB_PATH):
@@ -72,11 +399,14 @@ def ensure_setup():
     if not os.path.exists(LEGACY_WHATSAPP_APK):
         sys.exit(f"[!] Legacy WhatsApp APK missing at {LEGACY_WHATSAPP_APK}")
 
-    if not os.path.exists(ABE_JAR_PATH):
-        sys.exit(f"[!] ABE.jar missing at {ABE_JAR_PATH}")
+    if ADB_CLIENT not in ("binary", "native"):
+        sys.exit(f"[!] Unknown ADB_CLIENT {ADB_CLIENT!r}, expected 'binary' or 'native'")
 
-    if not os.path.exists(TAR_PATH):
-        sys.exit(f"[!] tar not found at {TAR_PATH}")
+    if AB_BACKEND not in ("native", "abe"):
+        sys.exit(f"[!] Unknown AB_BACKEND {AB_BACKEND!r}, expected 'native' or 'abe'")
+
+    if AB_BACKEND == "abe" and not os.path.exists(ABE_JAR_PATH):
+        sys.exit(f"[!] ABE.jar missing at {ABE_JAR_PATH}")
 
 
 def adb_stop():
@@ -88,143 +418,295 @@ def adb_stop():
         log_both(f"[✖] Failed to stop ADB server: {result.stderr.strip()}")
 
 
+def list_devices():
+    output = run([ADB_PATH, "devices"], capture=True)
+    devices = []
+    for line in output.splitlines()[1:]:
+        parts = line.split()
+        if len(parts) >= 2 and parts[1] == "device":
+            devices.append(parts[0])
+    return devices
+
+
 def adb_init():
     log_both("[*] Initializing ADB...")
-    subprocess.run([ADB_PATH, "kill-server"])
-    subprocess.run([ADB_PATH, "start-server"])
-    subprocess.run([ADB_PATH, "wait-for-device"])
-    devices = run([ADB_PATH, "devices"], capture=True).splitlines()[1:]
-    if not any("device" in d for d in devices):
+    # Any adb command starts the server if needed, so a running one is reused unless a reset is asked for
+    if ADB_RESET_SERVER:
+        subprocess.run([ADB_PATH, "kill-server"])
+    subprocess.run(adb("wait-for-device"))
+    devices = list_devices()
+    if not devices or (ADB_SERIAL and ADB_SERIAL not in devices):
         sys.exit("[!] No devices connected")
+    if not ADB_SERIAL and len(devices) > 1:
+        sys.exit(f"[!] {len(devices)} devices connected, pass --serial or use --fleet")
     log_both("[✔] Device connected")
 
 
+def parse_version_name(output):
+    return next((l.split("=")[1].strip() for l in output.splitlines() if "versionName=" in l), "unknown")
+
+
 def get_metadata():
-    sdk = run([ADB_PATH, "shell", "getprop", "ro.build.version.sdk"], capture=True)
-    apk_path = run([ADB_PATH, "shell", "pm", "path", "com.whatsapp"], capture=True).replace("package:", "")
-    version_info = run([ADB_PATH, "shell", "dumpsys", "package", "com.whatsapp"], capture=True)
-    version = next((l.split("=")[1] for l in version_info.splitlines() if "versionName=" in l), "unknown")
-    sd_path = run([ADB_PATH, "shell", "echo", "$EXTERNAL_STORAGE"], capture=True)
+    # One shell round trip for everything
+    output = adb_shell(device_commands.METADATA_SCRIPT, capture=True)
+    sections = [part.strip() for part in output.replace("\r", "").split(device_commands.METADATA_MARKER)]
+    if len(sections) != 4:
+        sys.exit("[✖] Could not parse device metadata (see log file)")
+
+    sdk, apk_path, version_info, sd_path = sections
+    apk_path = apk_path.replace("package:", "")
+    version = parse_version_name(version_info)
 
     metadata.update({"sdk": sdk, "apk_path": apk_path, "version": version, "sd_path": sd_path})
     log_both(f"[✔] Metadata collected: SDK={sdk}, Version={version}")
     return metadata
 
 
+def installed_version():
+    return parse_version_name(adb_shell(device_commands.VERSION_QUERY, capture=True))
+
+
+def device_file_info(remote_path):
+    fields = adb_shell(device_commands.file_info_query(remote_path), capture=True).split()
+    if fields and re.fullmatch(r"[0-9a-f]{64}", fields[0]):
+        return fields[0], None
+    for i, field in enumerate(fields[1:], 1):
+        if re.fullmatch(r"\d{4}-\d\d-\d\d", field) and fields[i - 1].isdigit():
+            return None, int(fields[i - 1])
+    return None, None
+
+
+def link_or_copy(src, dst):
+    # Hard links keep one copy of each APK on disk; the rename makes concurrent fleet workers safe
+    if os.path.exists(dst) and os.path.samefile(src, dst):
+        return
+    tmp = f"{dst}.{os.getpid()}.tmp"
+    try:
+        os.link(src, tmp)
+    except OSError:
+        shutil.copyfile(src, tmp)
+    os.replace(tmp, dst)
+
+
+def apk_store_lookup(version, sha256=None, size=None):
+    if version == "unknown":
+        return None
+    if sha256:
+        path = os.path.join(APK_STORE_DIR, version, f"{sha256}.apk")
+        return path if os.path.isfile(path) else None
+    candidates = [path for path in glob.glob(os.path.join(APK_STORE_DIR, version, "*.apk"))
+                  if os.path.getsize(path) == size]
+    # A size alone only identifies the APK if no other stored build of this version has the same one
+    return candidates[0] if size is not None and len(candidates) == 1 else None
+
+
+def apk_store_add(path, version):
+    _, sha256 = file_digest(path)
+    if version != "unknown":
+        stored = os.path.join(APK_STORE_DIR, version, f"{sha256}.apk")
+        if not os.path.exists(stored):
+            os.makedirs(os.path.dirname(stored), exist_ok=True)
+            link_or_copy(path, stored)
+            log_file(f"[i] APK {version} added to store -> {stored}")
+    return sha256
+
+
 def backup_apk(apk_path, version):
+    sha256, size = device_file_info(apk_path)
     out = os.path.join(DATA_DIR, f"WhatsApp-backup-{version}.apk")
+    with apk_store_lock():
+        if use_stored_apk(out, version, sha256, size):
+            return out
+
     log_both("[*] Backing up WhatsApp APK...")
-    run([ADB_PATH, "pull", apk_path, out])
+    # Pulled outside the store lock, so fleet workers pulling different APKs do not wait for each other
+    tmp = f"{out}.{os.getpid()}.tmp"
+    adb_pull(apk_path, tmp)
+    size, pulled = file_digest(tmp)
+    if sha256 and pulled != sha256:
+        os.remove(tmp)
+        sys.exit(f"[✖] Pulled APK does not match the device (sha256 {pulled} != {sha256})")
+    with apk_store_lock():
+        metadata["apk_sha256"] = apk_store_add(tmp, version)
+        os.replace(tmp, out)
+    record_digest(out, size, pulled)
     log_both(f"[✔] APK saved -> {out}")
+    return out
+
+
+def use_stored_apk(out, version, sha256, size):
+    cached = apk_store_lookup(version, sha256, size)
+    if not cached and os.path.isfile(out) and version != "unknown":
+        # Backup from a run before the store existed
+        apk_store_add(out, version)
+        cached = apk_store_lookup(version, sha256, size)
+    if not cached:
+        return False
+    link_or_copy(cached, out)
+    metadata["apk_sha256"] = os.path.splitext(os.path.basename(cached))[0]
+    record_digest(out, os.path.getsize(out), metadata["apk_sha256"])
+    log_both(f"[✔] APK {version} already in store, pull skipped -> {out}")
+    return True
 
 
 def install_legacy():
+    current = installed_version()
+    if current == LEGACY_WHATSAPP_VERSION:
+        log_both(f"[✔] Legacy WhatsApp {current} already installed, skipping install")
+        return
     log_both("[*] Installing legacy WhatsApp...")
-    run([ADB_PATH, "install", "-r", "-d", LEGACY_WHATSAPP_APK])
+    run(adb("install", "-r", "-d", LEGACY_WHATSAPP_APK))
     log_both("[✔] Legacy WhatsApp installed")
 
 
-def backup_data():
+def ask_backup_password(before_backup=False):
+    if BACKUP_PASSWORD is not None:
+        return BACKUP_PASSWORD or None
+    if before_backup:
+        prompt = "Enter the backup password you will set on the device (leave empty if none): "
+    else:
+        prompt = "Enter backup password (leave empty if none): "
+    password = input(prompt).strip()
+    return password or None
+
+
+def start_backup():
     backup_file = os.path.join(DATA_DIR, "whatsapp.ab")
+    if os.path.exists(backup_file):
+        os.remove(backup_file)
     log_both("[*] Creating WhatsApp backup (confirm on device)... This may take a few minutes.")
+    process = subprocess.Popen(adb("backup", "-f", backup_file, "com.whatsapp"))
+    return backup_file, process
 
-    result = subprocess.call([ADB_PATH, "backup", "-f", backup_file, "com.whatsapp"])
 
+def check_backup(backup_file):
     if os.path.exists(backup_file) and os.path.getsize(backup_file) > 2048:
         log_both(f"[✔] Data backup saved -> {backup_file}")
     else:
         sys.exit("[✖] Backup file too small, likely failed")
 
+
+def backup_data():
+    backup_file, process = start_backup()
+    process.wait()
+    check_backup(backup_file)
     return backup_file
 
 
-def unpack_ab_to_tar(ab_file):
+def unpack_ab_to_tar(ab_file, password):
     log_both("[*] Unpacking .ab to .tar using ABE...")
     tar_file = ab_file.replace(".ab", ".tar")
 
-    password = input("Enter backup password (leave empty if none): ").strip()
-    if not password:
-        password = None
-
     cmd = ["java", "-jar", ABE_JAR_PATH, "unpack", ab_file, tar_file]
     if password:
         cmd.append(password)
 
+    start = time.monotonic()
     try:
-        subprocess.run(cmd, check=True)
+        with decode_slot():
+            subprocess.run(cmd, check=True)
     except subprocess.CalledProcessError:
         sys.exit("[✖] Failed to unpack .ab to .tar. Check ABE and Java installation.")
+    elapsed = time.monotonic() - start
 
     if not os.path.exists(tar_file) or os.path.getsize(tar_file) == 0:
         sys.exit(f"[✖] TAR file not created or empty: {tar_file}")
 
     log_both(f"[✔] Unpacked .tar saved -> {tar_file}")
+    log_both(f"[i] Decode: read {format_rate(os.path.getsize(ab_file), elapsed)}, "
+             f"wrote {format_rate(os.path.getsize(tar_file), elapsed)}")
 
     return tar_file
 
 
-def extract_whatsapp_files(tar_file):
-    files_to_extract = [
-        "apps/com.whatsapp/f/key",
-        "apps/com.whatsapp/db/msgstore.db",
-        "apps/com.whatsapp/db/msgstore.db-shm",
-        "apps/com.whatsapp/db/msgstore.db-wal",
-        "apps/com.whatsapp/db/wa.db",
-        "apps/com.whatsapp/db/wa.db-shm",
-        "apps/com.whatsapp/db/wa.db-wal",
-        "apps/com.whatsapp/db/axolotl.db",
-        "apps/com.whatsapp/db/axolotl.db-shm",
-        "apps/com.whatsapp/db/axolotl.db-wal",
-        "apps/com.whatsapp/db/chatsettings.db",
-        "apps/com.whatsapp/db/chatsettings.db-shm",
-        "apps/com.whatsapp/db/chatsettings.db-wal"
-    ]
-
-    log_both(f"[*] Extracting {len(files_to_extract)} files from {tar_file} to {DATA_DIR}...")
-
-    safe_data_dir = os.path.relpath(DATA_DIR)
-    safe_tar_file = os.path.abspath(tar_file).replace("\\", "/")
-
-    cmd = [TAR_PATH, "xvf", safe_tar_file, "-C", safe_data_dir] + files_to_extract
-    result = subprocess.run(cmd, capture_output=True, text=True)
-    if result.returncode != 0:
-        log_both(f"[✖] Extraction failed: {result.stderr.strip()}")
-        return
-    else:
-        log_both(f"[✔] Extraction completed.")
-
-    for path in files_to_extract:
-        src = os.path.join(DATA_DIR, path)
-        if src.startswith(os.path.join(DATA_DIR, "apps")):
-            dst = os.path.join(DATA_DIR, path[len("apps/"):])
-        else:
-            dst = src
-        if os.path.exists(src):
-            os.makedirs(os.path.dirname(dst), exist_ok=True)
-            shutil.move(src, dst)
-            log_file(f"[→] Moved {src} → {dst}")
-
-    key_path = os.path.join(DATA_DIR, "com.whatsapp/f/key")
+def extract_whatsapp_files(stream, source):
+    dest_dir = os.path.join(DATA_DIR, "com.whatsapp")
+    log_both(f"[*] Extracting {', '.join(EXTRACT_PATTERNS)} from {source} to {dest_dir}...")
+
+    try:
+        extracted = android_backup.extract_members(stream, dest_dir, EXTRACT_PATTERNS, prefix="apps/com.whatsapp/")
+    except tarfile.TarError as e:
+        log_both(f"[✖] Extraction failed: {e}")
+        return None
+    log_both(f"[✔] Extraction completed.")
+
+    for rel, dst, size, sha256 in extracted:
+        record_digest(dst, size, sha256)
+        log_file(f"[→] Extracted {rel} → {dst} ({size} bytes, sha256 {sha256})")
+
+    key_path = os.path.join(dest_dir, "f", "key")
     if os.path.exists(key_path):
         key_size = os.path.getsize(key_path)
         log_both(f"[i] Key file found: {key_path} (~{key_size} bytes)")
     else:
         log_both(f"[!] Key file not found: {key_path}")
 
-    db_dir = os.path.join(DATA_DIR, "com.whatsapp/db")
-    if os.path.exists(db_dir):
-        db_files = os.listdir(db_dir)
+    db_files = [os.path.basename(dst) for rel, dst, _, _ in extracted if rel.startswith("db/")]
+    if db_files:
         log_both(f"[i] Extracted DB files: {', '.join(db_files)}")
     else:
         log_both("[!] No database files extracted.")
 
-    apps_dir = os.path.join(DATA_DIR, "apps")
-    if os.path.exists(apps_dir):
-        try:
-            shutil.rmtree(apps_dir)
-            log_both(f"[i] Removed empty 'apps/' folder: {apps_dir}")
-        except Exception as e:
-            log_both(f"[!] Could not remove 'apps/' folder: {e}")
+    return extracted
+
+
+def extract_from_backup(ab_file, password, process=None, backup_step=False):
+    # backup_step: called by step_backup, which checkpoints the .ab with the SHA-256 taken here
+    if process:
+        log_both("[*] Decoding .ab using native reader while the backup is running...")
+    else:
+        log_both("[*] Decoding .ab using native reader...")
+
+    # The raw .ab is hashed as it is decoded, and its tail (after the last wanted member) once decoding is done
+    raw = android_backup.HashingReader(android_backup.FollowFile(ab_file, process) if process else open(ab_file, "rb"))
+    try:
+        # In follow mode adb keeps writing to disk while we wait for a slot, decoding then catches up
+        with decode_slot():
+            start = time.monotonic()
+            reader = android_backup.AndroidBackupReader(raw, password)
+            header = reader.header
+            log_file(f"[i] .ab header: version={header['version']}, compressed={header['compressed']}, "
+                     f"encryption={header['encryption']}")
+            extracted = extract_whatsapp_files(reader, ab_file)
+            elapsed = time.monotonic() - start
+        if process and process.poll() is None:
+            log_both("[*] All wanted files extracted, waiting for adb backup to finish...")
+        ab_size, ab_sha256 = raw.drain()
+    except android_backup.BackupFormatError as e:
+        raw.close()
+        if backup_step:
+            # Keep the backup itself, so --resume only has to redo the decode
+            if process:
+                log_both("[!] Decode failed, waiting for adb backup to finish so the run can be resumed with --resume...")
+            if not process or (process.wait() == 0 and os.path.exists(ab_file) and os.path.getsize(ab_file) > 2048):
+                complete_step("backup", [ab_file])
+        sys.exit(f"[✖] Failed to decode {ab_file}: {e}")
+
+    raw.close()
+    log_both(f"[i] Decode: read {format_rate(reader.bytes_in, elapsed)}, "
+             f"inflated {format_rate(reader.bytes_out, elapsed)}")
+
+    if process and process.wait() != 0:
+        sys.exit(f"[✖] adb backup exited with code {process.returncode}, backup stream may be truncated")
+    record_digest(ab_file, ab_size, ab_sha256)
+
+    return extracted
+
+
+def build_viewer_copy(msgstore):
+    log_both("[*] Building viewer database (WAL checkpoint, indexes, ANALYZE, VACUUM)...")
+    try:
+        out, stats = viewer_db.build_viewer_db(msgstore)
+    except sqlite3.Error as e:
+        log_both(f"[✖] Could not build viewer database: {e}")
+        return None
+    if stats.get("cached"):
+        log_both(f"[✔] Viewer database already built from this msgstore.db -> {out}")
+        return out
+    if stats["legacy_messages"] is not None:
+        log_both(f"[i] Converted {stats['legacy_messages']} messages from the legacy (2.11) layout")
+    log_both(f"[✔] Viewer database saved -> {out} ({stats['size'] / 1048576:.1f} MB in {stats['seconds']:.1f}s)")
+    return out
 
 
 def push_key_to_device_again():
@@ -232,72 +714,425 @@ def push_key_to_device_again():
 
     if not os.path.exists(local_key_path):
         log_both(f"[!] Key file not found locally: {local_key_path}")
-        return
+        return False
 
     sd_path = metadata.get("sd_path")
     if not sd_path:
         log_both("[!] Could not detect device storage path")
-        return
+        return False
 
     log_both(f"[*] Device storage path detected: {sd_path}")
 
-    run([ADB_PATH, "shell", "mkdir", "-p", f"{sd_path}/WhatsApp/Databases"])
+    adb_shell("mkdir", "-p", f"{sd_path}/WhatsApp/Databases")
 
     device_target = f"{sd_path}/WhatsApp/Databases/.nomedia"
 
-    run([ADB_PATH, "push", local_key_path, device_target])
+    adb_push(local_key_path, device_target)
 
     log_both(f"[✔] Key pushed successfully to {device_target}")
 
-    check = run([ADB_PATH, "shell", "ls", "-l", device_target], capture=True)
+    check = adb_shell("ls", "-l", device_target, capture=True)
     log_both(f"[*] Device check:\n{check}")
 
     if ".nomedia" in check or "key" in check:
         log_both("[✔] Key presence verified on device")
-    else:
-        log_both("[✖] Key not found on device after push")
+        return True
+    log_both("[✖] Key not found on device after push")
+    return False
 
 
 def restore_original_apk():
-    whatsapp_backup_apk = os.path.join(DATA_DIR, f"WhatsApp-backup-{metadata['version']}.apk")
+    version = metadata["version"]
+    if version != "unknown" and installed_version() == version:
+        log_both(f"[✔] WhatsApp {version} is still installed, nothing to restore")
+        return True
 
+    whatsapp_backup_apk = os.path.join(DATA_DIR, f"WhatsApp-backup-{version}.apk")
     if not os.path.exists(whatsapp_backup_apk):
+        whatsapp_backup_apk = apk_store_lookup(version, metadata.get("apk_sha256"))
+
+    if not whatsapp_backup_apk:
         log_both("[!] No backup APK found. You can reinstall WhatsApp from Play Store manually.")
-        return
+        return False
 
     log_both(f"[*] Restoring original WhatsApp APK: {whatsapp_backup_apk}")
 
-    output = run([ADB_PATH, "install", "-r", whatsapp_backup_apk], capture=True)
+    output = run(adb("install", "-r", whatsapp_backup_apk), capture=True)
     log_both(f"[✔] Original APK restored successfully")
     if output:
         log_both(output)
+    return True
+
+
+def step_metadata():
+    get_metadata()
+    return []
+
 
+def step_backup_apk():
+    return [backup_apk(metadata["apk_path"], metadata["version"])]
+
+
+def step_install_legacy():
+    install_legacy()
+    return []
+
+
+def step_backup():
+    if AB_BACKEND != "native":
+        return [backup_data()]
+    # This step also does the extraction: the decode hashes the .ab for the checkpoint, so it is read only once
+    if AB_FOLLOW:
+        # Decoding follows the backup as adb writes it
+        password = ask_backup_password(before_backup=True)
+        ab_file, process = start_backup()
+        extracted = extract_from_backup(ab_file, password, process, backup_step=True)
+        check_backup(ab_file)
+    else:
+        ab_file = backup_data()
+        extracted = extract_from_backup(ab_file, ask_backup_password(), backup_step=True)
+    if extracted is not None:
+        complete_step("extract", [dst for _, dst, _, _ in extracted])
+    return [ab_file]
+
+
+def step_extract():
+    ab_file = os.path.join(DATA_DIR, "whatsapp.ab")
+    if AB_BACKEND == "abe":
+        tar_file = unpack_ab_to_tar(ab_file, ask_backup_password())
+        with open(tar_file, "rb") as f:
+            extracted = extract_whatsapp_files(f, tar_file)
+    else:
+        extracted = extract_from_backup(ab_file, ask_backup_password())
+    if extracted is None:
+        return None
+    return [dst for _, dst, _, _ in extracted]
+
+
+def step_viewer_db():
+    msgstore = os.path.join(DATA_DIR, "com.whatsapp", "db", "msgstore.db")
+    if not BUILD_VIEWER_DB:
+        return []
+    if not os.path.isfile(msgstore):
+        log_both("[!] No msgstore.db extracted, skipping viewer database")
+        return []
+    out = build_viewer_copy(msgstore)
+    return [out] if out else None
+
+
+def step_push_key():
+    return [] if push_key_to_device_again() else None
+
+
+def step_restore_apk():
+    return [] if restore_original_apk() else None
+
+
+# Each step returns the files it produced, or None when it did not complete (the run goes on,
+# but --resume will retry it)
+PIPELINE = [
+    ("metadata", step_metadata),
+    ("backup_apk", step_backup_apk),
+    ("install_legacy", step_install_legacy),
+    ("backup", step_backup),
+    ("extract", step_extract),
+    ("viewer_db", step_viewer_db),
+    ("push_key", step_push_key),
+    ("restore_apk", step_restore_apk),
+]
+
+
+def resume_index():
+    saved = load_checkpoint()
+    if not saved:
+        log_both("[!] No checkpoint found, starting from the beginning")
+        return 0
+    metadata.update(saved.get("metadata", {}))
+    checkpoint["steps"] = saved.get("steps", {})
+    for index, (name, _) in enumerate(PIPELINE):
+        if not step_is_valid(name):
+            return index
+    return len(PIPELINE)
+
+
+def run_pipeline(resume=False):
+    start = resume_index() if resume else 0
+    # Anything from the restart point on is redone, so its old records are dropped
+    checkpoint["steps"] = {name: checkpoint["steps"][name] for name, _ in PIPELINE[:start]}
+    save_checkpoint()
+    if start:
+        skipped = ", ".join(name for name, _ in PIPELINE[:start])
+        log_both(f"[*] Resuming from checkpoint, skipping completed steps: {skipped}")
+
+    for name, fn in PIPELINE[start:]:
+        if name in checkpoint["steps"]:
+            continue
+        set_stage(name)
+        artifacts = fn()
+        if artifacts is not None:
+            complete_step(name, artifacts)
+
+
+def finish_run():
+    set_stage("finish")
+    log_record("=== Metadata ===", metadata=metadata)
+
+    with open(os.path.join(DATA_DIR, "metadata.json"), "w", encoding="utf-8") as f:
+        json.dump(metadata, f, indent=2)
+    write_manifest()
 
-def main():
+    log_both("=" * 50)
+    log_both("========== Run Completed Successfully! ==========")
+    log_both("=" * 50)
+    log_console(f"[i] Full log saved at: {LOG_FILE}")
+
+
+def main(resume=False):
     log_both("=" * 50)
     log_both("=== WhatsApp Key & Database Extractor Started ===")
     log_both("=" * 50)
     ensure_setup()
+    set_stage("adb_init")
     adb_init()
-    meta = get_metadata()
-    backup_apk(meta["apk_path"], meta["version"])
-    install_legacy()
-    ab_file = backup_data()
-    tar_file = unpack_ab_to_tar(ab_file)
-    extract_whatsapp_files(tar_file)
-    push_key_to_device_again()
-    restore_original_apk()
-    adb_stop()
+    if ADB_SERIAL:
+        metadata["serial"] = ADB_SERIAL
+    run_pipeline(resume)
+    if ADB_RESET_SERVER:
+        adb_stop()
+    finish_run()
+
+
+def fleet_worker(serial, password, decode_slots, store_lock, resume=False):
+    global ADB_SERIAL, DATA_DIR, LOG_FILE, LOGGER, BACKUP_PASSWORD, DECODE_SLOTS, APK_STORE_LOCK
+    safe_serial = re.sub(r"[^\w.-]", "_", serial)
+    ADB_SERIAL = serial
+    DATA_DIR = os.path.join(DATA_DIR, safe_serial)
+    LOG_FILE = os.path.join(LOGS_DIR, f"run-{RUN_ID}-{safe_serial}.{LOG_EXT}")
+    # Fresh logger: a forked copy of the parent's one has no writer thread
+    LOGGER = RunLogger(LOG_FILE, LOG_FORMAT)
+    BACKUP_PASSWORD = password
+    DECODE_SLOTS = decode_slots
+    APK_STORE_LOCK = store_lock
+    os.makedirs(DATA_DIR, exist_ok=True)
 
-    with open(LOG_FILE, "a", encoding="utf-8") as f:
-        f.write("\n=== Metadata ===\n")
-        f.write(json.dumps(metadata, indent=2))
+    try:
+        log_both(f"=== Worker started for device {serial} ===")
+        metadata["serial"] = serial
+        set_stage("adb_init")
+        run(adb("wait-for-device"))
+        run_pipeline(resume)
+        finish_run()
+    except Exception as e:
+        log_record(f"[✖] Crashed: {type(e).__name__}: {e}", traceback=traceback.format_exc())
+        raise
+    finally:
+        # multiprocessing skips atexit handlers in workers
+        close_log()
+
+
+def fleet_main(resume=False):
+    log_both("=" * 50)
+    log_both("=== WhatsApp Key & Database Extractor Started (fleet) ===")
+    log_both("=" * 50)
+    ensure_setup()
+
+    log_both("[*] Initializing ADB...")
+    if ADB_RESET_SERVER:
+        subprocess.run([ADB_PATH, "kill-server"])
+    serials = list_devices()
+    if not serials:
+        sys.exit("[!] No devices connected")
+    log_both(f"[✔] {len(serials)} devices connected: {', '.join(serials)}")
+
+    # Workers can't prompt, so the password is asked once for the whole fleet ("" = no password)
+    password = ask_backup_password(before_backup=True) or ""
+    decode_slots = multiprocessing.BoundedSemaphore(FLEET_DECODE_WORKERS)
+    store_lock = multiprocessing.Lock()
+    log_both(f"[*] Starting {len(serials)} workers, at most {FLEET_DECODE_WORKERS} decoding at once...")
+
+    workers = []
+    for serial in serials:
+        worker = multiprocessing.Process(target=fleet_worker, args=(serial, password, decode_slots, store_lock, resume),
+                                         name=serial)
+        worker.start()
+        workers.append(worker)
+
+    failed = []
+    for worker in workers:
+        worker.join()
+        if worker.exitcode != 0:
+            failed.append(worker.name)
+
+    if ADB_RESET_SERVER:
+        adb_stop()
 
     log_both("=" * 50)
-    log_both("========== Run Completed Successfully! ==========")
+    log_both(f"[i] Fleet finished: {len(serials) - len(failed)}/{len(serials)} devices succeeded")
+    if failed:
+        log_both(f"[✖] Failed devices: {', '.join(failed)} (see their log files in {LOGS_DIR})")
+    log_both("=" * 50)
+    if failed:
+        sys.exit(1)
+
+
+def load_passwords(passwords_file):
+    if not passwords_file:
+        return {}
+    try:
+        with open(passwords_file, encoding="utf-8") as f:
+            passwords = json.load(f)
+    except (OSError, ValueError) as e:
+        sys.exit(f"[✖] Could not read password map {passwords_file}: {e}")
+    if not isinstance(passwords, dict):
+        sys.exit(f"[✖] {passwords_file} must map .ab file names to passwords")
+    return passwords
+
+
+def batch_inputs(source):
+    pattern = os.path.join(source, "*.ab") if os.path.isdir(source) else source
+    files = [path for path in glob.glob(pattern) if os.path.isfile(path)]
+    # Largest first, so a big archive does not start last and leave the other workers idle at the end
+    return sorted(files, key=os.path.getsize, reverse=True)
+
+
+def batch_job(ab_file, dest_dir, password, patterns, build_viewer=False):
+    # Runs in a pool process: no globals, prompts or logging, everything is returned to the parent
+    result = {"ab_file": ab_file, "dest_dir": dest_dir}
+    start = time.monotonic()
+    try:
+        raw = android_backup.HashingReader(open(ab_file, "rb"))
+    except OSError as e:
+        result["error"] = str(e)
+        return result
+    try:
+        reader = android_backup.AndroidBackupReader(raw, password)
+        extracted = android_backup.extract_members(reader, os.path.join(dest_dir, "com.whatsapp"), patterns,
+                                                   prefix="apps/com.whatsapp/")
+        bytes_in, sha256 = raw.drain()
+    except Exception as e:
+        # A damaged archive can fail anywhere in zlib or tarfile: only this file is lost, not the batch
+        result["error"] = f"{type(e).__name__}: {e}"
+        return result
+    finally:
+        raw.close()
+    msgstore = os.path.join(dest_dir, "com.whatsapp", "db", "msgstore.db")
+    if build_viewer and os.path.isfile(msgstore):
+        try:
+            out, _ = viewer_db.build_viewer_db(msgstore)
+            extracted.append(("db/" + os.path.basename(out), out, os.path.getsize(out), file_sha256(out)))
+        except sqlite3.Error as e:
+            # As in build_viewer_copy: the extraction stands without the viewer copy
+            result["warning"] = f"Could not build viewer database: {e}"
+    result.update(seconds=time.monotonic() - start, bytes_in=bytes_in, bytes_out=reader.bytes_out, sha256=sha256,
+                  extracted=extracted)
+    return result
+
+
+def write_batch_manifest(result):
+    dest_dir = result["dest_dir"]
+    files = [{"path": os.path.relpath(dst, dest_dir), "size": size, "sha256": sha256}
+             for _, dst, size, sha256 in result["extracted"]]
+    manifest = {"run_id": RUN_ID, "created": datetime.now().isoformat(timespec="seconds"), "algorithm": "sha256",
+                "source": {"path": os.path.abspath(result["ab_file"]), "size": result["bytes_in"],
+                           "sha256": result["sha256"]},
+                "files": files}
+    write_json(os.path.join(dest_dir, MANIFEST_NAME), manifest)
+
+
+def batch_main(source, out_dir, passwords_file=None, jobs=None):
+    log_both("=" * 50)
+    log_both("=== WhatsApp Key & Database Extractor Started (offline batch) ===")
     log_both("=" * 50)
-    log_console(f"[i] Full log saved at: {LOG_FILE}")
+
+    files = batch_inputs(source)
+    if not files:
+        sys.exit(f"[!] No .ab files found in {source}")
+    passwords = load_passwords(passwords_file)
+    # Map keys are file names; "*" is the fallback, then BACKUP_PASSWORD
+    default_password = passwords.get("*", BACKUP_PASSWORD or None)
+
+    jobs = jobs or os.cpu_count() or 1
+    total_mb = sum(os.path.getsize(path) for path in files) / 1048576
+    log_both(f"[*] Decoding {len(files)} backups ({total_mb:.1f} MB) into {out_dir} with {jobs} processes...")
+
+    used_names = set()
+    start = time.monotonic()
+    results = []
+    with concurrent.futures.ProcessPoolExecutor(max_workers=jobs) as pool:
+        futures = {}
+        for ab_file in files:
+            name = os.path.splitext(os.path.basename(ab_file))[0]
+            # Same file name in different source directories
+            unique, n = name, 1
+            while unique in used_names:
+                n += 1
+                unique = f"{name}-{n}"
+            used_names.add(unique)
+            password = passwords.get(os.path.basename(ab_file), default_password) or None
+            dest_dir = os.path.join(out_dir, unique)
+            future = pool.submit(batch_job, ab_file, dest_dir, password, EXTRACT_PATTERNS, BUILD_VIEWER_DB)
+            futures[future] = (ab_file, dest_dir)
+
+        for done, future in enumerate(concurrent.futures.as_completed(futures), 1):
+            try:
+                result = future.result()
+            except Exception as e:
+                # The worker itself died (e.g. out of memory), which fails its job and the ones still queued
+                ab_file, dest_dir = futures[future]
+                result = {"ab_file": ab_file, "dest_dir": dest_dir, "error": f"{type(e).__name__}: {e}"}
+            results.append(result)
+            if "error" in result:
+                log_both(f"[✖] [{done}/{len(files)}] {result['ab_file']}: {result['error']}")
+                continue
+            write_batch_manifest(result)
+            log_both(f"[✔] [{done}/{len(files)}] {result['ab_file']} -> {result['dest_dir']} "
+                     f"({len(result['extracted'])} files, {format_rate(result['bytes_in'], result['seconds'])})")
+            if "warning" in result:
+                log_both(f"[!] [{done}/{len(files)}] {result['ab_file']}: {result['warning']}")
+    elapsed = time.monotonic() - start
+
+    succeeded = [r for r in results if "error" not in r]
+    bytes_in = sum(r["bytes_in"] for r in succeeded)
+    bytes_out = sum(r["bytes_out"] for r in succeeded)
+    busy = sum(r["seconds"] for r in succeeded)
+    log_both("=" * 50)
+    log_both(f"[i] Batch finished: {len(succeeded)}/{len(files)} backups extracted in {elapsed:.1f}s")
+    log_both(f"[i] Throughput: read {format_rate(bytes_in, elapsed)}, inflated {format_rate(bytes_out, elapsed)}, "
+             f"{len(succeeded) / elapsed:.1f} backups/s, workers busy {busy / (elapsed * jobs):.0%}")
+    log_both("=" * 50)
+    if len(succeeded) != len(files):
+        sys.exit(1)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="WhatsApp Key & Database Extractor")
+    parser.add_argument("--serial", help="serial of the device to use when several are connected")
+    parser.add_argument("--fleet", action="store_true", help="run on every connected device in parallel")
+    parser.add_argument("--reset-adb", action="store_true", help="restart the adb server before and stop it after the run")
+    parser.add_argument("--decode-workers", type=int, help="max concurrent decodes in fleet mode")
+    parser.add_argument("--resume", action="store_true", help="skip the steps the last run completed (see checkpoint.json)")
+    parser.add_argument("--verify", nargs="?", const=DATA_DIR, metavar="DIR",
+                        help="check the files in DIR (default: DATA_DIR) against its manifest.json and exit")
+    parser.add_argument("--batch", metavar="SRC", help="offline: decode and extract every .ab in a directory or glob")
+    parser.add_argument("--out", help="batch output directory (default: DATA_DIR/batch)")
+    parser.add_argument("--passwords", metavar="FILE",
+                        help='batch password map, JSON of {"name.ab": "password", "*": "default"}')
+    parser.add_argument("--jobs", type=int, help="batch worker processes (default: one per CPU core)")
+    return parser.parse_args()
 
 
 if __name__ == "__main__":
-    main()
+    args = parse_args()
+    if args.reset_adb:
+        ADB_RESET_SERVER = True
+    if args.decode_workers:
+        FLEET_DECODE_WORKERS = args.decode_workers
+    if args.verify:
+        verify_manifest(args.verify)
+    elif args.batch:
+        batch_main(args.batch, args.out or os.path.join(DATA_DIR, "batch"), args.passwords, args.jobs)
+    elif args.fleet:
+        fleet_main(args.resume)
+    else:
+        ADB_SERIAL = args.serial
+        main(args.resume)
@@ -1,9 +1,46 @@
 # Paths to required tools and files
 ADB_PATH = r"D:\Projects\whatsapp-key-database-extractor\requirements\adb.exe"
 ABE_JAR_PATH = r"D:\Projects\whatsapp-key-database-extractor\requirements\abe.jar"
-TAR_PATH = r"D:\Projects\whatsapp-key-database-extractor\requirements\tar.exe"
 LEGACY_WHATSAPP_APK = r"D:\Projects\whatsapp-key-database-extractor\requirements\whatsapp-messenger-2-11-431.apk"
 
 # Paths to data and logs directories
 DATA_DIR = r"D:\Projects\whatsapp-key-database-extractor\data"
 LOGS_DIR = r"D:\Projects\whatsapp-key-database-extractor\logs"
+
+# Backend used to decode whatsapp.ab: "native" (in-process Python reader) or "abe" (java -jar abe.jar)
+AB_BACKEND = "native"
+# Decode whatsapp.ab while adb is still writing it (native backend only)
+AB_FOLLOW = True
+
+# Files to extract from the backup, as glob patterns relative to apps/com.whatsapp/ (e.g. "db/*", or "sp/*" for shared_prefs)
+EXTRACT_PATTERNS = [
+    "f/key",
+    "db/msgstore.db*",
+    "db/wa.db*",
+    "db/axolotl.db*",
+    "db/chatsettings.db*",
+]
+
+# How shell/pull/push talk to the device: "binary" (spawn adb) or "native" (adb protocol over localhost:5037)
+ADB_CLIENT = "binary"
+
+# Restart the adb server before each run and stop it afterwards (otherwise a running server is reused)
+ADB_RESET_SERVER = False
+
+# Run log format in LOGS_DIR: "jsonl" (one JSON record per line) or "text" (plain lines as printed)
+LOG_FORMAT = "jsonl"
+
+# Backup password: None asks interactively, "" means the backup has no password
+BACKUP_PASSWORD = None
+
+# Fleet mode (--fleet): max devices decoding at the same time, None = one per CPU core
+FLEET_DECODE_WORKERS = None
+
+# versionName of LEGACY_WHATSAPP_APK; the install is skipped when the device already runs it
+LEGACY_WHATSAPP_VERSION = "2.11.431"
+
+# Pulled WhatsApp APKs, stored once per version and SHA-256 and shared by all devices and runs (None = DATA_DIR/apk-store)
+APK_STORE_DIR = None
+
+# After extraction, copy msgstore.db (+ WAL) into an indexed, read-only msgstore.viewer.db that ui/app.py opens by default
+BUILD_VIEWER_DB = True